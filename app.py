@@ -1,9 +1,11 @@
 import streamlit as st
-from langchain_agent import agent_executor
 from PIL import Image
+import functools
 import os
 import time
+import uuid
 from dotenv import load_dotenv
+from tools import result_store, canonical_questions, warmup, tracing, jobs, export
 
 load_dotenv()
 
@@ -107,6 +109,14 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# Precompute popular answers, charts and the glossary index in the background (idempotent across reruns)
+warmup.start()
+
+# Scope query results to this browser session so charts never pick up another user's tables
+if 'session_id' not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+result_store.set_session(st.session_state.session_id)
+
 # Simplified sidebar
 with st.sidebar:
     st.markdown("### 💳 Fintech GPT")
@@ -115,18 +125,22 @@ with st.sidebar:
     st.markdown("---")
 
     st.markdown("**Quick Examples:**")
-    examples = [
-        "Churn analysis",
-        "Revenue trends",
-        "Feature usage",
-        "Customer segments"
-    ]
-
-    for example in examples:
+    for example in canonical_questions.SIDEBAR_EXAMPLES:
         if st.button(example, key=f"sidebar_{example}", use_container_width=True):
             st.session_state.sidebar_query = example
             st.rerun()
 
+    # Per-stage latency from recent traces; enable with ?debug=1 or DEBUG_PANEL=1
+    if os.getenv("DEBUG_PANEL") == "1" or st.query_params.get("debug") == "1":
+        st.markdown("---")
+        with st.expander("⏱️ Latency (debug)", expanded=False):
+            summary = tracing.latency_summary()
+            if summary:
+                st.dataframe(summary, use_container_width=True, hide_index=True)
+            else:
+                st.caption("No traces recorded yet.")
+            st.caption("Jobs: " + ", ".join(f"{k} {v}" for k, v in jobs.job_queue.stats().items()))
+
 # Minimal header
 st.markdown("# 💳 Fintech GPT")
 st.markdown("*Ask questions about your business data*")
@@ -134,20 +148,95 @@ st.markdown("---")
 
 # Example queries
 with st.expander("💡 Example Questions", expanded=False):
-    examples = [
-        "What's driving our churn rate?",
-        "Show me revenue trends",
-        "Which features are popular?",
-        "Compare customer segments"
-    ]
-
     cols = st.columns(2)
-    for i, query in enumerate(examples):
+    for i, query in enumerate(canonical_questions.EXAMPLE_QUESTIONS):
         with cols[i % 2]:
             if st.button(query, key=f"ex_{i}", use_container_width=True):
                 st.session_state.selected_query = query
                 st.rerun()
 
+def make_progress_renderer(container):
+    """Render streamed agent events (tokens, tool calls, partial tables) into a container.
+
+    Call ``flush()`` on the returned handler to draw any tokens held back by the throttle.
+    """
+    tokens = []
+    state = {"box": container.empty(), "last_render": 0.0}
+
+    def flush():
+        if tokens:
+            state["box"].markdown(f"*{''.join(tokens)[-1200:]}*")
+
+    def on_event(event, payload):
+        if event == "token":
+            tokens.append(payload)
+            # Re-rendering markdown per token is expensive; refresh at most ~20 times a second
+            now = time.time()
+            if now - state["last_render"] > 0.05:
+                flush()
+                state["last_render"] = now
+        elif event == "tool_start":
+            tokens.clear()
+            state["box"].empty()
+            container.markdown(f"🔧 **{payload['tool']}** — `{payload['input'][:120]}`")
+        elif event == "tool_end":
+            if payload["tool"] == "Query DataFrame":
+                container.markdown(payload["output"])
+            elif payload["tool"] == "Generate Visualization" and payload["output"].endswith(".png") \
+                    and os.path.exists(payload["output"]):
+                container.image(Image.open(payload["output"]), use_container_width=True)
+            state["box"] = container.empty()
+        elif event == "tool_error":
+            container.markdown(f"⚠️ **{payload['tool']}** failed: {payload['error']}")
+        elif event == "budget" and payload.get("tokens_saved"):
+            container.caption(f"Context compaction saved {payload['tokens_saved']:,} prompt tokens")
+
+    on_event.flush = flush
+    return on_event
+
+JOB_LABELS = {"queued": "Waiting for a free worker..⏳", "running": "Analyzing..💭💭"}
+
+@st.fragment(run_every=0.5)
+def job_panel():
+    """Poll the session's background job, replaying its progress, until it finishes.
+
+    Only this fragment reruns while polling; the agent itself runs on the job
+    queue, so widget interactions never wait on it.
+    """
+    job = jobs.job_queue.get(st.session_state.get("active_job"))
+    if job is None:
+        st.session_state.pop("active_job", None)
+        return
+
+    with st.status(JOB_LABELS.get(job.status, "Analyzing..💭💭"), expanded=True) as status:
+        render = make_progress_renderer(status)
+        events, _ = job.events_since(0)
+        for event, payload in events:
+            render(event, payload)
+        render.flush()
+
+    if not job.done:
+        if st.button("✖ Cancel", key=f"cancel_{job.id}"):
+            jobs.job_queue.cancel(job.id)
+        return
+
+    del st.session_state.active_job
+    if job.status == "done":
+        # Keep the chart's bytes with the answer: the job's file is removed when the job expires
+        chart = None
+        if job.chart and os.path.exists(job.chart):
+            with open(job.chart, "rb") as f:
+                chart = f.read()
+        st.session_state.conversation_history += [
+            {"role": "user", "content": job.query, "timestamp": job.created_at},
+            {"role": "assistant", "content": job.result, "timestamp": job.finished_at, "chart": chart},
+        ]
+    elif job.status == "failed":
+        st.session_state.job_notice = ("error", f"Error: {job.error}")
+    else:
+        st.session_state.job_notice = ("info", "Analysis cancelled.")
+    st.rerun()
+
 # Query input
 default_query = ""
 
@@ -168,49 +257,30 @@ query = st.text_input(
 
 analyze_button = st.button("🚀 Analyze", type="primary", use_container_width=True)
 
-# Process query when button is clicked or when there's a default query
+if 'conversation_history' not in st.session_state:
+    st.session_state.conversation_history = []
+
+# Submit the question as a background job when the button is clicked or when there's a default query
 if analyze_button or default_query:
     current_query = query if query else default_query
 
     if current_query:
-        with st.spinner("Analyzing..💭💭"):
-            try:
-                output = agent_executor.run(current_query)
-
-                # Initialize conversation history if needed
-                if 'conversation_history' not in st.session_state:
-                    st.session_state.conversation_history = []
-
-                # Add to conversation history
-                st.session_state.conversation_history.append({
-                    "role": "user",
-                    "content": current_query,
-                    "timestamp": time.time()
-                })
-
-                st.session_state.conversation_history.append({
-                    "role": "assistant",
-                    "content": output,
-                    "timestamp": time.time()
-                })
-
-                # Clear the selected query from session state to prevent reprocessing
-                if 'selected_query' in st.session_state:
-                    del st.session_state.selected_query
-                if 'sidebar_query' in st.session_state:
-                    del st.session_state.sidebar_query
-
-                st.success("Analysis complete!")
-
-            except Exception as e:
-                st.error(f"Error: {str(e)}")
+        try:
+            job = jobs.job_queue.submit(st.session_state.session_id, current_query)
+            st.session_state.active_job = job.id
+        except (jobs.QueueFull, jobs.UserLimitExceeded) as e:
+            st.warning(str(e))
     elif analyze_button:
         st.warning("Please enter a question first.")
 
-# Display conversation history
-if 'conversation_history' not in st.session_state:
-    st.session_state.conversation_history = []
+if 'active_job' in st.session_state:
+    job_panel()
 
+if 'job_notice' in st.session_state:
+    kind, message = st.session_state.pop('job_notice')
+    getattr(st, kind)(message)
+
+# Display conversation history
 if st.session_state.conversation_history:
     st.markdown("---")
     st.markdown("### Conversation")
@@ -229,15 +299,52 @@ if st.session_state.conversation_history:
             )
             st.markdown(message["content"])
 
-            # Show chart if exists
-            if os.path.exists("chart.png"):
-                st.image(Image.open("chart.png"), use_container_width=True)
+            # Show the chart this answer produced, if any
+            if message.get("chart"):
+                st.image(message["chart"], use_container_width=True)
+
+            # The table behind the latest answer is small, so it is encoded in memory
+            latest = export.result_bytes(session_id=st.session_state.session_id)
+            if latest is not None:
+                st.download_button("⬇️ Download result (CSV)", latest, file_name="result.csv", mime="text/csv")
 
             st.markdown('</div>', unsafe_allow_html=True)
 
     if st.button("🗑️ Clear", help="Clear conversation"):
+        from langchain_agent import reset_session  # loaded lazily: the agent stack is slow to import
         st.session_state.conversation_history = []
-        if os.path.exists("chart.png"):
-            os.remove("chart.png")
+        reset_session(st.session_state.session_id)
         st.rerun()
 
+# Customer-level exports can be millions of rows, so they stream from the export server
+with st.expander("⬇️ Export customers", expanded=False):
+    filter_text = st.text_input("Filter", placeholder="churned Premium customers with spend over 1000",
+                                key="export_filter")
+    export_format = st.selectbox("Format", ["csv", "parquet"], key="export_format")
+    conditions = export.parse_filters(filter_text)
+    if filter_text and not conditions:
+        st.caption("No filters recognized; the export will include every customer.")
+    elif filter_text:
+        st.caption(f"{export.count_rows(conditions):,} matching rows")
+    if st.button("Prepare export", key="export_prepare"):
+        st.session_state.pop('export_url', None)
+        st.session_state.pop('export_inline', None)
+        if export.BASE_URL:
+            # Streamed by the export server, which EXPORT_BASE_URL says the browser can reach
+            try:
+                st.session_state.export_url = export.register(conditions, export_format)
+            except OSError as e:
+                st.error(f"Export server unavailable on port {export.PORT}: {e}")
+        elif (matching := export.count_rows(conditions)) > export.MAX_INLINE_ROWS:
+            st.error(f"{matching:,} rows is more than the app can download directly ({export.MAX_INLINE_ROWS:,}). "
+                     "Narrow the filter, or set EXPORT_BASE_URL to stream large exports from the export server.")
+        else:
+            st.session_state.export_inline = (conditions, export_format)
+    if 'export_url' in st.session_state:
+        st.link_button("Download", st.session_state.export_url)
+    elif 'export_inline' in st.session_state:
+        # Built only when clicked; the file is assembled in memory, hence the row cap above
+        inline_conditions, inline_format = st.session_state.export_inline
+        st.download_button("Download", functools.partial(export.export_bytes, inline_conditions, inline_format),
+                           file_name=f"customers.{inline_format}", mime=export.CONTENT_TYPES[inline_format],
+                           key="export_download", on_click="ignore")
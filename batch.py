@@ -0,0 +1,146 @@
+"""Headless batch mode: answer a JSONL file of questions without the Streamlit UI.
+
+    python batch.py questions.jsonl --out answers.jsonl --workers 8
+
+Each input line is a JSON object with a ``question`` (or ``query``/``title``)
+and an optional ``id`` (or ``request_id``), or just a JSON string. Every
+question goes through the same path as the UI: canonical fast path, the
+agent, and all the LLM, chart and glossary caches.
+
+One output line per question is written as soon as that question finishes
+(completion order, not input order). It holds the answer, the chart it
+produced, timing, and ``duplicate_of`` when an identical question (after
+normalization) was already answered in this run. Input is read only as fast
+as workers free up, and results are not accumulated, so memory stays flat
+for inputs of any length.
+"""
+import argparse
+import asyncio
+import contextlib
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter, OrderedDict
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+from langchain_agent import arun_agent, reset_session
+from tools import async_runtime, generate_chart, llm_cache, llm_gateway, result_store
+
+DEDUP_CACHE_SIZE = 5000
+
+
+def read_questions(path):
+    """Yield ``(id, question)`` pairs from a JSONL file, one line at a time."""
+    with (sys.stdin if path == "-" else open(path)) as f:
+        for line_number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            item = json.loads(line)
+            if isinstance(item, str):
+                yield str(line_number), item
+                continue
+            question = item.get("question") or item.get("query") or item.get("title")
+            if question:
+                yield str(item.get("id") or item.get("request_id") or line_number), question
+
+
+async def answer_question(question_id, question, charts_dir):
+    """Run one question in its own throwaway session, writing any chart to ``charts_dir``."""
+    session_id = f"batch-{question_id}"
+    chart = os.path.join(charts_dir, re.sub(r"[^\w.-]", "_", question_id) + ".png")
+    if os.path.exists(chart):
+        os.remove(chart)  # a previous run's chart must not pass for this answer's
+    result_store.set_session(session_id)
+    try:
+        with generate_chart.chart_output(chart):
+            answer = await arun_agent(question, session_id=session_id)
+    finally:
+        reset_session(session_id)
+    return {"answer": answer, "chart": chart if os.path.exists(chart) else None}
+
+
+async def run_batch(questions, out, workers=4, charts_dir=".cache/batch_charts"):
+    """Answer ``(id, question)`` pairs with ``workers`` in flight, writing JSON lines to ``out``."""
+    os.makedirs(charts_dir, exist_ok=True)
+    slots = asyncio.Semaphore(workers)
+    in_flight = {}  # normalized question -> Future of the first run's record
+    answered = OrderedDict()  # normalized question -> record, bounded
+    tasks = set()
+    stats = Counter()
+
+    async def one(question_id, question):
+        key = llm_cache.normalize_text(question)
+        started = time.perf_counter()
+        try:
+            if key in answered:
+                record, duplicate = answered[key], True
+            elif key in in_flight:
+                record, duplicate = await asyncio.shield(in_flight[key]), True
+            else:
+                duplicate = False
+                future = in_flight[key] = asyncio.get_running_loop().create_future()
+                try:
+                    record = {"id": question_id, "status": "ok",
+                              **await answer_question(question_id, question, charts_dir)}
+                except Exception as e:
+                    record = {"id": question_id, "status": "error", "error": f"{type(e).__name__}: {e}"}
+                future.set_result(record)
+                del in_flight[key]
+                answered[key] = record
+                if len(answered) > DEDUP_CACHE_SIZE:
+                    answered.popitem(last=False)
+
+            line = {"id": question_id, "question": question, "status": record["status"],
+                    "answer": record.get("answer"), "chart": record.get("chart"), "error": record.get("error"),
+                    "duplicate_of": record["id"] if duplicate else None,
+                    "duration_ms": round((time.perf_counter() - started) * 1000, 1)}
+            out.write(json.dumps(line, ensure_ascii=False) + "\n")
+            out.flush()
+            stats["duplicates" if duplicate else record["status"]] += 1
+        finally:
+            slots.release()
+
+    for question_id, question in questions:
+        await slots.acquire()  # backpressure: read the next line only when a worker is free
+        task = asyncio.create_task(one(question_id, question))
+        tasks.add(task)
+        task.add_done_callback(tasks.discard)
+    if tasks:
+        await asyncio.gather(*tasks)
+    return stats
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Answer a JSONL file of questions headlessly.")
+    parser.add_argument("input", help="JSONL file of questions ('-' for stdin)")
+    parser.add_argument("--out", default="-", help="output JSONL file (default: stdout)")
+    parser.add_argument("--workers", type=int, default=4, help="questions answered concurrently")
+    parser.add_argument("--charts-dir", default=".cache/batch_charts")
+    args = parser.parse_args(argv)
+
+    started = time.perf_counter()
+    out = sys.stdout if args.out == "-" else open(args.out, "w")
+    try:
+        # The agent's verbose trace goes to stderr so stdout carries only answer lines
+        with contextlib.redirect_stdout(sys.stderr):
+            stats = async_runtime.run(run_batch(read_questions(args.input), out, args.workers, args.charts_dir))
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    elapsed = time.perf_counter() - started
+    total = sum(stats.values())
+    summary = {"questions": total, **stats, "seconds": round(elapsed, 2),
+               "questions_per_second": round(total / elapsed, 2) if elapsed else None,
+               "llm_gateway": llm_gateway.gateway.stats(), "llm_cache": llm_cache.cache.stats()}
+    print(json.dumps(summary), file=sys.stderr)
+    return 1 if stats["error"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
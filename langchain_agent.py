@@ -1,47 +1,80 @@
 
 from langchain.agents import Tool, initialize_agent
 from langchain.agents.agent_types import AgentType
-from langchain_openai import ChatOpenAI
 from langchain.memory import ConversationBufferWindowMemory
 from langchain.prompts import PromptTemplate
-from tools import query_dataframe, generate_chart, summarize_insight, glossary_lookup, smart_analyzer
+from langchain.callbacks.base import BaseCallbackHandler
+import asyncio
+import os
+import queue
+import threading
+from contextlib import contextmanager, asynccontextmanager
+from tools import query_dataframe, anomaly_detection, generate_chart, summarize_insight, glossary_lookup, smart_analyzer, context_budget, canonical_questions, warmup, llm_gateway, result_store, session_memory, tracing
 
-llm = ChatOpenAI(model="gpt-4o", temperature=0.1)
+# Executors are cheap to hold but not safe to share between concurrent requests
+AGENT_POOL_SIZE = int(os.getenv("AGENT_POOL_SIZE", "8"))
 
 tools = [
     Tool(
         name="Smart Analyzer",
-        func=smart_analyzer.analyze_question,
-        description="Intelligently analyze user questions and determine the best approach for data analysis, visualization, and insights. Use this FIRST for any user question to understand intent and context."
+        func=context_budget.budgeted(smart_analyzer.analyze_question, "Smart Analyzer"),
+        coroutine=context_budget.abudgeted(smart_analyzer.aanalyze_question, "Smart Analyzer"),
+        description="Intelligently analyze user questions and determine the best approach for data analysis, visualization, and insights. Use this FIRST for any user question to understand intent and context. Returns a JSON plan with a confidence score; common questions are planned locally without an LLM call."
     ),
     Tool(
         name="Query DataFrame",
-        func=query_dataframe.query_dataframe,
-        description="Execute data queries on fintech dataset. Supports natural language queries, pandas operations, and statistical analysis."
+        func=context_budget.budgeted(query_dataframe.query_dataframe, "Query DataFrame"),
+        coroutine=context_budget.abudgeted(query_dataframe.aquery_dataframe, "Query DataFrame"),
+        description="Execute data queries on fintech dataset. Supports natural language queries, pandas operations, statistical analysis, churn-risk predictions (e.g. 'which Premium customers are about to churn'), and what-if simulations of tier upgrades, churn changes and spend changes (e.g. 'what if 10% of Free users upgrade to Plus'). Each table is tagged with a result reference like [ref: r3]."
     ),
     Tool(
         name="Generate Visualization",
-        func=generate_chart.smart_visualize,
-        description="Create intelligent visualizations (bar charts, line plots, heatmaps, scatter plots, etc.) based on data type and analysis goals."
+        func=context_budget.budgeted(generate_chart.smart_visualize, "Generate Visualization"),
+        coroutine=context_budget.abudgeted(generate_chart.asmart_visualize, "Generate Visualization"),
+        description="Create intelligent visualizations (bar charts, line plots, heatmaps, scatter plots, etc.) based on data type and analysis goals. To chart a table from Query DataFrame, pass its reference (e.g. 'ref: r3') or 'last result' so the chart matches the table."
     ),
     Tool(
         name="Summarize Insights",
-        func=summarize_insight.generate_insights,
+        func=context_budget.budgeted(summarize_insight.generate_insights, "Summarize Insights"),
+        coroutine=context_budget.abudgeted(summarize_insight.agenerate_insights, "Summarize Insights"),
         description="Generate comprehensive business insights and executive summaries from data analysis."
     ),
     Tool(
         name="Glossary Lookup",
-        func=glossary_lookup.search_term,
-        description="Look up fintech business terms, metrics, and definitions (CLTV, CAC, NRR, etc.)."
+        func=context_budget.budgeted(glossary_lookup.search_term, "Glossary Lookup"),
+        coroutine=context_budget.abudgeted(glossary_lookup.asearch_term, "Glossary Lookup"),
+        description="Look up fintech business terms, metrics, and definitions (CLTV, CAC, NRR, etc.). Pass several terms separated by commas to look them up together."
+    ),
+    Tool(
+        name="Anomaly Detection",
+        func=context_budget.budgeted(anomaly_detection.detect_anomalies, "Anomaly Detection"),
+        coroutine=context_budget.abudgeted(anomaly_detection.adetect_anomalies, "Anomaly Detection"),
+        description="Find unusual decline rates or spending: cohorts (tiers, segments) that stand out and the most extreme customers within their cohort. Use for questions about anomalies, outliers, or unusual patterns in decline_rate or monthly_spend; mention 'tier' or 'segment' for a per-cohort breakdown."
     )
 ]
 
-# Enhanced memory for better context awareness
-memory = ConversationBufferWindowMemory(
-    memory_key="chat_history",
-    return_messages=True,
-    k=10  # Keep last 10 exchanges
-)
+class BudgetedWindowMemory(ConversationBufferWindowMemory):
+    """Window memory that replays older turns as short summaries within a token budget."""
+
+    max_token_limit: int = context_budget.MEMORY_TOKEN_BUDGET
+
+    def load_memory_variables(self, inputs):
+        variables = super().load_memory_variables(inputs)
+        if self.return_messages:
+            variables[self.memory_key] = context_budget.compact_history(variables[self.memory_key],
+                                                                        self.max_token_limit)
+        return variables
+
+def new_memory():
+    # Enhanced memory for better context awareness
+    return BudgetedWindowMemory(
+        memory_key="chat_history",
+        return_messages=True,
+        k=10  # Keep last 10 exchanges
+    )
+
+# One memory per conversation, keyed by the result-store session ID
+session_memories = session_memory.SessionMemoryStore(new_memory)
 
 # System prompt for enhanced reasoning
 system_prompt = """You are an expert fintech data analyst and business intelligence assistant.
@@ -56,23 +89,249 @@ Your capabilities:
 Approach:
 1. ALWAYS start with Smart Analyzer to understand the user's intent
 2. Use context from conversation history to provide relevant insights
-3. Choose appropriate visualizations based on data type and analysis goal
+3. Choose appropriate visualizations based on data type and analysis goal; when charting data you already queried, pass the table's result reference to Generate Visualization instead of describing it again
 4. Provide actionable business insights, not just data summaries
 5. Ask clarifying questions when needed, but also make intelligent assumptions
 6. Consider multiple angles: customer behavior, business impact, trends, and recommendations
 
 Dataset Context: Fintech product data including customer demographics, account tiers, spending patterns, feature usage, and churn data."""
 
-agent_executor = initialize_agent(
-    tools=tools,
-    llm=llm,
-    agent=AgentType.CHAT_CONVERSATIONAL_REACT_DESCRIPTION,
-    memory=memory,
-    verbose=True,
-    agent_kwargs={
-        "system_message": system_prompt,
-        "extra_prompt_messages": [{"type": "system", "content": system_prompt}]
-    },
-    handle_parsing_errors=True,
-    max_iterations=5
-)
+def build_agent_executor():
+    return initialize_agent(
+        tools=tools,
+        llm=llm_gateway.agent_chat_model(streaming=True),
+        agent=AgentType.CHAT_CONVERSATIONAL_REACT_DESCRIPTION,
+        memory=new_memory(),
+        verbose=True,
+        agent_kwargs={
+            "system_message": system_prompt,
+            "extra_prompt_messages": [{"type": "system", "content": system_prompt}]
+        },
+        handle_parsing_errors=True,
+        max_iterations=5
+    )
+
+
+class AgentPool:
+    """Bounded pool of agent executors; each request checks one out and binds its session's memory."""
+
+    def __init__(self, factory, size=AGENT_POOL_SIZE):
+        self.factory = factory
+        self.size = size
+        self._idle = queue.LifoQueue()
+        self._created = 0
+        self._lock = threading.Lock()
+
+    def _try_acquire(self):
+        try:
+            return self._idle.get_nowait()
+        except queue.Empty:
+            with self._lock:
+                if self._created >= self.size:
+                    return None
+                self._created += 1
+            return self.factory()
+
+    def _release(self, executor):
+        executor.memory = None
+        self._idle.put(executor)
+
+    @contextmanager
+    def checkout(self, memory):
+        executor = self._try_acquire()
+        if executor is None:
+            executor = self._idle.get()
+        executor.memory = memory
+        try:
+            yield executor
+        finally:
+            self._release(executor)
+
+    @asynccontextmanager
+    async def acheckout(self, memory):
+        executor = self._try_acquire()
+        while executor is None:
+            await asyncio.sleep(0.05)
+            executor = self._try_acquire()
+        executor.memory = memory
+        try:
+            yield executor
+        finally:
+            self._release(executor)
+
+
+agent_pool = AgentPool(build_agent_executor)
+
+
+class AgentEventStream(BaseCallbackHandler):
+    """Forward agent progress to a sink as it happens.
+
+    The sink is called with ``(event, payload)`` where event is one of
+    ``token``, ``tool_start``, ``tool_end``, ``tool_error``, ``finish`` or
+    ``budget`` (token savings from context compaction, sent after the run).
+    Tool outputs are sent in full, not as the compacted copy the LLM sees.
+    """
+
+    def __init__(self, sink, ledger=None):
+        self.sink = sink
+        self.ledger = ledger
+        self._tool_names = {}
+
+    def on_llm_new_token(self, token, **kwargs):
+        self.sink("token", token)
+
+    def on_tool_start(self, serialized, input_str, run_id=None, **kwargs):
+        name = (serialized or {}).get("name", "tool")
+        self._tool_names[run_id] = name
+        self.sink("tool_start", {"tool": name, "input": input_str})
+
+    def on_tool_end(self, output, run_id=None, **kwargs):
+        name = self._tool_names.pop(run_id, kwargs.get("name", "tool"))
+        self.sink("tool_end", {"tool": name, "output": context_budget.full_observation(str(output), self.ledger)})
+
+    def on_tool_error(self, error, run_id=None, **kwargs):
+        name = self._tool_names.pop(run_id, kwargs.get("name", "tool"))
+        self.sink("tool_error", {"tool": name, "error": str(error)})
+
+    def on_agent_finish(self, finish, **kwargs):
+        self.sink("finish", finish.return_values.get("output", ""))
+
+
+class TracingCallback(BaseCallbackHandler):
+    """Open spans per agent iteration, LLM call and tool call under the current turn span.
+
+    Runs inline so the tool span is current while the tool executes, making
+    the tool's own spans (queries, savefig, index builds) its children.
+    """
+
+    run_inline = True
+
+    def __init__(self):
+        self.iterations = 0
+        self._iteration = None
+        self._spans = {}
+
+    def on_llm_start(self, serialized, prompts, run_id=None, **kwargs):
+        if self._iteration is not None:
+            tracing.end_span(self._iteration)
+        self.iterations += 1
+        self._iteration = tracing.start_span("agent_iteration", iteration=self.iterations)
+        self._spans[run_id] = tracing.start_span(
+            "llm_call", prompt_tokens=sum(context_budget.count_tokens(p) for p in prompts))
+
+    def on_llm_end(self, response, run_id=None, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is None:
+            return
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        text = "".join(g.text for generations in response.generations for g in generations)
+        span.set(prompt_tokens=usage.get("prompt_tokens", span.attrs["prompt_tokens"]),
+                 completion_tokens=usage.get("completion_tokens", context_budget.count_tokens(text)))
+        tracing.end_span(span)
+
+    def on_llm_error(self, error, run_id=None, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            tracing.end_span(span, error=error)
+
+    def on_tool_start(self, serialized, input_str, run_id=None, **kwargs):
+        name = (serialized or {}).get("name", "tool")
+        self._spans[run_id] = tracing.start_span(f"tool:{name}", input=input_str[:200])
+
+    def on_tool_end(self, output, run_id=None, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            span.set(output_tokens=context_budget.count_tokens(str(output)))
+            tracing.end_span(span)
+
+    def on_tool_error(self, error, run_id=None, **kwargs):
+        span = self._spans.pop(run_id, None)
+        if span is not None:
+            tracing.end_span(span, error=error)
+
+    def close(self):
+        for span in list(self._spans.values()):
+            tracing.end_span(span)
+        self._spans.clear()
+        if self._iteration is not None:
+            tracing.end_span(self._iteration)
+            self._iteration = None
+
+
+def _finish_canonical(query, result, memory, on_event=None):
+    """Record a fast-path answer in memory and replay it to the UI as tool events."""
+    output = f"{result['summary']}\n\n{result['table']}" if result["summary"] else result["table"]
+    memory.save_context({"input": query}, {"output": output})
+    if on_event:
+        on_event("tool_end", {"tool": "Query DataFrame", "output": result["table"]})
+        on_event("tool_end", {"tool": "Generate Visualization", "output": result["chart"]})
+        on_event("finish", output)
+    return output
+
+
+def run_agent(query, on_event=None, session_id=None):
+    """Run the agent, streaming tokens and tool progress to ``on_event`` if given.
+
+    Canonical questions (see tools/canonical_questions.py) are answered
+    directly without the ReAct loop. Conversation memory is per session;
+    ``session_id`` defaults to the current result-store session.
+    """
+    session_id = session_id or result_store.get_session()
+    with session_memories.use(session_id) as memory, warmup.live_request(), \
+            tracing.span("agent_turn", session=session_id, query=query[:200]) as turn:
+        canonical = canonical_questions.answer(query)
+        if canonical is not None:
+            turn.set(path="canonical")
+            return _finish_canonical(query, canonical, memory, on_event)
+
+        tracer = TracingCallback()
+        ledger = context_budget.start_request()
+        callbacks = [tracer] + ([AgentEventStream(on_event, ledger)] if on_event else [])
+        try:
+            with agent_pool.checkout(memory) as executor:
+                output = executor.run(query, callbacks=callbacks)
+        finally:
+            tracer.close()
+        report = context_budget.request_report(ledger)
+        turn.set(path="agent", iterations=tracer.iterations, tokens_saved=report["tokens_saved"])
+        if on_event:
+            on_event("budget", report)
+        return output
+
+
+async def arun_agent(query, on_event=None, session_id=None):
+    """Async variant of run_agent for use on the shared event loop (see tools/async_runtime.py)."""
+    session_id = session_id or result_store.get_session()
+    with session_memories.use(session_id) as memory, warmup.live_request(), \
+            tracing.span("agent_turn", session=session_id, query=query[:200]) as turn:
+        canonical = await canonical_questions.aanswer(query)
+        if canonical is not None:
+            turn.set(path="canonical")
+            return _finish_canonical(query, canonical, memory, on_event)
+
+        tracer = TracingCallback()
+        ledger = context_budget.start_request()
+        callbacks = [tracer] + ([AgentEventStream(on_event, ledger)] if on_event else [])
+        try:
+            async with agent_pool.acheckout(memory) as executor:
+                output = await executor.arun(query, callbacks=callbacks)
+        finally:
+            tracer.close()
+        report = context_budget.request_report(ledger)
+        turn.set(path="agent", iterations=tracer.iterations, tokens_saved=report["tokens_saved"])
+        if on_event:
+            on_event("budget", report)
+        return output
+
+
+def reset_session(session_id=None):
+    """Forget a conversation's memory and stored query results."""
+    session_id = session_id or result_store.get_session()
+    session_memories.drop(session_id)
+    result_store.clear(session_id)
+
+
+async def arun_tools(calls):
+    """Run independent ``(tool_name, tool_input)`` calls concurrently; results come back in order."""
+    by_name = {tool.name: tool for tool in tools}
+    return await asyncio.gather(*(by_name[name].arun(tool_input) for name, tool_input in calls))
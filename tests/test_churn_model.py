@@ -0,0 +1,19 @@
+from tools import churn_model, llm_cache, query_dataframe
+
+
+def test_model_is_keyed_on_the_scored_dataset(monkeypatch, tmp_path):
+    full = query_dataframe.ensure_data()
+    paths = [tmp_path / "first.csv", tmp_path / "second.csv"]
+    full.head(3000).to_csv(paths[0], index=False)
+    full.tail(3000).to_csv(paths[1], index=False)
+    monkeypatch.setattr(churn_model, "MODEL_DIR", str(tmp_path / "models"))
+    monkeypatch.setattr(churn_model, "_index", None)
+    monkeypatch.setattr(query_dataframe, "df", full)
+
+    versions = []
+    for path in paths:
+        monkeypatch.setattr(query_dataframe, "DATA_PATH", str(path))
+        query_dataframe.reload_data()
+        versions.append(churn_model.get_index().model.data_version)
+        assert versions[-1] == llm_cache.data_version(str(path))
+    assert versions[0] != versions[1] != llm_cache.data_version()
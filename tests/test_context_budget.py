@@ -0,0 +1,17 @@
+from tools import context_budget
+
+TABLE = "Spend by tier [ref: r1]:\n| tier | spend |\n|:--|--:|\n" + "\n".join(f"| t{i} | {i * 10.5} |" for i in range(200))
+
+
+def test_compacted_observation_keeps_its_full_text_for_display():
+    ledger = context_budget.start_request()
+    observation = context_budget.budgeted(lambda _: TABLE, "Query DataFrame", max_tokens=60)("spend by tier")
+    assert context_budget.count_tokens(observation) < context_budget.count_tokens(TABLE)
+    assert context_budget.full_observation(observation, ledger) == TABLE
+    assert context_budget.request_report(ledger)["observations"]["tokens_saved"] > 0
+
+
+def test_short_observation_is_passed_through():
+    ledger = context_budget.start_request()
+    observation = context_budget.budgeted(lambda _: "12 customers", "Query DataFrame")("count")
+    assert observation == context_budget.full_observation(observation, ledger) == "12 customers"
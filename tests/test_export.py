@@ -0,0 +1,55 @@
+import io
+
+import pandas as pd
+import pytest
+
+from tools.export import export_bytes, parse_filters
+
+
+def test_active_cards_filters_on_card_activation_only():
+    assert parse_filters("active cards") == [("card_activated", "==", True)]
+    assert parse_filters("active card") == [("card_activated", "==", True)]
+
+
+def test_active_cards_keep_card_type():
+    assert parse_filters("active credit cards") == [("card_type", "in", ["Credit"]), ("card_activated", "==", True)]
+
+
+def test_inactive_cards():
+    assert parse_filters("not activated cards") == [("card_activated", "==", False)]
+
+
+def test_active_customers_filter_on_account_status():
+    assert parse_filters("Active customers") == [("account_status", "in", ["Active"])]
+    assert parse_filters("active customers with active cards") == [
+        ("account_status", "in", ["Active"]), ("card_activated", "==", True)]
+
+
+def test_categories_and_thresholds():
+    assert parse_filters("churned Premium customers with spend over 1,000") == [
+        ("account_tier", "in", ["Premium"]), ("churned", "==", True), ("monthly_spend", ">", 1000.0)]
+
+
+@pytest.fixture
+def frame():
+    rows = 6000
+    return pd.DataFrame({"customer_id": range(rows), "account_tier": ["Free", "Premium"] * (rows // 2),
+                         "note": [None] * (rows - 1) + ["vip"]})
+
+
+def test_zero_match_parquet_is_a_valid_empty_file(frame):
+    pq = pytest.importorskip("pyarrow.parquet")
+    table = pq.read_table(io.BytesIO(export_bytes([("account_tier", "in", ["Plus"])], "parquet", frame=frame)))
+    assert table.num_rows == 0
+    assert table.column_names == list(frame.columns)
+
+
+def test_zero_match_csv_keeps_its_header(frame):
+    assert export_bytes([("account_tier", "in", ["Plus"])], "csv", frame=frame) == b"customer_id,account_tier,note\n"
+
+
+def test_parquet_schema_survives_an_all_null_first_chunk(frame):
+    pq = pytest.importorskip("pyarrow.parquet")
+    table = pq.read_table(io.BytesIO(export_bytes([], "parquet", frame=frame)))
+    assert table.num_rows == len(frame)
+    assert table.column("note").to_pylist()[-1] == "vip"
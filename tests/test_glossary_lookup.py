@@ -0,0 +1,32 @@
+import pytest
+
+from tools import glossary_lookup, llm_replay
+
+
+@pytest.fixture
+def fake_vectors(monkeypatch, tmp_path):
+    monkeypatch.setattr(llm_replay, "MODE", "fake")
+    monkeypatch.setattr(glossary_lookup, "INDEX_DIR", str(tmp_path))
+    monkeypatch.setattr(glossary_lookup, "_embedding_model", None)
+    monkeypatch.setattr(glossary_lookup, "_index", None)
+
+
+@pytest.fixture
+def no_vectors(monkeypatch):
+    def unavailable():
+        raise AssertionError("the vector tier was used")
+    monkeypatch.setattr(glossary_lookup, "get_embedding_model", unavailable)
+
+
+@pytest.mark.parametrize("query, term", [("CLTV", "cltv"), ("declne rate", "decline_rate"),
+                                         ("kyc pending users", "kyc_pending_users"),
+                                         ("monthly spend per transaction", "avg_spend_per_txn")])
+def test_keyword_queries_stay_lexical(no_vectors, query, term):
+    assert glossary_lookup.search(query)[0]["term"] == term
+
+
+@pytest.mark.parametrize("query", ["how happy are our users", "how much money does a user bring over time"])
+def test_semantic_queries_fall_through_to_vector_search(fake_vectors, query):
+    # A strong BM25 score on one or two incidental words ("users", "over time") is not a keyword match
+    hits = glossary_lookup.search(query, k=5)
+    assert any(hit["method"] == "vector" for hit in hits)
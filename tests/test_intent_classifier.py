@@ -0,0 +1,19 @@
+import pytest
+
+from tools import intent_classifier
+
+
+@pytest.mark.parametrize("question", ["Who is about to churn?", "Which Premium users are at risk?",
+                                      "Show at-risk customers by tier"])
+def test_churn_risk_questions_plan_the_at_risk_lookup(question):
+    plan = intent_classifier.classify(question)
+    assert plan["intent"] == "churn_risk"
+    assert all("likely to churn" in query for query in plan["suggested_queries"])
+
+
+def test_revenue_at_risk_is_not_a_churn_risk_lookup():
+    assert intent_classifier.classify("How much revenue is at risk next quarter?")["intent"] == "prediction"
+
+
+def test_confident_plans_match_the_labels():
+    assert intent_classifier.evaluate()["accuracy_when_local"] == 1.0
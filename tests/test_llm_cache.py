@@ -0,0 +1,92 @@
+import pytest
+
+from tools import canonical_questions, generate_chart, llm_cache, summarize_insight
+
+
+@pytest.fixture
+def cache():
+    return llm_cache.LLMCache(path=":memory:", embeddings=llm_cache.HashingEmbeddings(), threshold=0.9)
+
+
+def test_normalize_keeps_comparisons_but_not_bare_exclamations():
+    assert llm_cache.normalize_text("Churn analysis!") == llm_cache.normalize_text("churn analysis")
+    assert llm_cache.normalize_text("spend != 100") == "spend != 100"
+    assert llm_cache.normalize_text("spend > 100") != llm_cache.normalize_text("spend < 100")
+
+
+def test_exact_hit_after_normalization(cache):
+    cache.put("analyzer", "What is the churn rate?", "m", "answer", version="v1")
+    assert cache.get("analyzer", "what is the churn rate", "m", version="v1") == "answer"
+    assert cache.metrics["exact_hits"] == 1
+
+
+def test_semantic_hit_for_similar_question(cache):
+    cache.put("analyzer", "show churn rate by account tier", "m", "answer", version="v1")
+    assert cache.get("analyzer", "show the churn rate by account tier", "m", version="v1") == "answer"
+    assert cache.metrics["semantic_hits"] == 1
+    assert cache.get("analyzer", "average monthly spend by segment", "m", version="v1") is None
+
+
+def test_exact_entries_ignore_references_but_not_numbers(cache):
+    cache.put("insight", "Churn by tier [ref: r1]:\n| Free | 0.15 |", "m", "insight", version="v1", exact=True)
+    assert cache.get("insight", "Churn by tier [ref: r7]:\n| Free | 0.15 |", "m", version="v1", exact=True) == "insight"
+    assert cache.get("insight", "Churn by tier [ref: r7]:\n| Free | 0.16 |", "m", version="v1", exact=True) is None
+    # Exact entries are never served to a semantic lookup
+    assert cache.get("insight", "Churn by tier:\n| Free | 0.16 |", "m", version="v1") is None
+
+
+def test_data_version_partitions_entries(cache, tmp_path):
+    data = tmp_path / "data.csv"
+    data.write_text("a\n1\n")
+    before = llm_cache.data_version(str(data))
+    cache.put("analyzer", "churn rate", "m", "old", version=before)
+    data.write_text("a\n1\n2\n")
+    after = llm_cache.data_version(str(data))
+    assert after != before
+    assert cache.get("analyzer", "churn rate", "m", version=after) is None
+    assert cache.get("analyzer", "churn rate", "m", version=before) == "old"
+
+
+def test_ttl_expiry(cache, monkeypatch):
+    cache.ttl_seconds = 60
+    cache.put("analyzer", "churn rate", "m", "answer", version="v1")
+    now = llm_cache.time.time()
+    monkeypatch.setattr(llm_cache.time, "time", lambda: now + 61)
+    assert cache.get("analyzer", "churn rate", "m", version="v1") is None
+
+
+def test_size_eviction_drops_least_recently_used(cache, monkeypatch):
+    cache.max_entries = 2
+    clock = iter(range(1000, 2000))
+    monkeypatch.setattr(llm_cache.time, "time", lambda: next(clock))
+    cache.put("analyzer", "first", "m", "1", version="v1")
+    cache.put("analyzer", "second", "m", "2", version="v1")
+    assert cache.get("analyzer", "first", "m", version="v1", threshold=2) == "1"
+    cache.put("analyzer", "third", "m", "3", version="v1")
+    assert cache.stats()["entries"] == 2
+    assert cache.get("analyzer", "second", "m", version="v1", threshold=2) is None
+    assert cache.get("analyzer", "first", "m", version="v1", threshold=2) == "1"
+
+
+class CountingLLM:
+    model_name = "counting"
+
+    def __init__(self):
+        self.calls = 0
+
+    def predict(self, prompt):
+        self.calls += 1
+        return "insight"
+
+
+def test_repeated_canonical_question_reuses_its_summary(cache, monkeypatch, tmp_path):
+    llm = CountingLLM()
+    monkeypatch.setattr(llm_cache, "cache", cache)
+    monkeypatch.setattr(summarize_insight, "llm", llm)
+    monkeypatch.setattr(canonical_questions, "SUMMARIZE", True)
+    with generate_chart.chart_output(str(tmp_path / "chart.png")):
+        first = canonical_questions.answer("What's the churn rate by tier?")
+        second = canonical_questions.answer("What's the churn rate by tier?")
+    assert first["table"] != second["table"]  # fresh result references
+    assert first["summary"] == second["summary"] == "insight"
+    assert llm.calls == 1
@@ -0,0 +1,102 @@
+import threading
+
+import pytest
+from langchain.schema import HumanMessage
+
+from tools import llm_gateway, llm_replay
+
+
+class NetworkBackend(llm_gateway.LocalBackend):
+    """Local responses, but treated like a network backend (rate limited and retried)."""
+
+    networked = True
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    calls = []
+    monkeypatch.setattr(llm_gateway.time, "sleep", calls.append)
+    return calls
+
+
+def test_concurrent_identical_prompts_are_coalesced():
+    started, release = threading.Event(), threading.Event()
+
+    def responder(prompt):
+        started.set()
+        release.wait(5)
+        return "answer"
+
+    gateway = llm_gateway.LLMGateway(llm_gateway.LocalBackend(responder))
+    results = []
+    first = threading.Thread(target=lambda: results.append(gateway.predict("same prompt")))
+    first.start()
+    started.wait(5)
+    second = threading.Thread(target=lambda: results.append(gateway.predict("same prompt")))
+    second.start()
+    for _ in range(500):
+        if gateway.metrics["coalesced"]:
+            break
+        release.wait(0.01)
+    release.set()
+    first.join()
+    second.join()
+    assert results == ["answer", "answer"]
+    assert gateway.backend.calls == 1
+    assert gateway.stats()["requests"] == 2 and gateway.stats()["api_calls"] == 1
+
+
+def test_predict_many_calls_each_distinct_prompt_once():
+    gateway = llm_gateway.LLMGateway(llm_gateway.LocalBackend(str.upper))
+    assert gateway.predict_many(["a", "b", "a"]) == ["A", "B", "A"]
+    assert gateway.backend.calls == 2
+
+
+def test_transient_errors_are_retried_with_backoff(sleeps):
+    failures = iter([TimeoutError("slow"), ConnectionError("reset")])
+
+    def responder(prompt):
+        error = next(failures, None)
+        if error:
+            raise error
+        return "ok"
+
+    gateway = llm_gateway.LLMGateway(NetworkBackend(responder), requests_per_minute=0, max_retries=3)
+    assert gateway.predict("prompt") == "ok"
+    assert gateway.metrics["retries"] == 2 and gateway.metrics["api_calls"] == 3
+    assert 0.5 <= sleeps[0] < 0.75 and 1.0 <= sleeps[1] < 1.25
+
+
+def test_non_transient_errors_are_not_retried(sleeps):
+    def responder(prompt):
+        raise ValueError("bad request")
+
+    gateway = llm_gateway.LLMGateway(NetworkBackend(responder), requests_per_minute=0)
+    with pytest.raises(ValueError):
+        gateway.predict("prompt")
+    assert gateway.metrics["retries"] == 0 and not sleeps
+
+
+def test_rate_limiter_spaces_requests_and_records_the_wait(sleeps):
+    gateway = llm_gateway.LLMGateway(NetworkBackend(), requests_per_minute=600)
+    for i in range(3):
+        gateway.predict(f"prompt {i}")
+    assert sleeps == pytest.approx([0.1, 0.2], abs=0.02)
+    assert gateway.metrics["rate_limit_wait_s"] == pytest.approx(0.3, abs=0.03)
+
+
+def test_local_backend_skips_the_limiter(sleeps):
+    gateway = llm_gateway.LLMGateway(llm_gateway.LocalBackend(), requests_per_minute=60)
+    for i in range(3):
+        gateway.predict(f"prompt {i}")
+    assert not sleeps and gateway.metrics["rate_limit_wait_s"] == 0
+
+
+def test_fake_agent_model_skips_the_limiter(monkeypatch, sleeps):
+    monkeypatch.setattr(llm_replay, "MODE", "fake")
+    gateway = llm_gateway.LLMGateway(llm_gateway.LocalBackend(), requests_per_minute=60)
+    model = llm_gateway.GatewayChatModel(inner=llm_replay.FakeChatModel(model_name="gpt-4o"), gateway=gateway,
+                                         networked=llm_gateway.networked())
+    for i in range(3):
+        model.invoke([HumanMessage(content=f"What is KYC? {i}")])
+    assert not sleeps and gateway.metrics["api_calls"] == 3
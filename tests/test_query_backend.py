@@ -0,0 +1,21 @@
+import pytest
+
+from tools import query_backend, query_dataframe
+
+pytest.importorskip("polars")
+
+
+@pytest.fixture(scope="module")
+def frame():
+    return query_dataframe.ensure_data()
+
+
+@pytest.mark.parametrize("case", list(query_backend.CASES))
+def test_backends_agree(frame, case):
+    method, *args = query_backend.CASES[case]
+    expected, actual = (getattr(query_backend.BACKENDS[name](frame), method)(*args) for name in ("pandas", "polars"))
+    query_backend._same(expected, actual)
+
+
+def test_handlers_and_charts_agree():
+    assert query_backend.handler_parity() == []
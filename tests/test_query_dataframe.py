@@ -0,0 +1,16 @@
+import pytest
+
+from tools import query_dataframe
+
+
+@pytest.mark.parametrize("question", ["Which Premium users are at risk?", "show at-risk customers by tier",
+                                      "who is at risk of churning", "churn risk by tier"])
+def test_customers_at_risk_use_the_risk_index(question):
+    answer = query_dataframe.query_dataframe(question)
+    assert "Most Likely to Churn" in answer or "Churn Risk by Account Tier" in answer
+
+
+@pytest.mark.parametrize("question", ["How much revenue is at risk next quarter?", "revenue at risk by tier"])
+def test_revenue_at_risk_is_a_revenue_question(question):
+    answer = query_dataframe.query_dataframe(question)
+    assert "Revenue" in answer and "Likely to Churn" not in answer
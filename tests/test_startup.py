@@ -0,0 +1,15 @@
+import os
+
+from tools import startup_profile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def test_app_startup_imports_within_budget():
+    ok, problems, _ = startup_profile.check(os.path.join(ROOT, "app.py"))
+    assert ok, problems
+
+
+def test_chart_module_loads_plotting_libraries_lazily():
+    result = startup_profile.profile(["from tools import generate_chart"], cwd=ROOT)
+    assert not {"matplotlib", "seaborn"} & set(result["heavy_loaded"])
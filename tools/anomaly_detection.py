@@ -0,0 +1,270 @@
+"""Anomaly detection on decline_rate and monthly_spend from online statistics.
+
+Rows are ingested in batches (the loaded dataset on first use, then only the
+rows appended by a data refresh). Each batch updates, per cohort (overall,
+per tier, per segment and per tier x segment):
+
+- running count/mean/variance, merged batch-by-batch with the parallel form
+  of Welford's algorithm, so no full-frame pass is ever repeated;
+- a fixed-bin histogram that serves streaming quantiles (p50/p95/p99);
+- per tier x segment cohort, the customers with the highest and lowest
+  values seen so far (a bounded list, not the rows themselves).
+
+Customer z-scores are computed from those lists against each cohort's
+current mean and std when a question is asked, not at ingest, so later
+batches that shift a cohort are reflected. Within a cohort the z-score is
+monotone in the value, so its most extreme customers are always among the
+kept highest and lowest values.
+
+Questions such as "any unusual decline patterns?" are answered from that
+state alone, so the cost does not grow with the number of customers. The
+tables are published to the session's result store like Query DataFrame's.
+"""
+import math
+import os
+import threading
+
+import numpy as np
+import pandas as pd
+
+from tools import async_runtime, query_dataframe, result_store, tracing
+
+Z_THRESHOLD = float(os.getenv("ANOMALY_Z_THRESHOLD", "3"))
+COHORT_THRESHOLD = float(os.getenv("ANOMALY_COHORT_THRESHOLD", "0.2"))  # cohort mean shift, in overall std devs
+MIN_COHORT_SIZE = 30
+TOP_CUSTOMERS = 20
+
+# Histogram bins per metric: decline rate is a share; spend is binned on a log scale
+METRICS = {
+    "decline_rate": np.linspace(0.0, 1.0, 1001),
+    "monthly_spend": np.concatenate([[0.0], np.geomspace(0.01, 1e6, 2000)]),
+}
+COHORTS = [(), ("account_tier",), ("customer_segment",), ("account_tier", "customer_segment")]
+CUSTOMER_COHORT = ("account_tier", "customer_segment")
+
+
+class RunningStats:
+    """Count, mean and sum of squared deviations, updated a batch at a time."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self.m2 = 0.0
+
+    def merge(self, count, mean, m2):
+        """Fold in a batch's ``(count, mean, M2)`` (Chan et al.'s parallel Welford update)."""
+        if count == 0:
+            return
+        total = self.count + count
+        delta = mean - self.mean
+        self.mean += delta * count / total
+        self.m2 += m2 + delta * delta * self.count * count / total
+        self.count = total
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        if len(values):
+            self.merge(len(values), values.mean(), ((values - values.mean()) ** 2).sum())
+
+    @property
+    def std(self):
+        return math.sqrt(self.m2 / (self.count - 1)) if self.count > 1 else 0.0
+
+
+class QuantileSketch:
+    """Fixed-bin histogram; quantiles are interpolated within the bin they fall in."""
+
+    def __init__(self, edges):
+        self.edges = edges
+        self.counts = np.zeros(len(edges) + 1, dtype=np.int64)  # plus under/overflow bins
+
+    def update(self, values):
+        values = np.asarray(values, dtype=float)
+        values = values[~np.isnan(values)]
+        self.counts += np.bincount(np.searchsorted(self.edges, values, side="right"),
+                                   minlength=len(self.counts))
+
+    def quantile(self, q):
+        total = self.counts.sum()
+        if total == 0:
+            return float("nan")
+        cumulative = np.cumsum(self.counts)
+        b = int(np.searchsorted(cumulative, q * total, side="left"))
+        if b == 0:
+            return float(self.edges[0])
+        if b >= len(self.edges):
+            return float(self.edges[-1])
+        before = cumulative[b - 1]
+        fraction = (q * total - before) / self.counts[b] if self.counts[b] else 0.0
+        return float(self.edges[b - 1] + fraction * (self.edges[b] - self.edges[b - 1]))
+
+
+class CohortState:
+    def __init__(self):
+        self.stats = {metric: RunningStats() for metric in METRICS}
+        self.sketches = {metric: QuantileSketch(edges) for metric, edges in METRICS.items()}
+        self.extremes = {metric: pd.DataFrame() for metric in METRICS}  # tier x segment cohorts only
+
+    def track_extremes(self, rows, metric):
+        """Keep the TOP_CUSTOMERS highest and lowest ``metric`` values, merged with earlier batches."""
+        rows = rows[["customer_id", *CUSTOMER_COHORT, metric]]
+        combined = pd.concat([self.extremes[metric], rows.nlargest(TOP_CUSTOMERS, metric),
+                              rows.nsmallest(TOP_CUSTOMERS, metric)]).drop_duplicates("customer_id", keep="last")
+        self.extremes[metric] = pd.concat([combined.nlargest(TOP_CUSTOMERS, metric),
+                                           combined.nsmallest(TOP_CUSTOMERS, metric)]).drop_duplicates("customer_id")
+
+
+class AnomalyMonitor:
+    def __init__(self):
+        self.cohorts = {}  # (columns, values) -> CohortState
+        self.rows = 0
+        self._lock = threading.Lock()
+
+    def _cohort(self, key):
+        if key not in self.cohorts:
+            self.cohorts[key] = CohortState()
+        return self.cohorts[key]
+
+    def ingest(self, frame):
+        """Fold a batch of customer rows into the running state."""
+        if frame.empty:
+            return
+        with self._lock, tracing.span("anomaly_ingest", rows=len(frame)):
+            for columns in COHORTS:
+                groups = [((), frame)] if not columns else frame.groupby(list(columns), observed=True)
+                for values, rows in groups:
+                    state = self._cohort((columns, values if isinstance(values, tuple) else (values,)))
+                    for metric in METRICS:
+                        metric_values = rows[metric].to_numpy(dtype=float)
+                        state.stats[metric].update(metric_values)
+                        state.sketches[metric].update(metric_values)
+                        if columns == CUSTOMER_COHORT:
+                            state.track_extremes(rows, metric)
+            self.rows += len(frame)
+
+    def outliers(self, metric):
+        """Customers at least Z_THRESHOLD std devs from their tier x segment cohort's current mean."""
+        with self._lock:
+            scored = [state.extremes[metric].assign(
+                          z_score=(state.extremes[metric][metric] - state.stats[metric].mean) / state.stats[metric].std)
+                      for (columns, _), state in self.cohorts.items()
+                      if columns == CUSTOMER_COHORT and state.stats[metric].std and not state.extremes[metric].empty]
+        if not scored:
+            return pd.DataFrame()
+        combined = pd.concat(scored)
+        combined = combined[combined["z_score"].abs() >= Z_THRESHOLD]
+        return combined.reindex(combined["z_score"].abs().sort_values(ascending=False).index).head(TOP_CUSTOMERS)
+
+    def summary(self, metric, columns=()):
+        """Per-cohort statistics for one grouping, as a DataFrame."""
+        rows = {}
+        with self._lock:
+            for (cohort_columns, values), state in self.cohorts.items():
+                if cohort_columns == columns:
+                    stats, sketch = state.stats[metric], state.sketches[metric]
+                    rows[" / ".join(map(str, values)) or "All customers"] = {
+                        "customers": stats.count, "mean": stats.mean, "std": stats.std,
+                        "p50": sketch.quantile(0.5), "p95": sketch.quantile(0.95), "p99": sketch.quantile(0.99)}
+        return pd.DataFrame.from_dict(rows, orient="index").astype({"customers": int}).sort_index()
+
+    def unusual_cohorts(self, metric):
+        """Cohorts whose mean or p95 is COHORT_THRESHOLD overall std devs away from everyone's."""
+        with self._lock:
+            overall = self.cohorts.get(((), ()))
+            if overall is None:
+                return pd.DataFrame()
+            base, base_sketch = overall.stats[metric], overall.sketches[metric]
+            base_p95, scale = base_sketch.quantile(0.95), base.std or 1.0
+            rows = []
+            for (columns, values), state in self.cohorts.items():
+                stats = state.stats[metric]
+                if not columns or stats.count < MIN_COHORT_SIZE:
+                    continue
+                mean_shift = (stats.mean - base.mean) / scale
+                p95_shift = (state.sketches[metric].quantile(0.95) - base_p95) / scale
+                if max(abs(mean_shift), abs(p95_shift)) >= COHORT_THRESHOLD:
+                    rows.append({"cohort": " / ".join(map(str, values)), "customers": stats.count,
+                                 "mean": stats.mean, "overall_mean": base.mean,
+                                 "mean_shift_sd": mean_shift, "p95_shift_sd": p95_shift})
+        if not rows:
+            return pd.DataFrame()
+        result = pd.DataFrame(rows).set_index("cohort")
+        return result.reindex(result["mean_shift_sd"].abs().sort_values(ascending=False).index)
+
+
+monitor = AnomalyMonitor()
+_synced = None  # (frame, rows ingested from it)
+_sync_lock = threading.Lock()
+
+
+def get_monitor():
+    """The monitor, caught up with the loaded dataset (appended rows only, when possible)."""
+    global monitor, _synced
+    frame = query_dataframe.df
+    if _synced is not None and _synced[0] is frame:
+        return monitor
+    with _sync_lock:
+        if _synced is None or _synced[0] is not frame:
+            start = 0
+            if _synced is not None:
+                old, seen = _synced
+                # A refresh that only appended rows keeps the state; anything else rebuilds it
+                same_prefix = len(frame) >= seen and frame["customer_id"].iloc[:seen].equals(
+                    old["customer_id"].iloc[:seen]) and all(
+                    frame[m].iloc[:seen].equals(old[m].iloc[:seen]) for m in METRICS)
+                if same_prefix:
+                    start = seen
+                else:
+                    monitor = AnomalyMonitor()
+            monitor.ingest(frame.iloc[start:])
+            _synced = (frame, len(frame))
+    return monitor
+
+
+def _metrics_for(query_lower):
+    wanted = [m for m, words in [("decline_rate", ("decline", "declin")), ("monthly_spend", ("spend", "spending"))]
+              if any(w in query_lower for w in words)]
+    return wanted or list(METRICS)
+
+
+def _table(title, frame, floatfmt=".3f"):
+    """Render a result table and keep the frame so charts can reuse it by reference."""
+    ref = result_store.put(title, frame)
+    return f"{title} [ref: {ref}]:\n{frame.to_markdown(floatfmt=floatfmt)}"
+
+
+@tracing.traced("anomaly_detection")
+def detect_anomalies(query):
+    """Describe unusual cohorts and customers for decline rate and/or spend."""
+    current = get_monitor()
+    query_lower = query.lower()
+    sections = []
+    for metric in _metrics_for(query_lower):
+        label = metric.replace("_", " ")
+        overall = current.summary(metric).iloc[0]
+        sections.append(f"{label.title()} across {int(overall['customers']):,} customers: mean {overall['mean']:.3f}, "
+                        f"std {overall['std']:.3f}, p50 {overall['p50']:.3f}, p95 {overall['p95']:.3f}, "
+                        f"p99 {overall['p99']:.3f}")
+        cohorts = current.unusual_cohorts(metric)
+        if cohorts.empty:
+            sections.append(f"No tier or segment cohort's {label} differs from the overall distribution "
+                            f"by {COHORT_THRESHOLD} std devs or more.")
+        else:
+            sections.append(_table(f"Unusual cohorts by {label}", cohorts))
+        outliers = current.outliers(metric)
+        if outliers.empty:
+            sections.append(f"No customers beyond {Z_THRESHOLD:g} std devs of their cohort's {label}.")
+        else:
+            sections.append(_table(f"Most extreme customers by {label} (|z| >= {Z_THRESHOLD:g} within tier/segment)",
+                                   outliers.set_index("customer_id")))
+        if "tier" in query_lower or "segment" in query_lower:
+            columns = ("account_tier",) if "tier" in query_lower else ("customer_segment",)
+            sections.append(_table(f"{label.title()} by {columns[0].replace('_', ' ')}",
+                                   current.summary(metric, columns)))
+    return "\n\n".join(sections)
+
+
+async def adetect_anomalies(query):
+    """Async variant of detect_anomalies; the first (building) call runs on the shared CPU pool."""
+    return await async_runtime.run_blocking(detect_anomalies, query)
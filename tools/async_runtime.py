@@ -0,0 +1,64 @@
+"""Shared asyncio loop and executors for async agent and tool execution.
+
+One background thread runs a single event loop for the whole process, so
+many in-flight conversations are multiplexed on it instead of each holding a
+worker thread. Blocking work is pushed off the loop:
+
+- ``cpu`` pool: pandas queries and glossary search
+- ``plot`` pool: a single thread, because pyplot's global figure state is not
+  thread-safe
+"""
+import asyncio
+import contextvars
+import functools
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+CPU_WORKERS = int(os.getenv("ASYNC_CPU_WORKERS", str(min(8, (os.cpu_count() or 2)))))
+
+_executors = {
+    "cpu": ThreadPoolExecutor(max_workers=CPU_WORKERS, thread_name_prefix="copilot-cpu"),
+    "plot": ThreadPoolExecutor(max_workers=1, thread_name_prefix="copilot-plot"),
+}
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_loop():
+    """Return the shared event loop, starting its thread on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            loop = asyncio.new_event_loop()
+            threading.Thread(target=loop.run_forever, name="copilot-event-loop", daemon=True).start()
+            _loop = loop
+    return _loop
+
+
+def submit(coro):
+    """Schedule a coroutine on the shared loop from any thread; returns a concurrent Future.
+
+    The caller's context variables (e.g. the result_store session) are carried
+    over to the task.
+    """
+    caller_context = contextvars.copy_context()
+
+    async def in_caller_context():
+        for var, value in caller_context.items():
+            var.set(value)
+        return await coro
+
+    return asyncio.run_coroutine_threadsafe(in_caller_context(), get_loop())
+
+
+def run(coro, timeout=None):
+    """Run a coroutine on the shared loop and block the calling thread for its result."""
+    return submit(coro).result(timeout)
+
+
+async def run_blocking(func, *args, pool="cpu", **kwargs):
+    """Await a blocking function on one of the shared executors."""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(_executors[pool], functools.partial(context.run, func, *args, **kwargs))
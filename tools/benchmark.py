@@ -0,0 +1,194 @@
+"""Latency and memory benchmarks for the data tools on synthetic datasets.
+
+For each dataset size this times the dataset load, every ``handle_*``
+query handler and every ``create_*_visualizations`` chart, plus glossary
+search once per run. Each case is timed ``repeat`` times after a warm-up
+call, then run once more under tracemalloc for its peak allocation.
+Results go to a JSON file so two versions can be compared:
+
+    python -m tools.benchmark --sizes 100k,1m --out .cache/benchmarks/main.json
+    python -m tools.benchmark --compare .cache/benchmarks/main.json .cache/benchmarks/branch.json
+
+LLM and embedding calls use the fake stand-ins (LLM_REPLAY_MODE=fake)
+unless another mode is set, so only local work is measured.
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import tempfile
+import time
+import tracemalloc
+
+os.environ.setdefault("LLM_REPLAY_MODE", "fake")
+
+import numpy as np
+import pandas as pd
+
+from tools import query_dataframe, generate_chart, query_backend, synthetic_data
+
+# Representative question for every handler / chart, so each branch does its full work
+HANDLER_QUERIES = {
+    "handle_churn_analysis": "churn rate by tier",
+    "handle_revenue_analysis": "revenue by segment",
+    "handle_spending_analysis": "spending by tier",
+    "handle_feature_analysis": "feature usage",
+    "handle_customer_analysis": "customer overview",
+    "handle_tier_analysis": "tier breakdown",
+    "handle_segment_analysis": "segment breakdown",
+    "handle_trend_analysis": "monthly signup trend",
+    "handle_comparison_analysis": "compare key metrics",
+    "handle_churn_risk": "which Premium customers are about to churn",
+    "handle_scenario": "what if 10% of Free users upgrade to Plus",
+}
+CHART_QUERIES = {
+    "create_churn_visualizations": "churn by tier",
+    "create_revenue_visualizations": "revenue by segment",
+    "create_spending_visualizations": "spending by tier",
+    "create_feature_visualizations": "feature usage",
+    "create_trend_visualizations": "monthly trend",
+    "create_comparison_visualizations": "compare tiers and segments",
+}
+GLOSSARY_TERMS = ["CLTV", "churn rate", "decline_rate", "how much revenue does a customer bring in"]
+
+
+def measure(func, repeat=3, warmup=True):
+    """Time ``func`` and record its peak traced allocation: ``{runs_ms, median_ms, min_ms, peak_mb}``."""
+    if warmup:
+        func()
+    runs = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        runs.append((time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    try:
+        func()
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return {"runs_ms": [round(r, 2) for r in runs], "median_ms": round(statistics.median(runs), 2),
+            "min_ms": round(min(runs), 2), "peak_mb": round(peak / 2 ** 20, 2)}
+
+
+def _case(results, dataset, rows, kind, name, func, repeat, warmup=True):
+    try:
+        entry = measure(func, repeat, warmup)
+    except Exception as e:
+        entry = {"error": f"{type(e).__name__}: {e}"}
+    results.append({"dataset": dataset, "rows": rows, "kind": kind, "name": name, **entry})
+    print(f"{dataset:>8} {kind:<8} {name:<36} "
+          + (f"{entry['median_ms']:>10.1f} ms {entry['peak_mb']:>9.1f} MB" if "error" not in entry else entry["error"]))
+
+
+def bench_dataset(label, path, repeat=3, chart_repeat=1):
+    """Benchmark load, every handler and every chart against one dataset file."""
+    results = []
+    saved = query_dataframe.DATA_PATH, query_dataframe.df, generate_chart.df
+    try:
+        query_dataframe.DATA_PATH = path
+        _case(results, label, None, "load", "load_data", query_dataframe.load_data, repeat=1, warmup=False)
+        frame = query_dataframe.load_data()
+        rows = len(frame)
+        results[-1]["rows"] = rows
+        query_dataframe.df = generate_chart.df = frame
+
+        for name, query in HANDLER_QUERIES.items():
+            handler = getattr(query_dataframe, name)
+            _case(results, label, rows, "query", name, lambda h=handler, q=query: h(q, q.lower()), repeat)
+
+        with tempfile.TemporaryDirectory() as tmp, generate_chart.chart_output(os.path.join(tmp, "chart.png")):
+            for name, description in CHART_QUERIES.items():
+                chart = getattr(generate_chart, name)
+                _case(results, label, rows, "chart", name, lambda c=chart, d=description: c(d), chart_repeat)
+    finally:
+        query_dataframe.DATA_PATH, query_dataframe.df, generate_chart.df = saved
+    return results
+
+
+def bench_glossary(repeat=3):
+    results = []
+    try:
+        from tools import glossary_lookup
+    except Exception as e:
+        print(f"{'glossary':>8} skipped: {type(e).__name__}: {e}")
+        return [{"dataset": "glossary", "rows": None, "kind": "glossary", "name": "import",
+                 "error": f"{type(e).__name__}: {e}"}]
+    _case(results, "glossary", None, "glossary", "cold_first_search",
+          lambda: glossary_lookup.search_term(GLOSSARY_TERMS[0]), repeat=1, warmup=False)
+    for term in GLOSSARY_TERMS:
+        _case(results, "glossary", None, "glossary", f"search: {term}",
+              lambda t=term: glossary_lookup.search_term(t), repeat)
+    return results
+
+
+def environment():
+    try:
+        commit = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                                timeout=5).stdout.strip()
+    except (OSError, subprocess.SubprocessError):
+        commit = ""
+    return {"commit": commit, "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "python": platform.python_version(),
+            "pandas": pd.__version__, "numpy": np.__version__, "machine": platform.machine(),
+            "cpus": os.cpu_count(), "llm_mode": os.environ["LLM_REPLAY_MODE"],
+            "query_backend": query_backend.BACKEND}
+
+
+def run(sizes=("100k",), repeat=3, seed=0, include_source=True, out=None):
+    """Run the full suite; returns (and optionally writes) ``{environment, results}``."""
+    results = []
+    if include_source:
+        results += bench_dataset("source", query_dataframe.DATA_PATH, repeat)
+    for size in sizes:
+        results += bench_dataset(size, synthetic_data.dataset_path(size, seed), repeat)
+    results += bench_glossary(repeat)
+
+    report = {"environment": environment(), "results": results}
+    if out:
+        os.makedirs(os.path.dirname(out) or ".", exist_ok=True)
+        with open(out, "w") as f:
+            json.dump(report, f, indent=2)
+    return report
+
+
+def compare(baseline, current, tolerance=0.2):
+    """Cases whose median latency or peak memory grew by more than ``tolerance`` (a fraction)."""
+    before = {(r["dataset"], r["name"]): r for r in baseline["results"] if "error" not in r}
+    regressions = []
+    for result in current["results"]:
+        old = before.get((result["dataset"], result["name"]))
+        if old is None or "error" in result:
+            continue
+        for metric in ("median_ms", "peak_mb"):
+            if old[metric] > 0 and result[metric] > old[metric] * (1 + tolerance):
+                regressions.append({"dataset": result["dataset"], "name": result["name"], "metric": metric,
+                                    "before": old[metric], "after": result[metric],
+                                    "change": round(result[metric] / old[metric] - 1, 3)})
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the data tools on synthetic datasets.")
+    parser.add_argument("--sizes", default="100k", help="comma-separated: " + ", ".join(synthetic_data.SIZES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--no-source", action="store_true", help="skip the bundled 30k-row dataset")
+    parser.add_argument("--out", default=f".cache/benchmarks/{time.strftime('%Y%m%d-%H%M%S')}.json")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"))
+    parser.add_argument("--tolerance", type=float, default=0.2)
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare[0]) as f, open(args.compare[1]) as g:
+            regressions = compare(json.load(f), json.load(g), args.tolerance)
+        for r in regressions:
+            print(f"{r['dataset']:>8} {r['name']:<36} {r['metric']:<10} {r['before']} -> {r['after']} "
+                  f"({r['change']:+.0%})")
+        raise SystemExit(1 if regressions else 0)
+
+    run([s.strip() for s in args.sizes.split(",") if s.strip()], args.repeat, args.seed,
+        include_source=not args.no_source, out=args.out)
+    print(f"Saved {args.out}")
@@ -0,0 +1,180 @@
+"""Deterministic answers for the canonical questions offered in the UI.
+
+The sidebar and example buttons in app.py send fixed strings. When a
+question matches one of the registered analyses closely enough, the query
+handler and dashboard are called directly and at most one (usually cached)
+summarization call is made, skipping the ReAct loop entirely.
+"""
+import os
+import shutil
+
+import numpy as np
+
+from tools import async_runtime, tracing
+
+MATCH_THRESHOLD = float(os.getenv("CANONICAL_MATCH_THRESHOLD", "0.9"))
+SUMMARIZE = os.getenv("CANONICAL_SUMMARY", "1").lower() not in ("0", "false", "no")
+CHART_CACHE_DIR = os.getenv("CANONICAL_CHART_CACHE", ".cache/charts")
+
+# Handlers (tools/query_dataframe.py) and charts (tools/generate_chart.py) are named rather than
+# imported, so the UI can import this module for its example questions without loading pandas,
+# matplotlib or the LLM stack.
+CANONICAL_ANALYSES = {
+    "churn_overview": {
+        "phrases": ["Churn analysis", "What's driving our churn rate?", "What is our churn rate?",
+                    "Churn overview"],
+        "query": "churn analysis",
+        "handler": "handle_churn_analysis",
+        "chart": "create_churn_visualizations",
+    },
+    "churn_by_tier": {
+        "phrases": ["Churn rate by tier", "Churn by account tier", "What is the churn rate by tier?"],
+        "query": "churn rate by tier",
+        "handler": "handle_churn_analysis",
+        "chart": "create_churn_visualizations",
+    },
+    "revenue_trends": {
+        "phrases": ["Revenue trends", "Show me revenue trends", "Revenue over time"],
+        "query": "revenue trends",
+        "handler": "handle_revenue_analysis",
+        "chart": "create_trend_visualizations",
+    },
+    "revenue_by_segment": {
+        "phrases": ["Revenue analysis by segment", "Revenue by segment", "Revenue by customer segment"],
+        "query": "revenue analysis by segment",
+        "handler": "handle_revenue_analysis",
+        "chart": "create_revenue_visualizations",
+    },
+    "feature_usage": {
+        "phrases": ["Feature usage", "Which features are popular?", "Feature usage analysis",
+                    "Most popular features"],
+        "query": "feature usage",
+        "handler": "handle_feature_analysis",
+        "chart": "create_feature_visualizations",
+    },
+    "customer_segments": {
+        "phrases": ["Customer segments", "Compare customer segments", "Segment analysis"],
+        "query": "customer segment analysis",
+        "handler": "handle_segment_analysis",
+        "chart": "create_comparison_visualizations",
+    },
+    "spending_by_tier": {
+        "phrases": ["Spending patterns among Premium users", "Spending patterns", "Spending by tier"],
+        "query": "spending by tier",
+        "handler": "handle_spending_analysis",
+        "chart": "create_spending_visualizations",
+    },
+    "monthly_signups": {
+        "phrases": ["Monthly signup trend over the last 12 months", "Monthly signup trend", "Signup trend"],
+        "query": "monthly signup trend",
+        "handler": "handle_trend_analysis",
+        "chart": "create_trend_visualizations",
+    },
+    "tier_vs_segment": {
+        "phrases": ["Tier vs segment comparison", "Compare tiers and segments"],
+        "query": "compare tier vs segment",
+        "handler": "handle_comparison_analysis",
+        "chart": "create_comparison_visualizations",
+    },
+}
+
+# Quick example buttons shown in app.py; also the default warm-up list (see tools/warmup.py)
+SIDEBAR_EXAMPLES = [
+    "Churn analysis",
+    "Revenue trends",
+    "Feature usage",
+    "Customer segments"
+]
+
+EXAMPLE_QUESTIONS = [
+    "What's driving our churn rate?",
+    "Show me revenue trends",
+    "Which features are popular?",
+    "Compare customer segments"
+]
+
+_embeddings = None
+_phrase_index = None
+
+
+def _index():
+    """Lazily embed every registered phrase: (names, normalized phrases, matrix)."""
+    global _phrase_index, _embeddings
+    from tools import llm_cache
+    if _phrase_index is None:
+        _embeddings = llm_cache.HashingEmbeddings()
+        names, phrases = [], []
+        for name, spec in CANONICAL_ANALYSES.items():
+            for phrase in spec["phrases"]:
+                names.append(name)
+                phrases.append(llm_cache.normalize_text(phrase))
+        _phrase_index = (names, phrases, np.array(_embeddings.embed_documents(phrases), dtype=np.float32))
+    return _phrase_index
+
+
+def match(question):
+    """Return ``(analysis_name, score)`` for the closest canonical analysis, or ``(None, score)``."""
+    from tools import llm_cache
+    names, phrases, matrix = _index()
+    normalized = llm_cache.normalize_text(question)
+    if normalized in phrases:
+        return names[phrases.index(normalized)], 1.0
+    scores = matrix @ np.asarray(_embeddings.embed_query(normalized), dtype=np.float32)
+    best = int(np.argmax(scores))
+    score = float(scores[best])
+    return (names[best], score) if score >= MATCH_THRESHOLD else (None, score)
+
+
+@tracing.traced("canonical_analysis")
+def run_analysis(name, publish=True):
+    """Run a registered analysis: returns ``(table, chart_path)``.
+
+    The query is cheap and always re-run (so its result lands in the session's
+    result store); the dashboard render dominates latency, so its PNG is
+    cached per dataset version. With ``publish`` the cached PNG is copied to
+    the active chart path (chart.png for the UI); without it (background
+    warm-up) nothing outside the cache is touched.
+    """
+    from tools import generate_chart, llm_cache, query_dataframe
+    spec = CANONICAL_ANALYSES[name]
+    table = getattr(query_dataframe, spec["handler"])(spec["query"], spec["query"])
+
+    cached_chart = os.path.join(CHART_CACHE_DIR, f"{name}-{llm_cache.data_version()}.png")
+    tracing.annotate(analysis=name, chart_cache_hit=os.path.exists(cached_chart))
+    if not os.path.exists(cached_chart):
+        os.makedirs(CHART_CACHE_DIR, exist_ok=True)
+        with generate_chart.chart_output(cached_chart):
+            getattr(generate_chart, spec["chart"])(spec["query"])
+    if not publish:
+        return table, cached_chart
+    published = generate_chart.chart_path()
+    shutil.copyfile(cached_chart, published)
+    return table, published
+
+
+def answer(question):
+    """Answer a canonical question directly, or return None to defer to the agent.
+
+    Returns a dict with ``analysis``, ``score``, ``table``, ``chart`` and
+    ``summary`` (empty when summaries are disabled).
+    """
+    name, score = match(question)
+    if name is None:
+        return None
+
+    from tools import summarize_insight
+    table, chart = run_analysis(name)
+    summary = summarize_insight.generate_insights(table) if SUMMARIZE else ""
+    return {"analysis": name, "score": score, "table": table, "chart": chart, "summary": summary}
+
+
+async def aanswer(question):
+    """Async variant of answer; the pandas/matplotlib work runs on the plotting thread."""
+    name, score = match(question)
+    if name is None:
+        return None
+
+    from tools import summarize_insight
+    table, chart = await async_runtime.run_blocking(run_analysis, name, pool="plot")
+    summary = await summarize_insight.agenerate_insights(table) if SUMMARIZE else ""
+    return {"analysis": name, "score": score, "table": table, "chart": chart, "summary": summary}
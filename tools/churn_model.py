@@ -0,0 +1,251 @@
+"""Churn-risk scoring: a small local model over the customer table.
+
+Features are built for the whole table in one vectorized pass (spend,
+transactions, decline rate, tenure, and one-hot tier/segment/feature/card
+type plus the KYC and card-activation flags). ``account_status`` is left out
+because a closed account *is* a churned one. The model is an L2-regularized
+logistic regression fitted with Newton steps in numpy, which trains in well
+under a second on the sample data and needs no extra dependency.
+
+Fitted models are saved under CHURN_MODEL_DIR, keyed by the data version they
+were trained on, so restarts and other processes reuse them. Scores are kept
+per customer with a hash of that customer's row. When the dataset changes,
+only new or changed rows are re-scored, unless more than
+CHURN_RETRAIN_FRACTION of the table changed, in which case the model is
+retrained (or loaded from the cache for that version) and everything is
+re-scored.
+
+"Who is about to churn" is then a lookup: active customers are kept sorted
+by score, overall and per tier/segment, so ``at_risk`` slices an index
+instead of scoring or training.
+"""
+import json
+import os
+import threading
+import uuid
+
+import numpy as np
+import pandas as pd
+
+from tools import llm_cache, query_dataframe, tracing
+
+MODEL_DIR = os.getenv("CHURN_MODEL_DIR", ".cache/churn_model")
+RETRAIN_FRACTION = float(os.getenv("CHURN_RETRAIN_FRACTION", "0.1"))
+HIGH_RISK_QUANTILE = float(os.getenv("CHURN_HIGH_RISK_QUANTILE", "0.9"))
+L2 = 1.0
+NEWTON_STEPS = 25
+
+NUMERIC_FEATURES = ["monthly_spend", "transactions_count", "decline_rate"]
+FLAG_FEATURES = ["kyc_completed", "card_activated"]
+CATEGORY_FEATURES = {
+    "account_tier": ["Free", "Plus", "Premium"],
+    "customer_segment": ["Student", "Professional", "Retired"],
+    "product_feature_used": ["DirectDeposit", "RoundUps", "SavingsVault", "CryptoRewards", "BillPay"],
+    "card_type": ["Credit", "Debit", "Virtual"],
+}
+INPUT_COLUMNS = NUMERIC_FEATURES + FLAG_FEATURES + list(CATEGORY_FEATURES) + ["account_created_at"]
+INDEX_COLUMNS = ["account_tier", "customer_segment"]
+
+
+def feature_names():
+    names = ["log_monthly_spend", "log_transactions_count", "decline_rate", "tenure_years"] + FLAG_FEATURES
+    for column, values in CATEGORY_FEATURES.items():
+        names += [f"{column}={v}" for v in values] + [f"{column}=other"]
+    return names
+
+
+def build_features(frame, as_of):
+    """Feature matrix (float64, one row per customer) for the given rows."""
+    n = len(frame)
+    columns = [
+        np.log1p(frame["monthly_spend"].to_numpy(dtype=float).clip(min=0)),
+        np.log1p(frame["transactions_count"].to_numpy(dtype=float).clip(min=0)),
+        frame["decline_rate"].to_numpy(dtype=float),
+        (as_of - pd.to_datetime(frame["account_created_at"])).dt.days.to_numpy(dtype=float) / 365.25,
+    ]
+    columns += [frame[flag].to_numpy(dtype=float) for flag in FLAG_FEATURES]
+    X = np.column_stack(columns) if n else np.empty((0, len(columns)))
+    one_hots = []
+    for column, values in CATEGORY_FEATURES.items():
+        hits = [(frame[column] == v).to_numpy() for v in values]
+        # Unknown and missing values land in the trailing "other" column
+        one_hots += hits + [~np.logical_or.reduce(hits)]
+    return np.hstack([X, np.column_stack(one_hots).astype(float)])
+
+
+def row_hashes(frame):
+    """One hash per row of the model's input columns; changes when any input changes."""
+    return pd.util.hash_pandas_object(frame[INPUT_COLUMNS], index=False).to_numpy()
+
+
+class ChurnModel:
+    def __init__(self, weights, bias, mean, scale, as_of, data_version):
+        self.weights = weights
+        self.bias = bias
+        self.mean = mean
+        self.scale = scale
+        self.as_of = pd.Timestamp(as_of)
+        self.data_version = data_version
+
+    @classmethod
+    def fit(cls, frame, data_version):
+        """Fit on every row with a known outcome."""
+        as_of = pd.to_datetime(frame["account_created_at"]).max()
+        X = build_features(frame, as_of)
+        y = frame["churned"].to_numpy(dtype=float)
+        mean, scale = X.mean(axis=0), X.std(axis=0)
+        scale[scale == 0] = 1.0
+        Z = np.hstack([(X - mean) / scale, np.ones((len(X), 1))])
+
+        w = np.zeros(Z.shape[1])
+        penalty = np.full(Z.shape[1], L2)
+        penalty[-1] = 0.0  # the intercept is not regularized
+        for _ in range(NEWTON_STEPS):
+            p = 1.0 / (1.0 + np.exp(-Z @ w))
+            gradient = Z.T @ (p - y) + penalty * w
+            hessian = (Z * (p * (1 - p))[:, None]).T @ Z + np.diag(penalty)
+            step = np.linalg.solve(hessian, gradient)
+            w -= step
+            if np.abs(step).max() < 1e-6:
+                break
+        return cls(w[:-1], w[-1], mean, scale, as_of, data_version)
+
+    def score(self, frame):
+        """Churn probability for each row."""
+        Z = (build_features(frame, self.as_of) - self.mean) / self.scale
+        return 1.0 / (1.0 + np.exp(-(Z @ self.weights + self.bias)))
+
+    def drivers(self, k=5):
+        """Features with the largest standardized weights, as ``[(name, weight), ...]``."""
+        names = feature_names()
+        order = np.argsort(-np.abs(self.weights))[:k]
+        return [(names[i], round(float(self.weights[i]), 3)) for i in order]
+
+    def save(self, path):
+        tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp, "wb") as f:
+            np.savez(f, weights=self.weights, bias=self.bias, mean=self.mean, scale=self.scale,
+                     meta=json.dumps({"as_of": self.as_of.isoformat(), "data_version": self.data_version,
+                                      "features": feature_names()}))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            meta = json.loads(str(data["meta"]))
+            if meta["features"] != feature_names():
+                raise ValueError("saved churn model was built with a different feature set")
+            return cls(data["weights"], float(data["bias"]), data["mean"], data["scale"],
+                       meta["as_of"], meta["data_version"])
+
+
+def model_path(version):
+    return os.path.join(MODEL_DIR, f"model-{version}.npz")
+
+
+def get_model(frame, version):
+    """The model trained on ``version`` of the data, from disk when available."""
+    path = model_path(version)
+    if os.path.exists(path):
+        try:
+            return ChurnModel.load(path)
+        except (OSError, ValueError, KeyError):
+            pass  # stale or partial file; retrain below
+    with tracing.span("churn_model_train", rows=len(frame)):
+        model = ChurnModel.fit(frame, version)
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    model.save(path)
+    return model
+
+
+class RiskIndex:
+    """Per-customer scores plus active customers pre-sorted by risk."""
+
+    def __init__(self, model, frame, scores, hashes):
+        self.model = model
+        self.customer_ids = frame["customer_id"].to_numpy()
+        self.scores = scores
+        self.hashes = hashes
+        self.frame = frame
+        active = np.flatnonzero(~frame["churned"].to_numpy(dtype=bool))
+        self.order = active[np.argsort(-scores[active], kind="stable")]
+        # Sorted positions per tier/segment value, so filtered lookups are slices too
+        self.by_value = {}
+        for column in INDEX_COLUMNS:
+            for value in CATEGORY_FEATURES[column]:
+                self.by_value[(column, value)] = self.order[(frame[column] == value).to_numpy()[self.order]]
+
+    def at_risk(self, n=20, min_score=None, **filters):
+        """The ``n`` riskiest active customers, optionally within a tier and/or segment."""
+        positions = self.order
+        for column, value in filters.items():
+            if value is not None:
+                subset = self.by_value.get((column, value), positions[:0])
+                positions = subset if positions is self.order else positions[np.isin(positions, subset)]
+        if min_score is not None:
+            # Positions are sorted by descending score, so the cut is a binary search
+            positions = positions[:np.searchsorted(-self.scores[positions], -min_score, side="right")]
+        top = positions[:n]
+        result = self.frame.iloc[top][["customer_id", "account_tier", "customer_segment", "monthly_spend",
+                                       "decline_rate"]].copy()
+        result.insert(1, "churn_risk", self.scores[top].round(3))
+        return result.set_index("customer_id")
+
+
+_index = None  # RiskIndex for the frame currently loaded in query_dataframe
+_index_lock = threading.Lock()
+
+
+def score_all(frame, model):
+    with tracing.span("churn_score", rows=len(frame), rescored=len(frame)):
+        return RiskIndex(model, frame, model.score(frame), row_hashes(frame))
+
+
+def rescore(previous, frame, version):
+    """Reuse ``previous`` scores for unchanged rows and score only new or changed ones."""
+    hashes = row_hashes(frame)
+    known = pd.Series(previous.hashes, index=previous.customer_ids)
+    old_hashes = known.reindex(frame["customer_id"].to_numpy()).to_numpy()
+    changed = np.flatnonzero(pd.isna(old_hashes) | (old_hashes != hashes))
+    if len(changed) > RETRAIN_FRACTION * len(frame):
+        return score_all(frame, get_model(frame, version))
+
+    with tracing.span("churn_score", rows=len(frame), rescored=len(changed)):
+        old_scores = pd.Series(previous.scores, index=previous.customer_ids)
+        scores = old_scores.reindex(frame["customer_id"].to_numpy()).to_numpy(dtype=float, copy=True)
+        if len(changed):
+            scores[changed] = previous.model.score(frame.iloc[changed])
+        return RiskIndex(previous.model, frame, scores, hashes)
+
+
+def get_index():
+    """Risk index for the current dataset, updated incrementally when the data changes."""
+    global _index
+    frame = query_dataframe.df  # replaced (not mutated) by query_dataframe.reload_data
+    if _index is not None and _index.frame is frame:
+        return _index
+    with _index_lock:
+        if _index is None or _index.frame is not frame:
+            # The version of the frame being scored, which need not be the default dataset's
+            version = frame.attrs.get("data_version") or llm_cache.data_version(query_dataframe.DATA_PATH)
+            if _index is None:
+                _index = score_all(frame, get_model(frame, version))
+            else:
+                _index = rescore(_index, frame, version)
+    return _index
+
+
+def at_risk(n=20, tier=None, segment=None, min_score=None):
+    """Riskiest active customers as a DataFrame indexed by customer_id."""
+    return get_index().at_risk(n, min_score, account_tier=tier, customer_segment=segment)
+
+
+def risk_summary():
+    """Active customers, how many are in the riskiest (1 - HIGH_RISK_QUANTILE), and average risk, by tier."""
+    index = get_index()
+    active = index.frame.iloc[index.order]
+    scores = pd.Series(index.scores[index.order], index=active.index)
+    cutoff = scores.quantile(HIGH_RISK_QUANTILE)
+    summary = scores.groupby(active["account_tier"]).agg(
+        active_customers="count", high_risk=lambda s: int((s >= cutoff).sum()), avg_risk="mean")
+    return summary.round(3)
@@ -0,0 +1,254 @@
+"""Token budgets for what the agent feeds back into its own prompt.
+
+Tool observations (markdown tables, Smart Analyzer JSON, insight reports)
+and replayed conversation memory are compacted to configurable token
+budgets before they reach the LLM. Each agent request gets a ledger that
+records tokens before/after compaction so savings can be reported, and keeps
+each compacted observation's full text so the UI can still show it whole.
+"""
+import json
+import os
+import re
+from contextvars import ContextVar
+
+import numpy as np
+
+OBSERVATION_TOKEN_BUDGET = int(os.getenv("OBSERVATION_TOKEN_BUDGET", "800"))
+MEMORY_TOKEN_BUDGET = int(os.getenv("MEMORY_TOKEN_BUDGET", "1500"))
+MEMORY_RECENT_TURNS = int(os.getenv("MEMORY_RECENT_TURNS", "2"))
+SUMMARY_TOKENS_PER_OLD_MESSAGE = 60
+
+_encoding = None
+_ledger = ContextVar("context_budget_ledger", default=None)
+
+
+def count_tokens(text):
+    """Count tokens with tiktoken when available, otherwise estimate ~4 characters per token."""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("o200k_base")
+        except Exception:
+            _encoding = False
+    if _encoding:
+        return len(_encoding.encode(text))
+    return max(1, len(text) // 4) if text else 0
+
+
+# ---------------------------------------------------------------------------
+# Per-request ledger
+# ---------------------------------------------------------------------------
+
+def start_request():
+    """Begin a token ledger for the current agent request."""
+    ledger = {"observations": [], "memory": [], "full_observations": {}}
+    _ledger.set(ledger)
+    return ledger
+
+
+def _record(kind, source, before, after):
+    ledger = _ledger.get()
+    if ledger is not None:
+        ledger[kind].append({"source": source, "tokens_before": before, "tokens_after": after})
+
+
+def _keep_full(raw, compacted):
+    ledger = _ledger.get()
+    if ledger is not None and compacted != raw:
+        ledger["full_observations"][compacted] = raw
+
+
+def full_observation(observation, ledger=None):
+    """The uncompacted text behind an observation the LLM saw (for display, never the prompt)."""
+    ledger = ledger if ledger is not None else _ledger.get()
+    return ledger["full_observations"].get(observation, observation) if ledger else observation
+
+
+def request_report(ledger=None):
+    """Summarize token savings for a request ledger (defaults to the current one)."""
+    ledger = ledger if ledger is not None else _ledger.get()
+    if not ledger:
+        return {}
+    report = {}
+    for kind in ("observations", "memory"):
+        before = sum(item["tokens_before"] for item in ledger[kind])
+        after = sum(item["tokens_after"] for item in ledger[kind])
+        report[kind] = {"count": len(ledger[kind]), "tokens_before": before, "tokens_after": after,
+                        "tokens_saved": before - after}
+    report["tokens_saved"] = report["observations"]["tokens_saved"] + report["memory"]["tokens_saved"]
+    return report
+
+
+# ---------------------------------------------------------------------------
+# Observation compaction
+# ---------------------------------------------------------------------------
+
+def _parse_cells(line):
+    return [cell.strip() for cell in line.strip().strip("|").split("|")]
+
+
+def _to_number(cell):
+    try:
+        return float(cell.replace(",", "").replace("$", "").replace("%", ""))
+    except ValueError:
+        return np.nan
+
+
+def compact_table(lines, max_tokens):
+    """Shrink a markdown table to its most informative rows and columns.
+
+    Constant columns are dropped first; rows are then ranked by their largest
+    absolute z-score across numeric columns and the most extreme ones kept in
+    their original order.
+    """
+    header, rows = _parse_cells(lines[0]), [_parse_cells(line) for line in lines[2:]]
+    if not rows:
+        return lines
+
+    keep_cols = [0] + [i for i in range(1, len(header))
+                       if len({row[i] for row in rows if i < len(row)}) > 1]
+    if len(keep_cols) == 1:
+        keep_cols = list(range(len(header)))
+
+    values = np.array([[_to_number(row[i]) if i < len(row) else np.nan for i in keep_cols[1:]] for row in rows])
+    if values.size and not np.isnan(values).all():
+        std = np.nanstd(values, axis=0)
+        std[~np.isfinite(std) | (std == 0)] = 1.0
+        zscores = np.abs((values - np.nanmean(values, axis=0)) / std)
+        informativeness = np.nan_to_num(np.nanmax(np.where(np.isnan(zscores), -1, zscores), axis=1), nan=0.0)
+    else:
+        informativeness = np.zeros(len(rows))
+
+    def render(selected):
+        out = ["| " + " | ".join(header[i] for i in keep_cols) + " |",
+               "|" + "|".join(":---" for _ in keep_cols) + "|"]
+        out += ["| " + " | ".join(rows[r][i] if i < len(rows[r]) else "" for i in keep_cols) + " |"
+                for r in sorted(selected)]
+        if len(selected) < len(rows):
+            out.append(f"| ... {len(rows) - len(selected)} more rows omitted |")
+        return out
+
+    ranked = list(np.argsort(-informativeness, kind="stable"))
+    keep = len(rows)
+    rendered = render(ranked)
+    while keep > 3 and count_tokens("\n".join(rendered)) > max_tokens:
+        keep = max(3, keep // 2)
+        rendered = render(ranked[:keep])
+    return rendered
+
+
+def compact_text(text, max_tokens):
+    """Truncate plain text on line boundaries, keeping the beginning."""
+    if count_tokens(text) <= max_tokens:
+        return text
+    kept, used = [], 0
+    for line in text.splitlines():
+        cost = count_tokens(line) + 1
+        if used + cost > max_tokens:
+            break
+        kept.append(line)
+        used += cost
+    if not kept:
+        # One long line (e.g. compact JSON): fall back to a character cut
+        kept = [text[:max_tokens * 4]]
+    return "\n".join(kept) + f"\n[... truncated to fit a {max_tokens}-token budget]"
+
+
+def compact_observation(text, max_tokens=OBSERVATION_TOKEN_BUDGET):
+    """Compact a tool observation to roughly ``max_tokens`` tokens."""
+    text = str(text)
+    if count_tokens(text) <= max_tokens:
+        return text
+
+    stripped = text.strip()
+    if stripped.startswith("{"):
+        try:
+            text = json.dumps(json.loads(stripped), separators=(",", ":"))
+        except ValueError:
+            pass
+        if count_tokens(text) <= max_tokens:
+            return text
+
+    lines = text.splitlines()
+    tables = sum(1 for i, line in enumerate(lines)
+                 if line.startswith("|") and (i == 0 or not lines[i - 1].startswith("|")))
+    if tables:
+        per_table = max(80, max_tokens // tables)
+        out, i = [], 0
+        while i < len(lines):
+            if lines[i].startswith("|"):
+                j = i
+                while j < len(lines) and lines[j].startswith("|"):
+                    j += 1
+                out += compact_table(lines[i:j], per_table) if j - i > 2 else lines[i:j]
+                i = j
+            else:
+                out.append(lines[i])
+                i += 1
+        text = "\n".join(out)
+
+    return compact_text(text, max_tokens)
+
+
+def budgeted(func, source, max_tokens=None):
+    """Wrap a tool function so its observation is compacted before the LLM sees it."""
+    limit = max_tokens or OBSERVATION_TOKEN_BUDGET
+
+    def wrapper(tool_input):
+        raw = str(func(tool_input))
+        compacted = compact_observation(raw, limit)
+        _record("observations", source, count_tokens(raw), count_tokens(compacted))
+        _keep_full(raw, compacted)
+        return compacted
+
+    wrapper.__name__ = getattr(func, "__name__", source)
+    wrapper.__doc__ = func.__doc__
+    return wrapper
+
+
+def abudgeted(coro_func, source, max_tokens=None):
+    """Async counterpart of :func:`budgeted`."""
+    limit = max_tokens or OBSERVATION_TOKEN_BUDGET
+
+    async def wrapper(tool_input):
+        raw = str(await coro_func(tool_input))
+        compacted = compact_observation(raw, limit)
+        _record("observations", source, count_tokens(raw), count_tokens(compacted))
+        _keep_full(raw, compacted)
+        return compacted
+
+    wrapper.__name__ = getattr(coro_func, "__name__", source)
+    wrapper.__doc__ = coro_func.__doc__
+    return wrapper
+
+
+# ---------------------------------------------------------------------------
+# Memory compaction
+# ---------------------------------------------------------------------------
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s")
+
+
+def _summarize_message(content):
+    """Cheap extractive summary of an older turn: its first sentence, table-free."""
+    prose = " ".join(line for line in content.splitlines() if line.strip() and not line.startswith("|"))
+    first = _SENTENCE_END.split(prose, maxsplit=1)[0]
+    return compact_text(first, SUMMARY_TOKENS_PER_OLD_MESSAGE)
+
+
+def compact_history(messages, max_tokens=MEMORY_TOKEN_BUDGET, recent_turns=MEMORY_RECENT_TURNS):
+    """Keep recent turns (tables compacted), summarize older ones, drop the oldest past the budget."""
+    split = max(0, len(messages) - recent_turns * 2)
+    older, recent = messages[:split], messages[split:]
+
+    compacted = [type(m)(content=_summarize_message(m.content)) for m in older]
+    compacted += [type(m)(content=compact_observation(m.content, max(200, max_tokens // max(1, len(recent)))))
+                  for m in recent]
+
+    while len(compacted) > 1 and sum(count_tokens(m.content) for m in compacted) > max_tokens:
+        compacted.pop(0)
+
+    _record("memory", "chat_history", sum(count_tokens(m.content) for m in messages),
+            sum(count_tokens(m.content) for m in compacted))
+    return compacted
@@ -0,0 +1,305 @@
+"""Streaming export of filtered customer lists and stored query results.
+
+A filter such as "churned Premium customers with spend over 1000" is parsed
+into column conditions, then the dataset is walked in fixed-size row slices.
+Each slice is masked and encoded on its own, so an export of millions of
+rows holds one chunk in memory at a time and the first bytes are ready as
+soon as the first slice is encoded.
+
+By default the UI hands Streamlit's download button a callable that joins
+the stream (``export_bytes``), which works wherever the app is reachable but
+holds the finished file in memory, so it is capped at EXPORT_MAX_INLINE_ROWS.
+When EXPORT_BASE_URL points at the export server (``serve``/``register``),
+the UI links to ``/export/<token>.<format>`` there instead and the file is
+streamed with chunked transfer encoding, with no size cap. Small stored query
+results (see tools/result_store.py) are encoded directly with ``result_bytes``.
+"""
+import io
+import os
+import re
+import secrets
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from tools import result_store, tracing
+
+CHUNK_ROWS = int(os.getenv("EXPORT_CHUNK_ROWS", "100000"))
+FIRST_CHUNK_ROWS = 5000
+HOST = os.getenv("EXPORT_HOST", "127.0.0.1")
+PORT = int(os.getenv("EXPORT_PORT", "8502"))
+BASE_URL = os.getenv("EXPORT_BASE_URL", "")  # public URL of the export server; unset: download through Streamlit
+MAX_INLINE_ROWS = int(os.getenv("EXPORT_MAX_INLINE_ROWS", "1000000"))
+TOKEN_TTL_SECONDS = 3600
+
+CONTENT_TYPES = {"csv": "text/csv", "parquet": "application/vnd.apache.parquet"}
+
+# Category values that identify their column unambiguously
+CATEGORY_COLUMNS = {
+    "account_tier": ["Free", "Plus", "Premium"],
+    "customer_segment": ["Student", "Professional", "Retired"],
+    "account_status": ["Active", "Suspended", "Closed"],
+    "card_type": ["Credit", "Debit", "Virtual"],
+    "product_feature_used": ["DirectDeposit", "RoundUps", "SavingsVault", "CryptoRewards", "BillPay"],
+}
+NUMERIC_COLUMNS = {"spend": "monthly_spend", "revenue": "monthly_revenue", "decline rate": "decline_rate",
+                   "transactions": "transactions_count"}
+# "active cards" is about card activation, not account status; an optional card type may sit in between
+CARD_STATE = re.compile(r"\b(inactive|unactivated|not activated|activated|active)((?:\s+(?:credit|debit|virtual))?\s+cards?)\b")
+COMPARATORS = {"over": ">", "above": ">", "more than": ">", "greater than": ">", ">": ">",
+               "under": "<", "below": "<", "less than": "<", "<": "<"}
+
+
+def parse_filters(text):
+    """Turn a plain-language filter into ``[(column, op, value), ...]``.
+
+    Understands tier/segment/status/card/feature names, churned vs retained,
+    KYC and card activation, and numeric thresholds like "spend over 1000".
+    """
+    lower = text.lower()
+    card_state = CARD_STATE.search(lower)
+    category_text = CARD_STATE.sub(r"\2", lower)
+    conditions = []
+    for column, values in CATEGORY_COLUMNS.items():
+        matched = [v for v in values if re.search(rf"\b{v.lower()}s?\b", category_text)]
+        if matched:
+            conditions.append((column, "in", matched))
+
+    if re.search(r"\b(not churned|retained|non-churned)\b", lower):
+        conditions.append(("churned", "==", False))
+    elif re.search(r"\bchurn(ed)?\b", lower):
+        conditions.append(("churned", "==", True))
+    if re.search(r"\b(no|without|pending|incomplete) kyc\b|\bkyc (pending|incomplete|not completed)\b", lower):
+        conditions.append(("kyc_completed", "==", False))
+    elif re.search(r"\bkyc\b", lower):
+        conditions.append(("kyc_completed", "==", True))
+    if card_state:
+        conditions.append(("card_activated", "==", card_state.group(1) in ("activated", "active")))
+
+    comparators = "|".join(re.escape(c) for c in COMPARATORS)
+    for phrase, column in NUMERIC_COLUMNS.items():
+        match = re.search(rf"\b{phrase}\s*(?:is\s+)?({comparators})\s*\$?([\d.,]+)", lower)
+        if match:
+            conditions.append((column, COMPARATORS[match.group(1)], float(match.group(2).replace(",", ""))))
+    return conditions
+
+
+def _mask(chunk, conditions):
+    mask = np.ones(len(chunk), dtype=bool)
+    for column, op, value in conditions:
+        values = chunk[column]
+        if op == "in":
+            mask &= values.isin(value).to_numpy()
+        elif op == "==":
+            mask &= (values == value).to_numpy()
+        elif op == ">":
+            mask &= (values > value).to_numpy()
+        elif op == "<":
+            mask &= (values < value).to_numpy()
+    return mask
+
+
+def count_rows(conditions, frame=None):
+    """Rows matching the conditions (chunked, so only a chunk-sized mask is ever held)."""
+    from tools import query_dataframe
+    frame = query_dataframe.df if frame is None else frame
+    return sum(int(_mask(frame.iloc[start:start + CHUNK_ROWS], conditions).sum())
+               for start in range(0, len(frame), CHUNK_ROWS))
+
+
+def _slices(n_rows, chunk_rows):
+    # A small first slice gets the first bytes out quickly; full-size slices follow
+    start, size = 0, min(FIRST_CHUNK_ROWS, chunk_rows)
+    while start < n_rows:
+        yield start, start + size
+        start, size = start + size, chunk_rows
+
+
+def iter_chunks(conditions, columns=None, frame=None, chunk_rows=CHUNK_ROWS):
+    """Yield the matching rows of the dataset one slice at a time (one empty slice when nothing matches)."""
+    from tools import query_dataframe
+    frame = query_dataframe.df if frame is None else frame
+    columns = columns or list(frame.columns)
+    matched = False
+    for start, stop in _slices(len(frame), chunk_rows):
+        chunk = frame.iloc[start:stop]
+        mask = _mask(chunk, conditions)
+        if mask.any():
+            matched = True
+            yield chunk.loc[mask, columns]
+    if not matched:
+        yield frame.iloc[:0][columns]  # so the file still has its header / schema
+
+
+def iter_csv(chunks):
+    """Encode DataFrame chunks as one CSV byte stream (header from the first chunk)."""
+    header = True
+    for chunk in chunks:
+        yield chunk.to_csv(index=False, header=header, date_format="%Y-%m-%d").encode()
+        header = False
+
+
+class _StreamSink:
+    """Write-only file for pyarrow whose contents are drained after each row group."""
+
+    closed = False
+
+    def __init__(self):
+        self._parts = []
+        self._position = 0
+
+    def write(self, data):
+        self._parts.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def writable(self):
+        return True
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+    def drain(self):
+        data, self._parts = b"".join(self._parts), []
+        return data
+
+
+def _pyarrow():
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export needs pyarrow: pip install pyarrow")
+    return pa, pq
+
+
+def parquet_schema(frame, columns=None):
+    """Arrow schema for ``columns`` of the whole frame, fixed before any chunk is encoded.
+
+    Taken from the column dtypes; object columns (whose type an all-null chunk
+    would otherwise infer as ``null``) are typed from their first non-null value.
+    """
+    pa, _ = _pyarrow()
+    columns = columns or list(frame.columns)
+    fields = []
+    for column in columns:
+        field = pa.Schema.from_pandas(frame[[column]].iloc[:0], preserve_index=False).field(column)
+        if pa.types.is_null(field.type):
+            sample = frame[column].dropna().iloc[:1]
+            field = field.with_type(pa.array(sample).type if len(sample) else pa.string())
+        fields.append(field)
+    return pa.schema(fields)
+
+
+def iter_parquet(chunks, schema):
+    """Encode DataFrame chunks as a Parquet byte stream with ``schema``, one row group per chunk."""
+    pa, pq = _pyarrow()
+    sink = _StreamSink()
+    writer = pq.ParquetWriter(sink, schema)
+    for chunk in chunks:
+        if len(chunk):
+            writer.write_table(pa.Table.from_pandas(chunk, schema=schema, preserve_index=False))
+            yield sink.drain()
+    writer.close()
+    yield sink.drain()
+
+
+def stream(conditions, fmt="csv", columns=None, frame=None):
+    """Byte chunks of the filtered dataset in ``fmt`` ("csv" or "parquet")."""
+    from tools import query_dataframe
+    frame = query_dataframe.df if frame is None else frame
+    chunks = iter_chunks(conditions, columns, frame)
+    return iter_parquet(chunks, parquet_schema(frame, columns)) if fmt == "parquet" else iter_csv(chunks)
+
+
+def export_bytes(conditions, fmt="csv", columns=None, frame=None):
+    """The whole export as one bytes object, for Streamlit's download button (see MAX_INLINE_ROWS)."""
+    with tracing.span("export", format=fmt, filters=len(conditions), inline=True) as span:
+        data = b"".join(stream(conditions, fmt, columns, frame))
+        span.set(bytes=len(data))
+    return data
+
+
+def result_bytes(ref=None, fmt="csv", session_id=None):
+    """Encode a stored Query DataFrame result (small, aggregated) as bytes; None if absent."""
+    stored = result_store.get(ref, session_id)
+    if stored is None:
+        return None
+    frame = stored[1].to_frame() if hasattr(stored[1], "to_frame") else stored[1]
+    frame = frame.reset_index()
+    frame.columns = [" / ".join(map(str, c)) if isinstance(c, tuple) else str(c) for c in frame.columns]
+    if fmt == "parquet":
+        buffer = io.BytesIO()
+        frame.to_parquet(buffer, index=False)
+        return buffer.getvalue()
+    return frame.to_csv(index=False).encode()
+
+
+# Export server ---------------------------------------------------------------
+
+_exports = {}  # token -> (conditions, fmt, columns, created)
+_exports_lock = threading.Lock()
+_server = None
+_server_lock = threading.Lock()
+
+
+def register(conditions, fmt="csv", columns=None):
+    """Register an export and return its download URL (valid for TOKEN_TTL_SECONDS)."""
+    serve()
+    token = secrets.token_urlsafe(16)
+    now = time.time()
+    with _exports_lock:
+        for stale in [t for t, spec in _exports.items() if now - spec[3] > TOKEN_TTL_SECONDS]:
+            del _exports[stale]
+        _exports[token] = (conditions, fmt, columns, now)
+    base = BASE_URL or f"http://{'localhost' if HOST in ('127.0.0.1', '0.0.0.0') else HOST}:{PORT}"
+    return f"{base.rstrip('/')}/export/{token}.{fmt}"
+
+
+class _ExportHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def do_GET(self):
+        match = re.fullmatch(r"/export/([\w-]+)\.(csv|parquet)", self.path)
+        with _exports_lock:
+            spec = _exports.get(match.group(1)) if match else None
+        if spec is None or time.time() - spec[3] > TOKEN_TTL_SECONDS:
+            self.send_error(404, "Unknown or expired export")
+            return
+
+        conditions, fmt, columns, _ = spec
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPES[fmt])
+        self.send_header("Content-Disposition", f'attachment; filename="customers.{fmt}"')
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        with tracing.span("export", format=fmt, filters=len(conditions)) as span:
+            sent = 0
+            for data in stream(conditions, fmt, columns):
+                if data:
+                    self.wfile.write(f"{len(data):X}\r\n".encode() + data + b"\r\n")
+                    sent += len(data)
+            self.wfile.write(b"0\r\n\r\n")
+            span.set(bytes=sent)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def serve():
+    """Start the export server once per process (a daemon thread)."""
+    global _server
+    with _server_lock:
+        if _server is None:
+            _server = ThreadingHTTPServer((HOST, PORT), _ExportHandler)
+            _server.daemon_threads = True
+            threading.Thread(target=_server.serve_forever, name="copilot-export", daemon=True).start()
+    return _server
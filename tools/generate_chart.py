@@ -1,27 +1,80 @@
 
-import seaborn as sns
-import matplotlib.pyplot as plt
 import pandas as pd
 import numpy as np
 import json
+import re
 from datetime import datetime
 import warnings
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
+from tools import result_store, async_runtime, tracing, query_backend
 warnings.filterwarnings('ignore')
 
-df = pd.read_csv("data/fintech_product_data.csv", parse_dates=["account_created_at", "feature_used_at"])
+def load_data():
+    # Share query_dataframe's parsed frame rather than reading the CSV a second time
+    from tools import query_dataframe
+    return query_dataframe.ensure_data()
 
-# Set style for better-looking charts
-sns.set_style("whitegrid")
-sns.set_palette("husl")
-plt.rcParams['figure.facecolor'] = 'white'
-plt.rcParams['axes.facecolor'] = 'white'
+# Same lazily loaded frame as query_dataframe; reload_data picks up the frame it re-read
+_data = query_backend.LazyFrame(globals(), load_data)
+ensure_data, needs_data, reload_data, backend = _data.ensure_data, _data.needs_data, _data.reload_data, _data.backend
+__getattr__ = _data.module_getattr
 
+# Where charts are written; background jobs redirect this so they never overwrite the user's chart.png
+_chart_output = ContextVar("chart_output", default="chart.png")
+
+@contextmanager
+def chart_output(path):
+    token = _chart_output.set(path)
+    try:
+        yield path
+    finally:
+        _chart_output.reset(token)
+
+def chart_path():
+    """Where the next chart will be written (chart.png unless redirected with chart_output)."""
+    return _chart_output.get()
+
+_style_lock = threading.Lock()
+_styled = False
+
+def _pyplot():
+    """``(pyplot, seaborn)``, imported on first use (they dominate startup) with the chart style applied once."""
+    global _styled
+    import matplotlib.pyplot as plt
+    import seaborn as sns
+    with _style_lock:
+        if not _styled:
+            # Set style for better-looking charts
+            sns.set_style("whitegrid")
+            sns.set_palette("husl")
+            plt.rcParams['figure.facecolor'] = 'white'
+            plt.rcParams['axes.facecolor'] = 'white'
+            _styled = True
+    return plt, sns
+
+def save_chart():
+    """Save the current figure to the active chart path and return that path."""
+    plt, _ = _pyplot()
+    path = chart_path()
+    with tracing.span("savefig", dpi=300, path=path):
+        plt.savefig(path, dpi=300, bbox_inches='tight')
+    plt.close()
+    return path
+
+@tracing.traced("smart_visualize")
 def smart_visualize(data_description):
     """
     Create intelligent visualizations based on data analysis context.
     Input should be a description of what to visualize.
     """
     try:
+        # Plot a Query DataFrame result directly when the description references one
+        stored = resolve_result_reference(data_description)
+        if stored is not None:
+            return create_result_visualization(*stored)
+
         # Parse the data description to determine best visualization
         description_lower = data_description.lower()
 
@@ -45,28 +98,82 @@ def smart_visualize(data_description):
     except Exception as e:
         return f"Visualization failed: {e}. Try describing what you'd like to see visualized."
 
+async def asmart_visualize(data_description):
+    """Async variant of smart_visualize; rendering runs on the single plotting thread."""
+    return await async_runtime.run_blocking(smart_visualize, data_description, pool="plot")
+
+RESULT_REF_PATTERN = re.compile(r"\bref:?\s*(r\d+)\b|^\s*(r\d+)\s*$", re.IGNORECASE)
+LAST_RESULT_PHRASES = ('last result', 'latest result', 'previous result', 'query result', 'last query')
+
+def resolve_result_reference(description):
+    """Return (label, frame) from the result store if the description points at one."""
+    match = RESULT_REF_PATTERN.search(description)
+    if match:
+        return result_store.get((match.group(1) or match.group(2)).lower())
+    if any(phrase in description.lower() for phrase in LAST_RESULT_PHRASES):
+        return result_store.get()
+    return None
+
+def create_result_visualization(label, result):
+    """Plot a stored query result as-is, so the chart matches the table the agent saw."""
+    plt, sns = _pyplot()
+    frame = result.to_frame() if isinstance(result, pd.Series) else result
+    frame = frame.select_dtypes(include=[np.number, 'bool']).astype(float)
+    if frame.empty:
+        return f"Visualization failed: result '{label}' has no numeric columns to plot."
+
+    if isinstance(frame.index, pd.MultiIndex):
+        # e.g. tier x segment: one grouped-bar panel per metric
+        panels = [(col, frame[col].unstack(fill_value=0)) for col in frame.columns[:4]]
+    else:
+        panels = [(col, frame[col]) for col in frame.columns[:4]]
+
+    is_time = isinstance(frame.index, (pd.PeriodIndex, pd.DatetimeIndex))
+    fig, axes = plt.subplots(1, len(panels), figsize=(8 * len(panels), 7), squeeze=False)
+    fig.suptitle(label, fontsize=16, fontweight='bold')
+
+    for ax, (col, data) in zip(axes[0], panels):
+        if is_time:
+            ax.plot(range(len(data)), data.values, marker='o', linewidth=2)
+            ax.set_xticks(range(len(data)))
+            ax.set_xticklabels(data.index.astype(str), rotation=45)
+            ax.grid(True, alpha=0.3)
+        elif isinstance(data, pd.DataFrame):
+            data.plot(kind='bar', ax=ax, color=sns.color_palette("viridis", len(data.columns)))
+            ax.tick_params(axis='x', rotation=45)
+        else:
+            ax.bar(data.index.astype(str), data.values, color=sns.color_palette("viridis", len(data)))
+            ax.tick_params(axis='x', rotation=45)
+        ax.set_title(str(col).replace('_', ' ').title())
+
+    plt.tight_layout()
+    return save_chart()
+
+@needs_data
 def create_churn_visualizations(description):
     """Create churn-focused visualizations."""
+    plt, sns = _pyplot()
     fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(16, 12))
     fig.suptitle('Churn Analysis Dashboard', fontsize=16, fontweight='bold')
+    data = backend()
 
     # 1. Churn rate by tier
-    churn_by_tier = df.groupby('account_tier')['churned'].mean()
+    churn_by_tier = data.group_agg('account_tier', {'churned': ('churned', 'mean')})['churned']
     ax1.bar(churn_by_tier.index, churn_by_tier.values, color=sns.color_palette("viridis", len(churn_by_tier)))
     ax1.set_title('Churn Rate by Account Tier')
     ax1.set_ylabel('Churn Rate')
     ax1.tick_params(axis='x', rotation=45)
 
     # 2. Churn rate by segment
-    churn_by_segment = df.groupby('customer_segment')['churned'].mean()
+    churn_by_segment = data.group_agg('customer_segment', {'churned': ('churned', 'mean')})['churned']
     ax2.bar(churn_by_segment.index, churn_by_segment.values, color=sns.color_palette("plasma", len(churn_by_segment)))
     ax2.set_title('Churn Rate by Customer Segment')
     ax2.set_ylabel('Churn Rate')
     ax2.tick_params(axis='x', rotation=45)
 
     # 3. Spending distribution: churned vs retained
-    churned_spend = df[df['churned'] == True]['monthly_spend']
-    retained_spend = df[df['churned'] == False]['monthly_spend']
+    churned_spend = data.column('monthly_spend', [('churned', '==', True)])
+    retained_spend = data.column('monthly_spend', [('churned', '==', False)])
     ax3.hist([retained_spend, churned_spend], bins=20, alpha=0.7, label=['Retained', 'Churned'], color=['green', 'red'])
     ax3.set_title('Monthly Spend Distribution: Churned vs Retained')
     ax3.set_xlabel('Monthly Spend ($)')
@@ -74,7 +181,7 @@ def create_churn_visualizations(description):
     ax3.legend()
 
     # 4. Feature usage and churn
-    feature_churn = df.groupby('product_feature_used')['churned'].mean().fillna(0)
+    feature_churn = data.group_agg('product_feature_used', {'churned': ('churned', 'mean')})['churned'].fillna(0)
     ax4.barh(range(len(feature_churn)), feature_churn.values, color=sns.color_palette("coolwarm", len(feature_churn)))
     ax4.set_yticks(range(len(feature_churn)))
     ax4.set_yticklabels(feature_churn.index)
@@ -82,35 +189,37 @@ def create_churn_visualizations(description):
     ax4.set_xlabel('Churn Rate')
 
     plt.tight_layout()
-    plt.savefig('chart.png', dpi=300, bbox_inches='tight')
-    plt.close()
-    return "chart.png"
+    return save_chart()
 
+@needs_data
 def create_revenue_visualizations(description):
     """Create revenue-focused visualizations."""
+    plt, sns = _pyplot()
     fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(16, 12))
     fig.suptitle('Revenue Analysis Dashboard', fontsize=16, fontweight='bold')
+    data = backend()
 
     # 1. Revenue by tier
-    revenue_by_tier = df.groupby('account_tier')['monthly_revenue'].sum()
+    revenue_by_tier = data.group_agg('account_tier', {'monthly_revenue': ('monthly_revenue', 'sum')})['monthly_revenue']
     ax1.pie(revenue_by_tier.values, labels=revenue_by_tier.index, autopct='%1.1f%%', startangle=90)
     ax1.set_title('Total Revenue Distribution by Tier')
 
     # 2. Average revenue per customer by segment
-    avg_revenue_segment = df.groupby('customer_segment')['monthly_revenue'].mean()
+    avg_revenue_segment = data.group_agg('customer_segment', {'monthly_revenue': ('monthly_revenue', 'mean')})['monthly_revenue']
     ax2.bar(avg_revenue_segment.index, avg_revenue_segment.values, color=sns.color_palette("viridis", len(avg_revenue_segment)))
     ax2.set_title('Average Revenue per Customer by Segment')
     ax2.set_ylabel('Average Revenue ($)')
     ax2.tick_params(axis='x', rotation=45)
 
     # 3. Revenue vs Spending scatter
-    ax3.scatter(df['monthly_spend'], df['monthly_revenue'], alpha=0.6, c=df['account_tier'].map({'Free': 0, 'Plus': 1, 'Premium': 2}), cmap='viridis')
+    points = data.select(['monthly_spend', 'monthly_revenue', 'account_tier'])
+    ax3.scatter(points['monthly_spend'], points['monthly_revenue'], alpha=0.6, c=points['account_tier'].map({'Free': 0, 'Plus': 1, 'Premium': 2}), cmap='viridis')
     ax3.set_xlabel('Monthly Spend ($)')
     ax3.set_ylabel('Monthly Revenue ($)')
     ax3.set_title('Revenue vs Spending Relationship')
 
     # 4. Revenue by feature usage
-    feature_revenue = df.groupby('product_feature_used')['monthly_revenue'].sum().fillna(0)
+    feature_revenue = data.group_agg('product_feature_used', {'monthly_revenue': ('monthly_revenue', 'sum')})['monthly_revenue'].fillna(0)
     ax4.barh(range(len(feature_revenue)), feature_revenue.values, color=sns.color_palette("plasma", len(feature_revenue)))
     ax4.set_yticks(range(len(feature_revenue)))
     ax4.set_yticklabels(feature_revenue.index)
@@ -118,18 +227,19 @@ def create_revenue_visualizations(description):
     ax4.set_xlabel('Total Revenue ($)')
 
     plt.tight_layout()
-    plt.savefig('chart.png', dpi=300, bbox_inches='tight')
-    plt.close()
-    return "chart.png"
+    return save_chart()
 
+@needs_data
 def create_spending_visualizations(description):
     """Create spending-focused visualizations."""
+    plt, sns = _pyplot()
     fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(16, 12))
     fig.suptitle('Spending Analysis Dashboard', fontsize=16, fontweight='bold')
+    data = backend()
 
     # 1. Spending distribution by tier
-    for tier in df['account_tier'].unique():
-        tier_data = df[df['account_tier'] == tier]['monthly_spend']
+    for tier in data.unique('account_tier'):
+        tier_data = data.column('monthly_spend', [('account_tier', '==', tier)])
         ax1.hist(tier_data, alpha=0.6, label=tier, bins=20)
     ax1.set_title('Spending Distribution by Tier')
     ax1.set_xlabel('Monthly Spend ($)')
@@ -137,40 +247,42 @@ def create_spending_visualizations(description):
     ax1.legend()
 
     # 2. Average spending by segment
-    avg_spend_segment = df.groupby('customer_segment')['monthly_spend'].mean()
+    avg_spend_segment = data.group_agg('customer_segment', {'monthly_spend': ('monthly_spend', 'mean')})['monthly_spend']
     ax2.bar(avg_spend_segment.index, avg_spend_segment.values, color=sns.color_palette("coolwarm", len(avg_spend_segment)))
     ax2.set_title('Average Spending by Customer Segment')
     ax2.set_ylabel('Average Spend ($)')
     ax2.tick_params(axis='x', rotation=45)
 
     # 3. Spending vs Transactions
-    ax3.scatter(df['transactions_count'], df['monthly_spend'], alpha=0.6, c=df['customer_segment'].map({'Student': 0, 'Professional': 1, 'Retired': 2}), cmap='Set1')
+    points = data.select(['transactions_count', 'monthly_spend', 'customer_segment', 'account_tier'])
+    ax3.scatter(points['transactions_count'], points['monthly_spend'], alpha=0.6, c=points['customer_segment'].map({'Student': 0, 'Professional': 1, 'Retired': 2}), cmap='Set1')
     ax3.set_xlabel('Transaction Count')
     ax3.set_ylabel('Monthly Spend ($)')
     ax3.set_title('Spending vs Transaction Count')
 
     # 4. Top spenders by tier (boxplot)
-    sns.boxplot(data=df, x='account_tier', y='monthly_spend', ax=ax4)
+    sns.boxplot(data=points, x='account_tier', y='monthly_spend', ax=ax4)
     ax4.set_title('Spending Distribution by Tier (Boxplot)')
     ax4.set_ylabel('Monthly Spend ($)')
 
     plt.tight_layout()
-    plt.savefig('chart.png', dpi=300, bbox_inches='tight')
-    plt.close()
-    return "chart.png"
+    return save_chart()
 
+@needs_data
 def create_feature_visualizations(description):
     """Create feature usage visualizations."""
+    plt, sns = _pyplot()
     fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(16, 12))
     fig.suptitle('Feature Usage Analysis', fontsize=16, fontweight='bold')
+    data = backend()
 
     # 1. Feature popularity
-    feature_counts = df['product_feature_used'].value_counts()
+    feature_counts = data.value_counts('product_feature_used')
     ax1.pie(feature_counts.values, labels=feature_counts.index, autopct='%1.1f%%', startangle=90)
     ax1.set_title('Feature Usage Distribution')
 
     # 2. Feature usage by tier
-    feature_tier = pd.crosstab(df['product_feature_used'], df['account_tier'])
+    feature_tier = data.crosstab('product_feature_used', 'account_tier')
     feature_tier.plot(kind='bar', stacked=True, ax=ax2, color=sns.color_palette("viridis", 3))
     ax2.set_title('Feature Usage by Account Tier')
     ax2.set_ylabel('Count')
@@ -178,7 +290,7 @@ def create_feature_visualizations(description):
     ax2.legend(title='Account Tier')
 
     # 3. Average revenue by feature
-    feature_revenue = df.groupby('product_feature_used')['monthly_revenue'].mean()
+    feature_revenue = data.group_agg('product_feature_used', {'monthly_revenue': ('monthly_revenue', 'mean')})['monthly_revenue']
     ax3.bar(range(len(feature_revenue)), feature_revenue.values, color=sns.color_palette("plasma", len(feature_revenue)))
     ax3.set_xticks(range(len(feature_revenue)))
     ax3.set_xticklabels(feature_revenue.index, rotation=45)
@@ -186,7 +298,7 @@ def create_feature_visualizations(description):
     ax3.set_ylabel('Average Revenue ($)')
 
     # 4. Feature vs Spending correlation
-    feature_spend = df.groupby('product_feature_used')['monthly_spend'].mean()
+    feature_spend = data.group_agg('product_feature_used', {'monthly_spend': ('monthly_spend', 'mean')})['monthly_spend']
     ax4.barh(range(len(feature_spend)), feature_spend.values, color=sns.color_palette("coolwarm", len(feature_spend)))
     ax4.set_yticks(range(len(feature_spend)))
     ax4.set_yticklabels(feature_spend.index)
@@ -194,19 +306,19 @@ def create_feature_visualizations(description):
     ax4.set_xlabel('Average Spend ($)')
 
     plt.tight_layout()
-    plt.savefig('chart.png', dpi=300, bbox_inches='tight')
-    plt.close()
-    return "chart.png"
+    return save_chart()
 
+@needs_data
 def create_trend_visualizations(description):
     """Create trend and time-based visualizations."""
-    df['month_year'] = df['account_created_at'].dt.to_period('M')
+    plt, _ = _pyplot()
+    data = backend()
 
     fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(16, 12))
     fig.suptitle('Trends and Time Analysis', fontsize=16, fontweight='bold')
 
     # 1. Customer signups over time
-    monthly_signups = df.groupby('month_year').size()
+    monthly_signups = data.time_agg('account_created_at', {'signups': ('customer_id', 'size')})['signups']
     ax1.plot(range(len(monthly_signups)), monthly_signups.values, marker='o', linewidth=2)
     ax1.set_title('Customer Signups Over Time')
     ax1.set_ylabel('New Customers')
@@ -214,7 +326,8 @@ def create_trend_visualizations(description):
     ax1.grid(True, alpha=0.3)
 
     # 2. Revenue trends by tier
-    revenue_trends = df.groupby(['month_year', 'account_tier'])['monthly_revenue'].sum().unstack(fill_value=0)
+    revenue_trends = data.time_agg('account_created_at', {'monthly_revenue': ('monthly_revenue', 'sum')},
+                                   by='account_tier')['monthly_revenue'].unstack(fill_value=0)
     for tier in revenue_trends.columns:
         ax2.plot(range(len(revenue_trends)), revenue_trends[tier], marker='o', label=tier, linewidth=2)
     ax2.set_title('Revenue Trends by Tier')
@@ -224,7 +337,7 @@ def create_trend_visualizations(description):
     ax2.grid(True, alpha=0.3)
 
     # 3. Churn rate trends
-    churn_trends = df.groupby('month_year')['churned'].mean()
+    churn_trends = data.time_agg('account_created_at', {'churned': ('churned', 'mean')})['churned']
     ax3.plot(range(len(churn_trends)), churn_trends.values, marker='o', color='red', linewidth=2)
     ax3.set_title('Churn Rate Trends')
     ax3.set_ylabel('Churn Rate')
@@ -232,7 +345,8 @@ def create_trend_visualizations(description):
     ax3.grid(True, alpha=0.3)
 
     # 4. Feature adoption over time
-    feature_time = df.groupby(['month_year', 'product_feature_used']).size().unstack(fill_value=0)
+    feature_time = data.time_agg('account_created_at', {'usage': ('customer_id', 'size')},
+                                 by='product_feature_used')['usage'].unstack(fill_value=0)
     feature_time.plot(kind='area', stacked=True, ax=ax4, alpha=0.7)
     ax4.set_title('Feature Adoption Over Time')
     ax4.set_ylabel('Usage Count')
@@ -240,21 +354,22 @@ def create_trend_visualizations(description):
     ax4.legend(bbox_to_anchor=(1.05, 1), loc='upper left')
 
     plt.tight_layout()
-    plt.savefig('chart.png', dpi=300, bbox_inches='tight')
-    plt.close()
-    return "chart.png"
+    return save_chart()
 
+@needs_data
 def create_comparison_visualizations(description):
     """Create comparison-focused visualizations."""
+    plt, _ = _pyplot()
     fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(16, 12))
     fig.suptitle('Comparative Analysis Dashboard', fontsize=16, fontweight='bold')
+    data = backend()
 
     # 1. Tier comparison heatmap
-    tier_metrics = df.groupby('account_tier').agg({
-        'monthly_spend': 'mean',
-        'monthly_revenue': 'mean',
-        'churned': 'mean',
-        'transactions_count': 'mean'
+    tier_metrics = data.group_agg('account_tier', {
+        'monthly_spend': ('monthly_spend', 'mean'),
+        'monthly_revenue': ('monthly_revenue', 'mean'),
+        'churned': ('churned', 'mean'),
+        'transactions_count': ('transactions_count', 'mean')
     }).round(2)
 
     im1 = ax1.imshow(tier_metrics.T, cmap='viridis', aspect='auto')
@@ -266,10 +381,10 @@ def create_comparison_visualizations(description):
     plt.colorbar(im1, ax=ax1)
 
     # 2. Segment comparison
-    segment_metrics = df.groupby('customer_segment').agg({
-        'monthly_spend': 'mean',
-        'monthly_revenue': 'mean',
-        'churned': 'mean'
+    segment_metrics = data.group_agg('customer_segment', {
+        'monthly_spend': ('monthly_spend', 'mean'),
+        'monthly_revenue': ('monthly_revenue', 'mean'),
+        'churned': ('churned', 'mean')
     })
 
     x = np.arange(len(segment_metrics.index))
@@ -284,9 +399,9 @@ def create_comparison_visualizations(description):
     ax2.legend()
 
     # 3. Card type performance
-    card_performance = df.groupby('card_type').agg({
-        'monthly_spend': 'mean',
-        'monthly_revenue': 'mean'
+    card_performance = data.group_agg('card_type', {
+        'monthly_spend': ('monthly_spend', 'mean'),
+        'monthly_revenue': ('monthly_revenue', 'mean')
     })
 
     ax3.scatter(card_performance['monthly_spend'], card_performance['monthly_revenue'],
@@ -298,7 +413,7 @@ def create_comparison_visualizations(description):
     ax3.set_title('Card Type Performance Matrix')
 
     # 4. Feature vs Tier matrix
-    feature_tier_matrix = pd.crosstab(df['product_feature_used'], df['account_tier'], normalize='columns')
+    feature_tier_matrix = data.crosstab('product_feature_used', 'account_tier', normalize='columns')
     im4 = ax4.imshow(feature_tier_matrix.values, cmap='Blues', aspect='auto')
     ax4.set_xticks(range(len(feature_tier_matrix.columns)))
     ax4.set_xticklabels(feature_tier_matrix.columns)
@@ -308,30 +423,32 @@ def create_comparison_visualizations(description):
     plt.colorbar(im4, ax=ax4)
 
     plt.tight_layout()
-    plt.savefig('chart.png', dpi=300, bbox_inches='tight')
-    plt.close()
-    return "chart.png"
+    return save_chart()
 
+@needs_data
 def create_overview_dashboard():
     """Create a comprehensive overview dashboard."""
+    plt, _ = _pyplot()
     fig, ((ax1, ax2), (ax3, ax4)) = plt.subplots(2, 2, figsize=(16, 12))
     fig.suptitle('Fintech Business Overview Dashboard', fontsize=16, fontweight='bold')
+    data = backend()
 
     # 1. Customer distribution by tier
-    tier_counts = df['account_tier'].value_counts()
+    tier_counts = data.value_counts('account_tier')
     ax1.pie(tier_counts.values, labels=tier_counts.index, autopct='%1.1f%%', startangle=90)
     ax1.set_title('Customer Distribution by Tier')
 
     # 2. Revenue and spend correlation
-    ax2.scatter(df['monthly_spend'], df['monthly_revenue'], alpha=0.6, c=df['churned'].map({False: 'green', True: 'red'}))
+    points = data.select(['monthly_spend', 'monthly_revenue', 'churned'])
+    ax2.scatter(points['monthly_spend'], points['monthly_revenue'], alpha=0.6, c=points['churned'].map({False: 'green', True: 'red'}))
     ax2.set_xlabel('Monthly Spend ($)')
     ax2.set_ylabel('Monthly Revenue ($)')
     ax2.set_title('Revenue vs Spend (Red=Churned)')
 
     # 3. Key metrics by segment
-    segment_summary = df.groupby('customer_segment').agg({
-        'monthly_spend': 'mean',
-        'churned': 'mean'
+    segment_summary = data.group_agg('customer_segment', {
+        'monthly_spend': ('monthly_spend', 'mean'),
+        'churned': ('churned', 'mean')
     })
 
     x = np.arange(len(segment_summary.index))
@@ -346,19 +463,19 @@ def create_overview_dashboard():
     ax3.set_title('Spending and Churn by Segment')
 
     # 4. Account status overview
-    status_counts = df['account_status'].value_counts()
+    status_counts = data.value_counts('account_status')
     ax4.bar(status_counts.index, status_counts.values, color=['green', 'orange', 'red'])
     ax4.set_title('Account Status Distribution')
     ax4.set_ylabel('Count')
 
     plt.tight_layout()
-    plt.savefig('chart.png', dpi=300, bbox_inches='tight')
-    plt.close()
-    return "chart.png"
+    return save_chart()
 
 # Legacy function for backwards compatibility
+@needs_data
 def generate_chart(x_col, y_col, chart_type="bar"):
     """Legacy chart generation function."""
+    plt, sns = _pyplot()
     try:
         plt.figure(figsize=(12, 8))
         if chart_type == "bar":
@@ -379,8 +496,6 @@ def generate_chart(x_col, y_col, chart_type="bar"):
         plt.title(f"{chart_type.title()} Chart: {y_col} by {x_col}", fontsize=14, fontweight='bold')
         plt.xticks(rotation=45)
         plt.tight_layout()
-        plt.savefig('chart.png', dpi=300, bbox_inches='tight')
-        plt.close()
-        return "chart.png"
+        return save_chart()
     except Exception as e:
         return f"Chart generation failed: {e}"
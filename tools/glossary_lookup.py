@@ -1,23 +1,313 @@
-
+import difflib
+import hashlib
 import json
+import math
+import os
+import re
+import shutil
+import threading
+import uuid
+import faiss
+import numpy as np
+from langchain.schema import Document
+from langchain_community.docstore.in_memory import InMemoryDocstore
 from langchain_community.vectorstores import FAISS
-from langchain_openai import OpenAIEmbeddings
 from dotenv import load_dotenv
+from collections import Counter
+from tools import async_runtime, tracing, llm_replay
 
 load_dotenv()
 
-with open("data/fintech_glossary.json") as f:
-    glossary = json.load(f)
+GLOSSARY_PATH = "data/fintech_glossary.json"
+# Built indexes live in INDEX_DIR/<hash of glossary file + embedding model>/
+INDEX_DIR = os.getenv("GLOSSARY_INDEX_DIR", ".cache/glossary_index")
+
+def load_glossary(path=None):
+    with open(path or GLOSSARY_PATH) as f:
+        return json.load(f)
 
+glossary = load_glossary()
 texts = [f"{k}: {v}" for k,v in glossary.items()]
-embedding_model = OpenAIEmbeddings()
+_embedding_model = None  # built on first use; the OpenAI client is slow to import
+
+_index = None  # (key, FAISS store)
+_index_lock = threading.Lock()
+_content_cache = (None, None)  # (file signature, content hash)
+
+def get_embedding_model():
+    global _embedding_model
+    if _embedding_model is None:
+        _embedding_model = llm_replay.embedding_model()
+    return _embedding_model
+
+def embedding_name():
+    model = get_embedding_model()
+    return getattr(model, "model", None) or f"{type(model).__name__}-{getattr(model, 'dim', '')}"
+
+def content_hash(path=None):
+    """Hash of the glossary file's content; re-hashed only when the file changes."""
+    global _content_cache
+    path = path or GLOSSARY_PATH
+    stat = os.stat(path)
+    signature = (stat.st_size, stat.st_mtime_ns)
+    if _content_cache[0] != signature:
+        with open(path, "rb") as f:
+            _content_cache = (signature, hashlib.sha256(f.read()).hexdigest()[:16])
+    return _content_cache[1]
+
+def index_key(path=None):
+    """Key of the vector index: the glossary content plus the embedding model (which this creates)."""
+    return hashlib.sha256(f"{content_hash(path)}|{embedding_name()}".encode()).hexdigest()[:16]
+
+def _entry_hash(text):
+    return hashlib.sha1(f"{embedding_name()}|{text}".encode()).hexdigest()[:16]
+
+def _vector_cache_paths():
+    slug = re.sub(r"[^\w.-]", "_", embedding_name())
+    return os.path.join(INDEX_DIR, f"vectors-{slug}.npy"), os.path.join(INDEX_DIR, f"vectors-{slug}.json")
+
+def _cached_vectors():
+    """Per-entry vectors from the previous build with this model: {entry hash: vector}."""
+    vectors_path, hashes_path = _vector_cache_paths()
+    if not (os.path.exists(vectors_path) and os.path.exists(hashes_path)):
+        return {}
+    with open(hashes_path) as f:
+        hashes = json.load(f)
+    vectors = np.load(vectors_path, mmap_mode="r")
+    return dict(zip(hashes, vectors)) if len(hashes) == len(vectors) else {}
+
+def _save_atomic(path, write):
+    tmp = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp, "wb") as f:
+        write(f)
+    os.replace(tmp, path)
+
+def build_glossary_index(directory, entries):
+    """Embed only entries not seen in the previous build, then write the FAISS index and docstore."""
+    with tracing.span("glossary_index_build", entries=len(entries)) as span:
+        hashes = [_entry_hash(text) for text in entries]
+        known = _cached_vectors()
+        missing = [text for text, h in zip(entries, hashes) if h not in known]
+        if missing:
+            fresh = get_embedding_model().embed_documents(missing)
+            known.update(zip((_entry_hash(text) for text in missing), fresh))
+        span.set(embedded=len(missing), reused=len(entries) - len(missing))
+
+        vectors = np.array([known[h] for h in hashes], dtype=np.float32)
+        index = faiss.IndexFlatL2(vectors.shape[1])
+        index.add(vectors)
+
+        # Write into a private directory and rename it into place, so a concurrent builder never sees a partial index
+        os.makedirs(INDEX_DIR, exist_ok=True)
+        tmp = f"{directory}.{uuid.uuid4().hex}.tmp"
+        os.makedirs(tmp)
+        faiss.write_index(index, os.path.join(tmp, "index.faiss"))
+        with open(os.path.join(tmp, "docstore.json"), "w") as f:
+            json.dump(entries, f)
+        try:
+            os.rename(tmp, directory)
+        except OSError:
+            shutil.rmtree(tmp, ignore_errors=True)  # another process finished first
+
+        vectors_path, hashes_path = _vector_cache_paths()
+        _save_atomic(vectors_path, lambda f: np.save(f, vectors))
+        _save_atomic(hashes_path, lambda f: f.write(json.dumps(hashes).encode()))
+
+def load_glossary_index(directory):
+    """Open a built index; the vectors are memory-mapped rather than read into memory."""
+    path = os.path.join(directory, "index.faiss")
+    try:
+        index = faiss.read_index(path, faiss.IO_FLAG_MMAP | faiss.IO_FLAG_READ_ONLY)
+    except RuntimeError:
+        index = faiss.read_index(path)  # index type without mmap support
+    with open(os.path.join(directory, "docstore.json")) as f:
+        entries = json.load(f)
+    docstore = InMemoryDocstore({str(i): Document(page_content=text) for i, text in enumerate(entries)})
+    return FAISS(get_embedding_model(), index, docstore, {i: str(i) for i in range(len(entries))})
+
+def get_index():
+    """The glossary index for the current file and model: loaded from disk, or built once if missing."""
+    global _index, glossary, texts
+    key = index_key()
+    current = _index
+    if current is not None and current[0] == key:
+        return current[1]
+    with _index_lock:
+        if _index is None or _index[0] != key:
+            directory = os.path.join(INDEX_DIR, key)
+            glossary = load_glossary()
+            texts = [f"{k}: {v}" for k,v in glossary.items()]
+            if not os.path.exists(os.path.join(directory, "index.faiss")):
+                build_glossary_index(directory, texts)
+            _index = (key, load_glossary_index(directory))
+        return _index[1]
+
+# Well-known abbreviations and phrasings that don't appear in the entries themselves
+SYNONYMS = {
+    "ltv": "cltv", "clv": "cltv", "lifetime value": "cltv",
+    "nrr": "net_revenue_retention", "net dollar retention": "net_revenue_retention", "ndr": "net_revenue_retention",
+    "nps": "nps_score", "net promoter score": "nps_score",
+    "aml": "fincrime_flag", "fraud flag": "fincrime_flag",
+    "churn": "churned", "churn rate": "churned", "attrition": "churned",
+    "know your customer": "kyc_completed", "kyc": "kyc_completed", "pending kyc": "kyc_pending_users",
+    "declines": "decline_rate", "tier": "account_tier", "segment": "customer_segment",
+    "spend": "monthly_spend", "revenue": "monthly_revenue", "transactions": "transactions_count",
+    "aov": "avg_spend_per_txn", "average transaction value": "avg_spend_per_txn",
+    "monthly active users": "mau", "active users": "mau",
+}
+STOPWORDS = {"what", "whats", "is", "are", "the", "a", "an", "of", "does", "do", "mean", "means", "meaning",
+             "define", "definition", "explain", "our", "by", "for", "to", "in", "on", "and", "or", "how", "we",
+             "i", "me", "tell", "about", "term", "metric", "please"}
+FUZZY_CUTOFF = 0.85
+# BM25 hits scoring below this are treated as weak and the vector index is consulted
+BM25_MIN_SCORE = float(os.getenv("GLOSSARY_BM25_MIN_SCORE", "2.5"))
+# A strong BM25 hit still needs to cover this share of the query's terms (and two of them, unless the
+# query has one), so a single shared word like "users" cannot stand in for a semantic match
+BM25_MIN_COVERAGE = 0.5
 
-def build_glossary_index():
-    return FAISS.from_texts(texts, embedding_model)
+def _normalize(text):
+    return re.sub(r"\s+", " ", re.sub(r"[^a-z0-9]+", " ", str(text).lower())).strip()
 
+def _tokens(text):
+    return [t for t in _normalize(text).split() if t not in STOPWORDS]
+
+class LexicalIndex:
+    """Exact/alias lookup, fuzzy matching and BM25 over the glossary entries; no network."""
+
+    def __init__(self, entries, k1=1.5, b=0.75):
+        self.terms = list(entries)
+        self.texts = [f"{k}: {v}" for k, v in entries.items()]
+        self.aliases = {}
+        for i, (term, definition) in enumerate(entries.items()):
+            self.aliases.setdefault(_normalize(term), i)
+            # "cltv: Customer Lifetime Value: ..." -> "customer lifetime value"
+            expansion = re.match(r"([A-Z][\w ]+?):", definition)
+            if expansion:
+                self.aliases.setdefault(_normalize(expansion.group(1)), i)
+        for alias, term in SYNONYMS.items():
+            if term in entries:
+                self.aliases.setdefault(_normalize(alias), self.terms.index(term))
+
+        docs = [_tokens(term) * 2 + _tokens(definition) for term, definition in entries.items()]
+        self.k1, self.b = k1, b
+        self.doc_freqs = [Counter(doc) for doc in docs]
+        self.doc_lens = np.array([len(doc) for doc in docs], dtype=np.float32)
+        self.avg_len = float(self.doc_lens.mean()) if docs else 0.0
+        df = Counter(token for doc in docs for token in set(doc))
+        self.idf = {t: math.log(1 + (len(docs) - n + 0.5) / (n + 0.5)) for t, n in df.items()}
+
+    def exact(self, query):
+        normalized = _normalize(query)
+        for candidate in (normalized, " ".join(_tokens(query)), normalized.rstrip("s")):
+            if candidate in self.aliases:
+                return self.aliases[candidate]
+        return None
+
+    def fuzzy(self, query):
+        """Closest alias by edit similarity, for typos like 'declne rate' or 'cltvv'."""
+        candidate = " ".join(_tokens(query))
+        if not candidate or len(candidate.split()) > 4:
+            return None, 0.0
+        match = difflib.get_close_matches(candidate, list(self.aliases), n=1, cutoff=FUZZY_CUTOFF)
+        if not match:
+            return None, 0.0
+        return self.aliases[match[0]], difflib.SequenceMatcher(None, candidate, match[0]).ratio()
+
+    def bm25(self, query):
+        scores = np.zeros(len(self.texts), dtype=np.float32)
+        norm = self.k1 * (1 - self.b + self.b * self.doc_lens / (self.avg_len or 1))
+        for token in set(_tokens(query)):
+            idf = self.idf.get(token)
+            if idf is None:
+                continue
+            tf = np.array([freqs[token] for freqs in self.doc_freqs], dtype=np.float32)
+            scores += idf * tf * (self.k1 + 1) / (tf + norm)
+        return scores
+
+    def coverage(self, query, i):
+        """``(matched, total)`` distinct query terms found in entry ``i``."""
+        terms = set(_tokens(query))
+        return sum(t in self.doc_freqs[i] for t in terms), len(terms)
+
+_lexical = None  # (content hash, LexicalIndex)
+
+def get_lexical_index():
+    """Lexical index for the current glossary file; needs no embedding model."""
+    global _lexical
+    key = content_hash()
+    current = _lexical
+    if current is None or current[0] != key:
+        current = _lexical = (key, LexicalIndex(load_glossary()))
+    return current[1]
+
+def _hit(lexical, i, score, method):
+    term = lexical.terms[i]
+    return {"term": term, "text": lexical.texts[i], "score": round(float(score), 4), "method": method}
+
+def _lexical_hits(lexical, query, k):
+    """Ranked lexical hits and whether they are confident enough to skip vector search."""
+    hits = {}
+    exact = lexical.exact(query)
+    if exact is not None:
+        hits[exact] = (1.0, "exact")
+    else:
+        fuzzy, ratio = lexical.fuzzy(query)
+        if fuzzy is not None:
+            hits[fuzzy] = (ratio * 0.95, "fuzzy")
+    scores = lexical.bm25(query)
+    for i in np.argsort(-scores)[:k]:
+        if scores[i] > 0 and i not in hits:
+            hits[int(i)] = (scores[i] / (scores[i] + BM25_MIN_SCORE) * 0.9, "bm25")
+    confident = exact is not None or any(method == "fuzzy" for _, method in hits.values())
+    if not confident and len(scores) and scores.max() >= BM25_MIN_SCORE:
+        matched, total = lexical.coverage(query, int(np.argmax(scores)))
+        confident = matched >= min(2, total) and matched / total >= BM25_MIN_COVERAGE
+    ranked = sorted(hits.items(), key=lambda item: -item[1][0])[:k]
+    return [_hit(lexical, i, score, method) for i, (score, method) in ranked], confident
+
+@tracing.traced("glossary_search_batch")
+def search_terms(queries, k=1):
+    """Top-k glossary entries for each query: ``[[{term, text, score, method}, ...], ...]``.
+
+    Exact terms, abbreviations, synonyms, typos and keyword queries are answered
+    from the in-memory lexical index; only the remaining semantic queries are
+    embedded, in a single batched call, and searched in the vector index.
+    """
+    lexical = get_lexical_index()
+    results, pending = [], []
+    for i, query in enumerate(queries):
+        hits, confident = _lexical_hits(lexical, query, k)
+        results.append(hits)
+        if not confident:
+            pending.append(i)
+
+    tracing.annotate(queries=len(queries), vector_queries=len(pending))
+    if pending:
+        index = get_index()
+        vectors = get_embedding_model().embed_documents([queries[i] for i in pending])
+        for i, vector in zip(pending, vectors):
+            seen = {hit["term"] for hit in results[i]}
+            for doc, distance in index.similarity_search_with_score_by_vector(vector, k=k):
+                term = doc.page_content.split(":", 1)[0]
+                if term not in seen:
+                    results[i].append({"term": term, "text": doc.page_content,
+                                       "score": round(1 / (1 + float(distance)), 4), "method": "vector"})
+            results[i] = sorted(results[i], key=lambda hit: -hit["score"])[:k]
+    return results
+
+def search(query, k=1):
+    """Ranked top-k matches for one query, with scores and the stage that found each."""
+    return search_terms([query], k)[0]
+
+@tracing.traced("glossary_search")
 def search_term(term):
-    if not hasattr(search_term, "index"):
-        search_term.index = build_glossary_index()
-    index = search_term.index
-    results = index.similarity_search(term, k=1)
-    return results[0].page_content if results else "No glossary match found."
+    # "CLTV, CAC and NRR" -> one batched lookup, one definition per line
+    parts = [p.strip() for p in re.split(r",|;|\band\b|\n", term) if p.strip()]
+    queries = parts if len(parts) > 1 and all(len(p.split()) <= 3 for p in parts) else [term]
+    results = search_terms(queries, k=1)
+    lines = [hits[0]["text"] for hits in results if hits]
+    return "\n".join(dict.fromkeys(lines)) if lines else "No glossary match found."
+
+async def asearch_term(term):
+    """Async variant of search_term; any embedding and FAISS search run on the shared CPU pool."""
+    return await async_runtime.run_blocking(search_term, term)
@@ -0,0 +1,255 @@
+"""Local weighted-rule intent classifier for the Smart Analyzer.
+
+Produces the same JSON plan as the LLM analyzer (plus a ``confidence``
+score) in well under a millisecond, so `smart_analyzer.analyze_question`
+only needs GPT-4o for questions the rules can't place confidently.
+
+Run ``python -m tools.intent_classifier`` for an accuracy/latency report
+against the labeled questions in data/intent_eval_questions.json.
+"""
+import json
+import math
+import re
+import sys
+import time
+
+import numpy as np
+
+# Topic intents compete with each other; the winner decides the data focus.
+TOPICS = {
+    "churn_analysis": {
+        "keywords": {"churn": 2.0, "churned": 2.0, "churning": 2.0, "attrition": 2.0, "retention": 2.0,
+                     "retain": 1.5, "leave": 1.5, "leaving": 1.5, "quit": 1.0, "cancel": 1.0, "lose": 0.8,
+                     "losing": 0.8, "lost": 0.8},
+        "focus": "customer churn",
+        "metrics": ["churn_rate", "retention_rate", "churned_customers"],
+        "visualization": "bar",
+        "query": "churn rate by {dim}",
+        "context": "Churn directly erodes recurring revenue; finding high-risk cohorts guides retention spend.",
+    },
+    "revenue_analysis": {
+        "keywords": {"revenue": 2.0, "arpu": 2.0, "mrr": 2.0, "profit": 1.5, "monetization": 1.5,
+                     "money": 1.0, "income": 1.0, "earnings": 1.0, "earn": 1.0, "make": 0.3},
+        "focus": "monthly revenue",
+        "metrics": ["total_revenue", "avg_revenue", "revenue_per_customer"],
+        "visualization": "bar",
+        "query": "revenue analysis by {dim}",
+        "context": "Revenue mix by tier and segment shows where monetization is working and where to upsell.",
+    },
+    "spending_analysis": {
+        "keywords": {"spend": 2.0, "spending": 2.0, "spent": 2.0, "spenders": 2.0, "transactions": 1.5,
+                     "transaction": 1.5, "purchases": 1.0, "card": 0.5, "decline": 1.0, "declines": 1.0},
+        "focus": "monthly spend and transactions",
+        "metrics": ["avg_spend", "median_spend", "transactions_count"],
+        "visualization": "bar",
+        "query": "spending by {dim}",
+        "context": "Card spend drives interchange revenue and is an early signal of engagement.",
+    },
+    "feature_analysis": {
+        "keywords": {"feature": 2.0, "features": 2.0, "adoption": 1.5, "usage": 1.0, "popular": 1.0,
+                     "used": 0.5, "product": 0.5, "cryptorewards": 2.0, "roundups": 2.0, "directdeposit": 2.0,
+                     "billpay": 2.0, "savingsvault": 2.0},
+        "focus": "product feature usage",
+        "metrics": ["feature_usage_count", "avg_revenue_by_feature", "churn_rate_by_feature"],
+        "visualization": "bar",
+        "query": "feature usage",
+        "context": "Feature adoption shows which products create value and which drive retention.",
+    },
+    "segment_analysis": {
+        "keywords": {"segment": 1.5, "segments": 1.5, "segmentation": 1.5, "demographics": 1.5,
+                     "customer": 0.5, "customers": 0.5, "users": 0.3, "student": 1.0, "students": 1.0,
+                     "professional": 1.0, "professionals": 1.0, "retired": 1.0, "tier": 0.5, "tiers": 0.5,
+                     "status": 0.8, "active": 0.8},
+        "focus": "customer segments and tiers",
+        "metrics": ["customers", "avg_spend", "avg_revenue", "churn_rate"],
+        "visualization": "bar",
+        "query": "segment analysis",
+        "context": "Segment economics decide where to focus acquisition and product investment.",
+    },
+}
+
+# Shape intents override the topic but keep it as the data focus.
+SHAPES = {
+    "prediction": {"predict": 2.0, "prediction": 2.0, "forecast": 2.0, "likely to": 1.5, "about to": 1.5,
+                   "will": 0.8, "next month": 1.0, "next quarter": 1.0, "at risk": 1.5, "risk": 0.8,
+                   "what if": 2.0, "what happens": 1.5, "scenario": 2.0, "simulate": 2.0},
+    "trend_analysis": {"trend": 2.0, "trends": 2.0, "over time": 2.0, "monthly": 0.8, "growth": 1.5,
+                       "month over month": 2.0, "by month": 2.0, "signups": 1.5, "signup": 1.5,
+                       "timeline": 1.5, "history": 1.0, "last 12 months": 2.0},
+    "comparison": {"compare": 2.0, "comparison": 2.0, "vs": 2.0, "versus": 2.0, "difference": 1.5,
+                   "differ": 1.5, "between": 0.8, "against": 0.8, "better": 0.5, "worse": 0.5},
+}
+SHAPE_PRECEDENCE = ["prediction", "trend_analysis", "comparison"]
+SHAPE_VISUALIZATION = {"prediction": "bar", "trend_analysis": "line", "comparison": "bar"}
+
+DEFINITION_PHRASES = ("define", "definition", "meaning of", "stand for", "stands for", "what does")
+GLOSSARY_ABBREVIATIONS = {"cltv", "ltv", "cac", "nrr", "arr", "kyc", "dau", "mau"}
+# Questions for the churn-risk index (query_dataframe routes on the same test): "at risk" must be about
+# customers ("at-risk users", "who is at risk"), so "revenue at risk" stays a revenue question
+CHURN_RISK_PHRASES = ("about to churn", "likely to churn", "churn risk", "risk of churn")
+AT_RISK_CUSTOMERS = re.compile(r"\bat[- ]risk\s+(?:\w+\s+)?(?:customers?|users?|accounts?)\b"
+                               r"|\b(?:customers?|users?|accounts?|who)\b(?:\s+\w+){0,3}\s+at[- ]risk\b")
+ANOMALY_WORDS = ("unusual", "anomaly", "anomalies", "anomalous", "outlier", "outliers", "abnormal", "spike", "spikes")
+
+DIMENSIONS = {
+    "tier": ("tier", "tiers", "free", "plus", "premium"),
+    "segment": ("segment", "segments", "student", "students", "professional", "professionals", "retired"),
+    "feature": ("feature", "features", "by feature"),
+}
+COMPREHENSIVE_WORDS = ("why", "driving", "drivers", "driver", "cause", "causes", "root cause", "deep dive")
+SUMMARY_WORDS = ("quick", "overview", "summary", "snapshot", "at a glance")
+
+DEFAULT_MIN_CONFIDENCE = 0.6
+
+
+def is_churn_risk_question(question):
+    """True for "who is about to churn" / "at-risk customers" questions, answered from the churn-risk index."""
+    text = question.lower()
+    return any(p in text for p in CHURN_RISK_PHRASES) or bool(AT_RISK_CUSTOMERS.search(text))
+
+
+def _normalize(question):
+    return " " + " ".join(re.findall(r"[a-z0-9_]+", question.lower().replace("'", ""))) + " "
+
+
+def _score(text, keywords):
+    return sum(weight for phrase, weight in keywords.items() if f" {phrase} " in text)
+
+
+def _strength(score):
+    return 1.0 - math.exp(-score)
+
+
+def classify(question):
+    """Return the analysis plan dict for a question, including a 0-1 ``confidence``."""
+    text = _normalize(question)
+    words = set(text.split())
+
+    if any(f" {p} " in text for p in DEFINITION_PHRASES) or words & GLOSSARY_ABBREVIATIONS:
+        term_hit = bool(words & GLOSSARY_ABBREVIATIONS)
+        return _plan("definition", None, [], question, 0.9 if term_hit else 0.65, "summary")
+
+    if any(f" {w} " in text for w in ANOMALY_WORDS):
+        return _plan("anomaly_detection", None, [], question, 0.85, "detailed")
+
+    dims = [dim for dim, terms in DIMENSIONS.items() if any(f" {t} " in text for t in terms)]
+    if is_churn_risk_question(question):
+        return _plan("churn_risk", None, [d for d in dims if d != "feature"], question, 0.85, "detailed")
+
+    topic_scores = sorted(((_score(text, spec["keywords"]), name) for name, spec in TOPICS.items()),
+                          reverse=True)
+    (top_score, topic), (second_score, _) = topic_scores[0], topic_scores[1]
+    if top_score > 0:
+        topic_confidence = _strength(top_score) * (0.5 + 0.5 * (top_score - second_score) / top_score)
+    else:
+        topic, topic_confidence = None, 0.0
+
+    if topic == "feature_analysis" and "feature" in dims:
+        dims.remove("feature")
+
+    if any(f" {w} " in text for w in COMPREHENSIVE_WORDS):
+        depth = "comprehensive"
+    elif any(f" {w} " in text for w in SUMMARY_WORDS):
+        depth = "summary"
+    else:
+        depth = "detailed"
+
+    for shape in SHAPE_PRECEDENCE:
+        shape_score = _score(text, SHAPES[shape])
+        if shape_score >= 1.0:
+            confidence = _strength(shape_score) * (0.6 + 0.4 * topic_confidence)
+            return _plan(shape, topic, dims, question, confidence, depth)
+
+    if topic is None:
+        return _plan("exploratory", None, dims, question, 0.2, depth)
+    return _plan(topic, topic, dims, question, topic_confidence, depth)
+
+
+def _plan(intent, topic, dims, question, confidence, depth):
+    spec = TOPICS.get(topic)
+    if intent == "definition":
+        focus, metrics, viz = "fintech glossary", ["definition"], "none"
+        queries = [f"Glossary Lookup: {question}"]
+        context = "Shared metric definitions keep product and finance discussions consistent."
+    elif intent == "anomaly_detection":
+        focus, metrics, viz = "decline_rate and monthly_spend outliers", ["z_score", "p95", "p99"], "none"
+        queries = [f"Anomaly Detection: {question}"]
+        context = "Unusual decline rates can signal payment issues or fraud; unusual spend flags high-value or at-risk accounts."
+    elif intent == "churn_risk":
+        focus, metrics, viz = "active customers' churn risk", ["churn_risk_score", "customer_id"], "bar"
+        queries = [f"customers most likely to churn by {d}" for d in dims] or ["customers most likely to churn"]
+        context = "Reaching likely churners before they leave is cheaper than winning them back."
+    elif spec is None:
+        focus, metrics, viz = "customer_behavior", ["descriptive_statistics"], SHAPE_VISUALIZATION.get(intent, "bar")
+        queries = {"trend_analysis": ["monthly trend"],
+                   "comparison": ["compare tier vs segment"]}.get(intent, ["tier analysis", "segment analysis"])
+        context = "Understanding customer patterns for business optimization"
+    else:
+        focus, metrics, context = spec["focus"], list(spec["metrics"]), spec["context"]
+        viz = SHAPE_VISUALIZATION.get(intent, spec["visualization"])
+        template = spec["query"]
+        queries = [template.format(dim=d) for d in (dims or ["tier", "segment"])] if "{dim}" in template else [template]
+        if intent == "trend_analysis":
+            queries.append("monthly trend")
+        elif intent == "comparison":
+            queries.append("compare tier vs segment")
+        elif intent == "prediction":
+            metrics.append("churn_risk_score")
+
+    assumptions = "Using available dataset columns for analysis"
+    if intent == "trend_analysis":
+        assumptions += "; trends are bucketed by account creation month"
+    if dims:
+        assumptions += f"; breaking down by {', '.join(dims)}"
+
+    return {
+        "intent": intent,
+        "data_focus": focus,
+        "metrics": metrics,
+        "visualization_type": viz,
+        "analysis_depth": depth,
+        "assumptions": assumptions,
+        "suggested_queries": list(dict.fromkeys(queries)),
+        "business_context": context,
+        "confidence": round(float(confidence), 3),
+    }
+
+
+def evaluate(path="data/intent_eval_questions.json", min_confidence=DEFAULT_MIN_CONFIDENCE):
+    """Accuracy and latency of the classifier against a labeled question set."""
+    with open(path) as f:
+        labeled = json.load(f)
+
+    latencies, correct, covered, covered_correct = [], 0, 0, 0
+    misses = []
+    for item in labeled:
+        start = time.perf_counter()
+        plan = classify(item["question"])
+        latencies.append((time.perf_counter() - start) * 1000)
+        hit = plan["intent"] == item["intent"]
+        correct += hit
+        if plan["confidence"] >= min_confidence:
+            covered += 1
+            covered_correct += hit
+        if not hit:
+            misses.append((item["question"], item["intent"], plan["intent"], plan["confidence"]))
+
+    total = len(labeled)
+    return {
+        "questions": total,
+        "accuracy": correct / total,
+        "min_confidence": min_confidence,
+        "local_coverage": covered / total,
+        "accuracy_when_local": covered_correct / covered if covered else 0.0,
+        "latency_ms_p50": float(np.percentile(latencies, 50)),
+        "latency_ms_p95": float(np.percentile(latencies, 95)),
+        "latency_ms_max": max(latencies),
+        "misclassified": misses,
+    }
+
+
+if __name__ == "__main__":
+    report = evaluate(*sys.argv[1:2])
+    for question, expected, got, confidence in report.pop("misclassified"):
+        print(f"MISS  expected={expected:<17} got={got:<17} conf={confidence:.2f}  {question}")
+    print(json.dumps(report, indent=2))
@@ -0,0 +1,193 @@
+"""Background analysis jobs, so a Streamlit rerun never waits on the agent.
+
+Questions are submitted as jobs and run as tasks on the shared event loop
+(see tools/async_runtime.py). Each job has an ID, a status and a bounded log
+of the agent's streamed events, which the UI polls with a cursor.
+
+Load is bounded at three levels:
+
+- JOB_WORKERS jobs run at once; up to JOB_QUEUE_SIZE more wait in the queue.
+  Submitting beyond that raises ``QueueFull`` instead of piling up work.
+- Each user has at most JOB_USER_MAX_PENDING queued or running jobs
+  (``UserLimitExceeded`` past that).
+- Each user has at most JOB_USER_CONCURRENCY running jobs (default 1, so a
+  conversation's turns never interleave in its memory).
+
+Each job writes its chart to its own file under JOB_CHART_DIR (``job.chart``),
+so concurrent jobs never overwrite or delete one another's charts.
+
+Finished jobs are kept for JOB_TTL_SECONDS so a reconnecting page can still
+collect the answer; their chart files are removed when they expire.
+"""
+import asyncio
+import itertools
+import os
+import threading
+import time
+import uuid
+from collections import deque
+
+from tools import async_runtime, result_store
+
+WORKERS = int(os.getenv("JOB_WORKERS", "8"))
+QUEUE_SIZE = int(os.getenv("JOB_QUEUE_SIZE", "32"))
+USER_MAX_PENDING = int(os.getenv("JOB_USER_MAX_PENDING", "3"))
+USER_CONCURRENCY = int(os.getenv("JOB_USER_CONCURRENCY", "1"))
+TTL_SECONDS = float(os.getenv("JOB_TTL_SECONDS", "900"))
+CHART_DIR = os.getenv("JOB_CHART_DIR", ".cache/job_charts")
+MAX_EVENTS = 2000
+
+ACTIVE = ("queued", "running")
+
+
+class QueueFull(RuntimeError):
+    """Every worker is busy and the waiting queue is full."""
+
+
+class UserLimitExceeded(RuntimeError):
+    """This user already has the maximum number of unfinished jobs."""
+
+
+class Job:
+    def __init__(self, user, query):
+        self.id = uuid.uuid4().hex[:12]
+        self.user = user
+        self.query = query
+        self.status = "queued"
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self.result = None
+        self.chart = None
+        self.error = None
+        self.future = None
+        self._events = deque(maxlen=MAX_EVENTS)
+        self._seq = itertools.count()
+        self._lock = threading.Lock()
+
+    def add_event(self, event, payload):
+        with self._lock:
+            self._events.append((next(self._seq), event, payload))
+
+    def events_since(self, cursor=0):
+        """``(events, next_cursor)``: ``(event, payload)`` pairs recorded at or after ``cursor``."""
+        with self._lock:
+            events = [(seq, event, payload) for seq, event, payload in self._events if seq >= cursor]
+        return [(event, payload) for _, event, payload in events], (events[-1][0] + 1 if events else cursor)
+
+    @property
+    def done(self):
+        return self.status not in ACTIVE
+
+    def info(self):
+        return {"id": self.id, "user": self.user, "query": self.query, "status": self.status,
+                "created_at": self.created_at, "started_at": self.started_at, "finished_at": self.finished_at,
+                "chart": self.chart, "error": self.error}
+
+
+def _default_runner(query, on_event, session_id):
+    from langchain_agent import arun_agent
+    return arun_agent(query, on_event=on_event, session_id=session_id)
+
+
+class JobQueue:
+    def __init__(self, runner=_default_runner, workers=WORKERS, queue_size=QUEUE_SIZE,
+                 user_max_pending=USER_MAX_PENDING, user_concurrency=USER_CONCURRENCY, ttl_seconds=TTL_SECONDS):
+        self.runner = runner
+        self.workers = workers
+        self.queue_size = queue_size
+        self.user_max_pending = user_max_pending
+        self.user_concurrency = user_concurrency
+        self.ttl_seconds = ttl_seconds
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._worker_slots = None  # asyncio semaphores, created on the loop
+        self._user_slots = {}
+        self.metrics = {"submitted": 0, "completed": 0, "failed": 0, "cancelled": 0, "rejected": 0}
+
+    def submit(self, user, query):
+        """Queue a question for ``user`` (also its conversation/session ID); returns the Job."""
+        with self._lock:
+            self._expire()
+            active = [job for job in self._jobs.values() if not job.done]
+            if len(active) >= self.workers + self.queue_size:
+                self.metrics["rejected"] += 1
+                raise QueueFull(f"{len(active)} analyses are already running or waiting; try again shortly.")
+            if sum(job.user == user for job in active) >= self.user_max_pending:
+                self.metrics["rejected"] += 1
+                raise UserLimitExceeded(f"You already have {self.user_max_pending} analyses in progress.")
+            job = Job(user, query)
+            self._jobs[job.id] = job
+            self.metrics["submitted"] += 1
+        job.future = async_runtime.submit(self._run(job))
+        return job
+
+    def _slots(self, user):
+        # Only called on the event loop thread, so plain dict access is safe here
+        if self._worker_slots is None:
+            self._worker_slots = asyncio.Semaphore(self.workers)
+        if user not in self._user_slots:
+            self._user_slots[user] = asyncio.Semaphore(self.user_concurrency)
+        return self._worker_slots, self._user_slots[user]
+
+    async def _run(self, job):
+        worker_slot, user_slot = self._slots(job.user)
+        try:
+            async with user_slot, worker_slot:
+                if job.status == "cancelled":
+                    return None
+                job.status, job.started_at = "running", time.time()
+                result_store.set_session(job.user)
+                from tools import generate_chart  # loaded lazily: pulls in the dataset stack
+                os.makedirs(CHART_DIR, exist_ok=True)
+                chart = os.path.join(CHART_DIR, f"{job.id}.png")
+                with generate_chart.chart_output(chart):
+                    job.result = await self.runner(job.query, job.add_event, job.user)
+                job.chart = chart if os.path.exists(chart) else None
+                job.status = "done"
+                self.metrics["completed"] += 1
+                return job.result
+        except asyncio.CancelledError:
+            job.status = "cancelled"
+            raise
+        except Exception as e:
+            job.status, job.error = "failed", f"{type(e).__name__}: {e}"
+            self.metrics["failed"] += 1
+        finally:
+            job.finished_at = time.time()
+            if not any(j.user == job.user and not j.done for j in list(self._jobs.values())):
+                self._user_slots.pop(job.user, None)
+
+    def get(self, job_id):
+        return self._jobs.get(job_id)
+
+    def jobs_for(self, user):
+        with self._lock:
+            return [job for job in self._jobs.values() if job.user == user]
+
+    def cancel(self, job_id):
+        """Cancel a queued or running job; tool work already on a thread finishes but is discarded."""
+        job = self._jobs.get(job_id)
+        if job is None or job.done:
+            return False
+        job.status = "cancelled"
+        self.metrics["cancelled"] += 1
+        if job.future is not None:
+            job.future.cancel()
+        return True
+
+    def _expire(self):
+        cutoff = time.time() - self.ttl_seconds
+        for job_id in [j.id for j in self._jobs.values() if j.done and (j.finished_at or 0) < cutoff]:
+            job = self._jobs.pop(job_id)
+            if job.chart and os.path.exists(job.chart):
+                os.remove(job.chart)
+
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+        return {**self.metrics, "queued": sum(j.status == "queued" for j in jobs),
+                "running": sum(j.status == "running" for j in jobs)}
+
+
+job_queue = JobQueue()
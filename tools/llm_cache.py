@@ -0,0 +1,222 @@
+"""Two-level response cache for the Smart Analyzer and insight LLM calls.
+
+Level 1 is an exact match on the normalized input, model and data version.
+Level 2 finds near-duplicate inputs by embedding cosine similarity; it is
+meant for questions. Callers caching answers about data (insights on a
+table) use ``exact=True``, which keys on the text byte-for-byte (apart from
+per-run result references) and never matches a merely similar table. Entries
+live in a local SQLite file so they survive restarts, and are evicted by age
+and least-recent use.
+
+Embeddings default to a deterministic local hashing model so the cache works
+(and can be tested) offline; set LLM_CACHE_EMBEDDINGS=openai to use
+OpenAIEmbeddings instead.
+"""
+import hashlib
+import os
+import re
+import sqlite3
+import threading
+import time
+
+import numpy as np
+from langchain.embeddings.base import Embeddings
+
+from tools import tracing
+
+DATA_PATH = "data/fintech_product_data.csv"
+DEFAULT_CACHE_PATH = os.getenv("LLM_CACHE_PATH", ".cache/llm_cache.sqlite3")
+DEFAULT_THRESHOLD = float(os.getenv("LLM_CACHE_THRESHOLD", "0.92"))
+DEFAULT_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2000"))
+DEFAULT_TTL_SECONDS = int(os.getenv("LLM_CACHE_TTL_SECONDS", str(7 * 24 * 3600)))
+RESULT_REFERENCE = re.compile(r"\s*\[ref: r\d+\]")  # result_store tags, new on every run
+
+
+def strip_references(text):
+    """Drop result references, which differ between runs of the same query."""
+    return RESULT_REFERENCE.sub("", str(text))
+
+
+def normalize_text(text):
+    """Lowercase, drop result references, strip punctuation and collapse whitespace.
+
+    Comparison operators are kept: "spend > 100" and "spend < 100" are different questions.
+    A "!" is kept only as part of "!=".
+    """
+    text = strip_references(text).lower()
+    text = re.sub(r"[^\w\s.%$<>=!-]|!(?!=)", " ", text)
+    return re.sub(r"\s+", " ", text).strip()
+
+
+def data_version(path=DATA_PATH):
+    """Cheap fingerprint of the dataset file; changes whenever the file is replaced."""
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return "missing"
+    return hashlib.sha1(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode()).hexdigest()[:12]
+
+
+def model_name(llm):
+    return getattr(llm, "model_name", None) or getattr(llm, "model", None) or "unknown"
+
+
+class HashingEmbeddings(Embeddings):
+    """Deterministic local embedding: signed feature hashing of words and character trigrams.
+
+    A LangChain ``Embeddings``, so it can stand in for OpenAIEmbeddings
+    anywhere an embedding model is expected (including FAISS).
+    """
+
+    def __init__(self, dim=256):
+        self.dim = dim
+
+    def _features(self, text):
+        text = normalize_text(text)
+        words = text.split()
+        padded = f" {text} "
+        return words + [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+    def embed_query(self, text):
+        vector = np.zeros(self.dim, dtype=np.float32)
+        for feature in self._features(text):
+            digest = hashlib.md5(feature.encode()).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = np.linalg.norm(vector)
+        return (vector / norm if norm else vector).tolist()
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def default_embeddings():
+    if os.getenv("LLM_CACHE_EMBEDDINGS", "local").lower() == "openai":
+        from langchain_openai import OpenAIEmbeddings
+        return OpenAIEmbeddings()
+    return HashingEmbeddings()
+
+
+class LLMCache:
+    """Exact + semantic response cache backed by SQLite."""
+
+    def __init__(self, path=DEFAULT_CACHE_PATH, embeddings=None, threshold=DEFAULT_THRESHOLD,
+                 max_entries=DEFAULT_MAX_ENTRIES, ttl_seconds=DEFAULT_TTL_SECONDS):
+        self.path = path
+        self.embeddings = embeddings or default_embeddings()
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.enabled = os.getenv("LLM_CACHE_DISABLED", "").lower() not in ("1", "true", "yes")
+        self.metrics = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "writes": 0}
+        self._lock = threading.Lock()
+        self._conn = None
+
+    def _db(self):
+        if self._conn is None:
+            if self.path != ":memory:":
+                os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS entries (
+                    key TEXT PRIMARY KEY,
+                    namespace TEXT, model TEXT, data_version TEXT,
+                    text TEXT, response TEXT, embedding BLOB,
+                    created_at REAL, last_used REAL, hits INTEGER DEFAULT 0
+                )""")
+            self._conn.execute(
+                "CREATE INDEX IF NOT EXISTS entries_partition ON entries (namespace, model, data_version)")
+        return self._conn
+
+    def _key(self, namespace, text, model, version, exact=False):
+        raw = f"{namespace}|{model}|{version}|{strip_references(text) if exact else normalize_text(text)}"
+        return hashlib.sha256(raw.encode()).hexdigest()
+
+    def get(self, namespace, text, model, threshold=None, version=None, exact=False):
+        """Return a cached response or None.
+
+        ``threshold`` overrides the semantic cutoff (>1 disables it). ``exact`` matches ``text``
+        byte-for-byte, without normalization or semantic lookup.
+        """
+        if not self.enabled:
+            return None
+        version = version or data_version()
+        threshold = self.threshold if threshold is None else threshold
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            key = self._key(namespace, text, model, version, exact)
+            row = db.execute("SELECT response, created_at FROM entries WHERE key = ?", (key,)).fetchone()
+            if row and now - row[1] <= self.ttl_seconds:
+                self._touch(key, now)
+                self.metrics["exact_hits"] += 1
+                tracing.incr("llm_cache_exact_hits")
+                return row[0]
+
+            if threshold <= 1.0 and not exact:
+                rows = db.execute(
+                    "SELECT key, response, embedding FROM entries "
+                    "WHERE namespace = ? AND model = ? AND data_version = ? AND created_at >= ? "
+                    "AND length(embedding) > 0",
+                    (namespace, model, version, now - self.ttl_seconds)).fetchall()
+                if rows:
+                    query = np.asarray(self.embeddings.embed_query(normalize_text(text)), dtype=np.float32)
+                    matrix = np.vstack([np.frombuffer(r[2], dtype=np.float32) for r in rows])
+                    scores = matrix @ query / (np.linalg.norm(matrix, axis=1) * (np.linalg.norm(query) or 1.0) + 1e-12)
+                    best = int(np.argmax(scores))
+                    if scores[best] >= threshold:
+                        self._touch(rows[best][0], now)
+                        self.metrics["semantic_hits"] += 1
+                        tracing.incr("llm_cache_semantic_hits")
+                        return rows[best][1]
+
+            self.metrics["misses"] += 1
+            tracing.incr("llm_cache_misses")
+            return None
+
+    def put(self, namespace, text, model, response, version=None, exact=False):
+        """Store a response; ``exact`` entries are not embedded (see ``get``)."""
+        if not self.enabled:
+            return
+        version = version or data_version()
+        embedding = (np.zeros(0, dtype=np.float32) if exact else
+                     np.asarray(self.embeddings.embed_query(normalize_text(text)), dtype=np.float32))
+        now = time.time()
+        with self._lock:
+            db = self._db()
+            db.execute(
+                "INSERT OR REPLACE INTO entries "
+                "(key, namespace, model, data_version, text, response, embedding, created_at, last_used, hits) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, 0)",
+                (self._key(namespace, text, model, version, exact), namespace, model, version,
+                 text, response, embedding.tobytes(), now, now))
+            self._evict(now)
+            db.commit()
+            self.metrics["writes"] += 1
+
+    def _touch(self, key, now):
+        self._conn.execute("UPDATE entries SET last_used = ?, hits = hits + 1 WHERE key = ?", (now, key))
+        self._conn.commit()
+
+    def _evict(self, now):
+        db = self._conn
+        db.execute("DELETE FROM entries WHERE created_at < ?", (now - self.ttl_seconds,))
+        db.execute(
+            "DELETE FROM entries WHERE key IN ("
+            "SELECT key FROM entries ORDER BY last_used DESC LIMIT -1 OFFSET ?)", (self.max_entries,))
+
+    def stats(self):
+        lookups = self.metrics["exact_hits"] + self.metrics["semantic_hits"] + self.metrics["misses"]
+        hits = self.metrics["exact_hits"] + self.metrics["semantic_hits"]
+        with self._lock:
+            entries = self._db().execute("SELECT COUNT(*) FROM entries").fetchone()[0]
+        return {**self.metrics, "lookups": lookups, "hit_rate": hits / lookups if lookups else 0.0,
+                "entries": entries}
+
+    def clear(self):
+        with self._lock:
+            self._db().execute("DELETE FROM entries")
+            self._conn.commit()
+
+
+cache = LLMCache()
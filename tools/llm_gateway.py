@@ -0,0 +1,366 @@
+"""Single LLM gateway shared by the agent and every LLM-backed tool.
+
+- One pair of keep-alive HTTP clients (sync + async), so the agent,
+  Smart Analyzer and insight calls share a single connection pool.
+- Identical prompts already in flight are coalesced into one API call.
+- ``predict_many`` dispatches independent prompts concurrently through the
+  pool (chat completions have no multi-prompt request, so this is the
+  closest the API allows), de-duplicating repeats.
+- Client-side rate limiting plus exponential-backoff retries on transient
+  errors. Calls that never reach the network (the local backend, and fake
+  or replay models under LLM_REPLAY_MODE) skip both, so offline runs
+  measure only the app's own overhead.
+- ``agent_chat_model`` wraps the LangChain chat model the agent drives in
+  ``GatewayChatModel``, so agent turns get the same rate limiting, retries
+  and coalescing as tool calls.
+- Pluggable backends: ``LLM_BACKEND=local`` (or ``set_backend``) swaps in a
+  deterministic offline stand-in for tests.
+"""
+import asyncio
+import hashlib
+import json
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+import httpx
+from langchain.chat_models.base import BaseChatModel
+
+from tools import intent_classifier, tracing, context_budget, llm_cache, llm_replay
+
+MODEL = os.getenv("LLM_MODEL", "gpt-4o")
+TEMPERATURE = 0.1
+REQUESTS_PER_MINUTE = float(os.getenv("LLM_REQUESTS_PER_MINUTE", "300"))
+MAX_CONNECTIONS = int(os.getenv("LLM_MAX_CONNECTIONS", "20"))
+MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+
+RETRYABLE_ERRORS = {"RateLimitError", "APIConnectionError", "APITimeoutError", "InternalServerError",
+                    "ServiceUnavailableError", "Timeout", "ConnectError", "ReadTimeout"}
+
+_clients = {}
+_chat_models = {}
+_clients_lock = threading.Lock()
+
+
+def _limits():
+    return httpx.Limits(max_connections=MAX_CONNECTIONS, max_keepalive_connections=MAX_CONNECTIONS,
+                        keepalive_expiry=60)
+
+
+def http_clients():
+    """The process-wide keep-alive ``(httpx.Client, httpx.AsyncClient)`` pair."""
+    with _clients_lock:
+        if not _clients:
+            _clients["sync"] = httpx.Client(limits=_limits(), timeout=60)
+            _clients["async"] = httpx.AsyncClient(limits=_limits(), timeout=60)
+    return _clients["sync"], _clients["async"]
+
+
+def chat_model(streaming=False):
+    """Shared ChatOpenAI instance on the pooled clients (the agent needs a LangChain model).
+
+    Under LLM_REPLAY_MODE this is the recording, replaying or fake model instead.
+    """
+    with _clients_lock:
+        model = _chat_models.get(streaming)
+    if model is None:
+        def build(callbacks):
+            from langchain_openai import ChatOpenAI  # the OpenAI SDK is slow to import; only load it when used
+            sync_client, async_client = http_clients()
+            return ChatOpenAI(model=MODEL, temperature=TEMPERATURE, streaming=streaming, callbacks=callbacks,
+                              http_client=sync_client, http_async_client=async_client)
+        model = llm_replay.chat_model(MODEL, streaming, build)
+        with _clients_lock:
+            model = _chat_models.setdefault(streaming, model)
+    return model
+
+
+def networked():
+    """False when LLM_REPLAY_MODE serves chat calls locally (fake or replay), so there is nothing to throttle."""
+    return llm_replay.MODE not in ("fake", "replay")
+
+
+class OpenAIBackend:
+    """Calls GPT via the shared pooled ChatOpenAI client."""
+
+    def __init__(self):
+        self.model_name = MODEL
+
+    @property
+    def networked(self):
+        return networked()
+
+    def invoke(self, prompt):
+        return chat_model().invoke(prompt).content
+
+    async def ainvoke(self, prompt):
+        return (await chat_model().ainvoke(prompt)).content
+
+
+class LocalBackend:
+    """Deterministic offline stand-in.
+
+    Analysis prompts get the local intent classifier's JSON plan; anything
+    else gets a fixed text derived from the prompt hash. Pass ``responder``
+    to script responses for a test.
+    """
+
+    model_name = "local-stub"
+    networked = False
+
+    def __init__(self, responder=None, latency=0.0):
+        self.responder = responder
+        self.latency = latency
+        self.calls = 0
+
+    def _respond(self, prompt):
+        self.calls += 1
+        if self.responder is not None:
+            return self.responder(prompt)
+        question = re.search(r"User Question:\s*(.+)", prompt)
+        if question and "JSON" in prompt:
+            return json.dumps(intent_classifier.classify(question.group(1)), indent=2)
+        digest = hashlib.sha1(prompt.encode()).hexdigest()[:8]
+        return f"**Executive Summary**: Local stand-in response {digest}."
+
+    def invoke(self, prompt):
+        if self.latency:
+            time.sleep(self.latency)
+        return self._respond(prompt)
+
+    async def ainvoke(self, prompt):
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return self._respond(prompt)
+
+
+class RateLimiter:
+    """Evenly spaced request slots: at most ``per_minute`` calls start per minute."""
+
+    def __init__(self, per_minute):
+        self.interval = 60.0 / per_minute if per_minute > 0 else 0.0
+        self._next_slot = 0.0
+        self._lock = threading.Lock()
+
+    def _reserve(self):
+        with self._lock:
+            now = time.monotonic()
+            slot = max(now, self._next_slot)
+            self._next_slot = slot + self.interval
+            return slot - now
+
+    def acquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+
+    async def aacquire(self):
+        wait = self._reserve()
+        if wait > 0:
+            await asyncio.sleep(wait)
+        return wait
+
+
+def _is_retryable(error):
+    return isinstance(error, (TimeoutError, ConnectionError)) or type(error).__name__ in RETRYABLE_ERRORS
+
+
+class LLMGateway:
+    """Coalescing, rate-limited, retrying front door for text-in/text-out LLM calls.
+
+    Exposes ``predict``/``apredict``/``model_name`` so it drops in wherever the
+    tools previously held a ChatOpenAI instance.
+    """
+
+    def __init__(self, backend=None, requests_per_minute=REQUESTS_PER_MINUTE, max_retries=MAX_RETRIES,
+                 max_concurrency=MAX_CONCURRENCY):
+        self.backend = backend or default_backend()
+        self.limiter = RateLimiter(requests_per_minute)
+        self.max_retries = max_retries
+        self.max_concurrency = max_concurrency
+        self.metrics = {"requests": 0, "api_calls": 0, "coalesced": 0, "retries": 0, "rate_limit_wait_s": 0.0}
+        self._in_flight = {}
+        self._lock = threading.Lock()
+
+    @property
+    def model_name(self):
+        return self.backend.model_name
+
+    def _claim(self, prompt):
+        """Return ``(key, future, owner)``; only the owner performs the call."""
+        key = hashlib.sha256(f"{self.model_name}|{prompt}".encode()).hexdigest()
+        with self._lock:
+            self.metrics["requests"] += 1
+            future = self._in_flight.get(key)
+            if future is not None:
+                self.metrics["coalesced"] += 1
+                return key, future, False
+            future = self._in_flight[key] = Future()
+            return key, future, True
+
+    def _settle(self, key, future, result=None, error=None):
+        with self._lock:
+            self._in_flight.pop(key, None)
+        if error is not None:
+            future.set_exception(error)
+        else:
+            future.set_result(result)
+
+    def call(self, key_text, func, networked=True):
+        """Run ``func()`` rate-limited and retried; concurrent calls with the same ``key_text`` share one.
+
+        ``networked=False`` (a local model) skips the rate limiter and retries but still coalesces.
+        """
+        key, future, owner = self._claim(key_text)
+        tracing.annotate(coalesced=not owner)
+        if not owner:
+            return future.result()
+        try:
+            result = self._with_retries(func, networked)
+        except BaseException as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, result)
+        return result
+
+    async def acall(self, key_text, func, networked=True):
+        """Async ``call``: ``func()`` returns an awaitable."""
+        key, future, owner = self._claim(key_text)
+        tracing.annotate(coalesced=not owner)
+        if not owner:
+            return await asyncio.wrap_future(future)
+        try:
+            result = await self._awith_retries(func, networked)
+        except BaseException as e:
+            self._settle(key, future, error=e)
+            raise
+        self._settle(key, future, result)
+        return result
+
+    def predict(self, prompt):
+        with tracing.span("llm_gateway", model=self.model_name,
+                          prompt_tokens=context_budget.count_tokens(prompt)) as span:
+            result = self.call(prompt, lambda: self.backend.invoke(prompt),
+                               getattr(self.backend, "networked", True))
+            span.set(completion_tokens=context_budget.count_tokens(result))
+            return result
+
+    async def apredict(self, prompt):
+        with tracing.span("llm_gateway", model=self.model_name,
+                          prompt_tokens=context_budget.count_tokens(prompt)) as span:
+            result = await self.acall(prompt, lambda: self.backend.ainvoke(prompt),
+                                      getattr(self.backend, "networked", True))
+            span.set(completion_tokens=context_budget.count_tokens(result))
+            return result
+
+    def _with_retries(self, func, networked=True):
+        if not networked:
+            self.metrics["api_calls"] += 1
+            return func()
+        for attempt in range(self.max_retries + 1):
+            self.metrics["rate_limit_wait_s"] += self.limiter.acquire()
+            try:
+                self.metrics["api_calls"] += 1
+                return func()
+            except Exception as e:
+                if attempt == self.max_retries or not _is_retryable(e):
+                    raise
+                self.metrics["retries"] += 1
+                tracing.incr("retries")
+                time.sleep(0.5 * 2 ** attempt + random.random() * 0.25)
+
+    async def _awith_retries(self, func, networked=True):
+        if not networked:
+            self.metrics["api_calls"] += 1
+            return await func()
+        for attempt in range(self.max_retries + 1):
+            self.metrics["rate_limit_wait_s"] += await self.limiter.aacquire()
+            try:
+                self.metrics["api_calls"] += 1
+                return await func()
+            except Exception as e:
+                if attempt == self.max_retries or not _is_retryable(e):
+                    raise
+                self.metrics["retries"] += 1
+                tracing.incr("retries")
+                await asyncio.sleep(0.5 * 2 ** attempt + random.random() * 0.25)
+
+    async def apredict_many(self, prompts):
+        """Run independent prompts concurrently (bounded), calling each distinct prompt once."""
+        semaphore = asyncio.Semaphore(self.max_concurrency)
+        unique = list(dict.fromkeys(prompts))
+
+        async def one(prompt):
+            async with semaphore:
+                return await self.apredict(prompt)
+
+        results = dict(zip(unique, await asyncio.gather(*(one(p) for p in unique))))
+        return [results[p] for p in prompts]
+
+    def predict_many(self, prompts):
+        from tools import async_runtime
+        return async_runtime.run(self.apredict_many(prompts))
+
+    def stats(self):
+        return dict(self.metrics)
+
+
+def default_backend():
+    return LocalBackend() if os.getenv("LLM_BACKEND", "openai").lower() == "local" else OpenAIBackend()
+
+
+gateway = LLMGateway()
+
+
+def set_backend(backend):
+    """Swap the backend behind the shared gateway (e.g. ``LocalBackend()`` in tests)."""
+    gateway.backend = backend
+    return gateway
+
+
+class GatewayChatModel(BaseChatModel):
+    """LangChain chat model whose every call goes through ``gateway``'s limiter, retries and coalescing.
+
+    Generation is delegated to ``inner`` with this model's run manager, so
+    streamed tokens still reach the agent's callbacks.
+    """
+
+    inner: BaseChatModel
+    gateway: object = None
+    networked: bool = True
+
+    @property
+    def _llm_type(self):
+        return f"gateway-{self.inner._llm_type}"
+
+    @property
+    def model_name(self):
+        return llm_cache.model_name(self.inner)
+
+    def _key(self, messages, stop):
+        return json.dumps([[m.type, m.content] for m in messages] + [stop])
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        return (self.gateway or gateway).call(
+            self._key(messages, stop),
+            lambda: self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs), self.networked)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        return await (self.gateway or gateway).acall(
+            self._key(messages, stop),
+            lambda: self.inner._agenerate(messages, stop=stop, run_manager=run_manager, **kwargs), self.networked)
+
+
+def agent_chat_model(streaming=True):
+    """``chat_model`` wrapped in GatewayChatModel, for the agent executor.
+
+    The inner model's callbacks (e.g. the cassette recorder) move to the
+    wrapper, because LangChain only fires callbacks on the model it invokes.
+    """
+    inner = chat_model(streaming)
+    return GatewayChatModel(inner=inner, callbacks=inner.callbacks, networked=networked())
@@ -0,0 +1,309 @@
+"""Record/replay stand-in for every LLM and embedding call.
+
+Set LLM_REPLAY_MODE to choose how the chat model (agent, Smart Analyzer and
+insights all go through ``llm_gateway.chat_model``) and the glossary
+embeddings behave:
+
+- ``off`` (default): real OpenAI calls.
+- ``record``: real calls, and every exchange is appended to the cassette
+  (LLM_CASSETTE, a JSONL file) with its latency and token usage.
+- ``replay``: no network. Responses come from the cassette, keyed by the
+  exact messages sent, with LLM_REPLAY_LATENCY_MS of injected latency
+  (``recorded`` replays the measured latency). Unknown prompts raise
+  ``CassetteMiss`` unless LLM_REPLAY_STRICT=0, which answers them with the
+  deterministic local backend instead.
+- ``fake``: no network and no cassette; the agent gets scripted tool calls,
+  other prompts get the local backend's reply and embeddings come from the
+  local hashing model.
+
+Run ``python -m tools.llm_replay questions.json`` to push questions through
+the full agent in the current mode and print per-stage latency, which in
+replay mode is the agent loop's own overhead.
+"""
+import hashlib
+import json
+import os
+import threading
+import time
+
+from langchain.callbacks.base import BaseCallbackHandler
+from langchain.chat_models.base import BaseChatModel
+from langchain.embeddings.base import Embeddings
+from langchain.schema import AIMessage, ChatGeneration, ChatResult
+
+from tools import llm_cache
+
+MODE = os.getenv("LLM_REPLAY_MODE", "off").lower()
+CASSETTE_PATH = os.getenv("LLM_CASSETTE", ".cache/llm_cassette.jsonl")
+REPLAY_LATENCY_MS = os.getenv("LLM_REPLAY_LATENCY_MS", "0")
+STRICT = os.getenv("LLM_REPLAY_STRICT", "1").lower() not in ("0", "false", "no")
+FAKE_EMBEDDING_DIM = 1536  # matches text-embedding-ada-002 / -3-small
+
+
+class CassetteMiss(KeyError):
+    """Replay was asked for an exchange that was never recorded."""
+
+
+def _messages_payload(messages):
+    return [[message.type, message.content] for message in messages]
+
+
+def exchange_key(kind, model, payload):
+    blob = json.dumps([kind, model, payload], sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(blob.encode()).hexdigest()
+
+
+class Cassette:
+    """Append-only JSONL store of recorded exchanges, loaded into memory for replay."""
+
+    def __init__(self, path=CASSETTE_PATH):
+        self.path = path
+        self._entries = None
+        self._lock = threading.Lock()
+        self.metrics = {"recorded": 0, "replayed": 0, "misses": 0}
+
+    def _load(self):
+        if self._entries is None:
+            entries = {}
+            if os.path.exists(self.path):
+                with open(self.path) as f:
+                    for line in f:
+                        if line.strip():
+                            entry = json.loads(line)
+                            entries[entry["key"]] = entry
+            self._entries = entries
+        return self._entries
+
+    def lookup(self, key):
+        with self._lock:
+            entry = self._load().get(key)
+            self.metrics["replayed" if entry else "misses"] += 1
+        return entry
+
+    def record(self, key, kind, model, request, response, latency_ms, usage=None):
+        entry = {"key": key, "kind": kind, "model": model, "request": request, "response": response,
+                 "latency_ms": round(latency_ms, 1), "usage": usage or {}}
+        with self._lock:
+            self._load()[key] = entry
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            with open(self.path, "a") as f:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+            self.metrics["recorded"] += 1
+
+    def stats(self):
+        with self._lock:
+            entries = self._load()
+            return {**self.metrics, "entries": len(entries),
+                    "chat": sum(e["kind"] == "chat" for e in entries.values()),
+                    "embedding": sum(e["kind"] == "embedding" for e in entries.values())}
+
+
+cassette = Cassette()
+
+
+def _injected_latency(entry):
+    if REPLAY_LATENCY_MS == "recorded":
+        return entry.get("latency_ms", 0) / 1000
+    return float(REPLAY_LATENCY_MS) / 1000
+
+
+class CassetteRecorder(BaseCallbackHandler):
+    """Callback attached to the real chat model in record mode."""
+
+    def __init__(self, model, cassette=cassette):
+        self.model = model
+        self.cassette = cassette
+        self._pending = {}
+
+    def on_chat_model_start(self, serialized, messages, run_id=None, **kwargs):
+        self._pending[run_id] = ([_messages_payload(batch) for batch in messages], time.perf_counter())
+
+    def on_llm_end(self, response, run_id=None, **kwargs):
+        pending = self._pending.pop(run_id, None)
+        if pending is None:
+            return
+        payloads, started = pending
+        latency_ms = (time.perf_counter() - started) * 1000
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        for payload, generations in zip(payloads, response.generations):
+            self.cassette.record(exchange_key("chat", self.model, payload), "chat", self.model, payload,
+                                 generations[0].text, latency_ms, dict(usage))
+
+    def on_llm_error(self, error, run_id=None, **kwargs):
+        self._pending.pop(run_id, None)
+
+
+class ReplayChatModel(BaseChatModel):
+    """Chat model that answers from the cassette; streams the reply word by word when asked."""
+
+    model_name: str = "gpt-4o"
+    streaming: bool = False
+    strict: bool = STRICT
+
+    @property
+    def _llm_type(self):
+        return "cassette-replay"
+
+    def _reply(self, messages):
+        payload = _messages_payload(messages)
+        entry = cassette.lookup(exchange_key("chat", self.model_name, payload))
+        if entry is not None:
+            return entry["response"], _injected_latency(entry)
+        if self.strict:
+            raise CassetteMiss(f"no recorded reply for: {payload[-1][1][:120]!r}")
+        from tools.llm_gateway import LocalBackend
+        return LocalBackend()._respond(payload[-1][1]), 0.0
+
+    def _result(self, text):
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))],
+                          llm_output={"model_name": self.model_name, "replayed": True})
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        text, latency = self._reply(messages)
+        if latency:
+            time.sleep(latency)
+        if self.streaming and run_manager:
+            for chunk in text.split(" "):
+                run_manager.on_llm_new_token(chunk + " ")
+        return self._result(text)
+
+    async def _agenerate(self, messages, stop=None, run_manager=None, **kwargs):
+        import asyncio
+        text, latency = self._reply(messages)
+        if latency:
+            await asyncio.sleep(latency)
+        if self.streaming and run_manager:
+            for chunk in text.split(" "):
+                await run_manager.on_llm_new_token(chunk + " ")
+        return self._result(text)
+
+
+def _agent_action(action, action_input):
+    return "```json\n" + json.dumps({"action": action, "action_input": action_input}, indent=4) + "\n```"
+
+
+class FakeChatModel(ReplayChatModel):
+    """Never consults a cassette: every prompt gets a deterministic local reply.
+
+    Agent prompts follow the conversational agent's protocol (one Query
+    DataFrame call, then a final answer quoting its result) so the whole
+    loop runs; tool prompts get the local backend's reply.
+    """
+
+    strict: bool = False
+
+    @property
+    def _llm_type(self):
+        return "local-fake"
+
+    def _reply(self, messages):
+        last = messages[-1].content
+        if "TOOL RESPONSE:" in last:
+            observation = last.split("TOOL RESPONSE:", 1)[1].split("USER'S INPUT", 1)[0].strip("-\n ")
+            return _agent_action("Final Answer", observation[:1000]), 0.0
+        if "RESPONSE FORMAT INSTRUCTIONS" in last:
+            question = last.rsplit("NOTHING else):", 1)[-1].strip()
+            return _agent_action("Query DataFrame", question), 0.0
+        from tools.llm_gateway import LocalBackend
+        return LocalBackend()._respond(last), 0.0
+
+
+class RecordingEmbeddings(Embeddings):
+    """Wraps a real embedding model and records each vector it returns."""
+
+    def __init__(self, inner, model, cassette=cassette):
+        self.inner = inner
+        self.model = model
+        self.cassette = cassette
+
+    def _record(self, text, vector, latency_ms):
+        self.cassette.record(exchange_key("embedding", self.model, text), "embedding", self.model, text,
+                             vector, latency_ms)
+
+    def embed_query(self, text):
+        started = time.perf_counter()
+        vector = self.inner.embed_query(text)
+        self._record(text, vector, (time.perf_counter() - started) * 1000)
+        return vector
+
+    def embed_documents(self, texts):
+        started = time.perf_counter()
+        vectors = self.inner.embed_documents(texts)
+        per_text_ms = (time.perf_counter() - started) * 1000 / max(len(texts), 1)
+        for text, vector in zip(texts, vectors):
+            self._record(text, vector, per_text_ms)
+        return vectors
+
+
+class ReplayEmbeddings(Embeddings):
+    """Embeddings served from the cassette, falling back to the fake model when not strict."""
+
+    def __init__(self, model, strict=STRICT, cassette=cassette):
+        self.model = model
+        self.strict = strict
+        self.cassette = cassette
+        self.fallback = llm_cache.HashingEmbeddings(dim=FAKE_EMBEDDING_DIM)
+
+    def embed_query(self, text):
+        entry = self.cassette.lookup(exchange_key("embedding", self.model, text))
+        if entry is not None:
+            latency = _injected_latency(entry)
+            if latency:
+                time.sleep(latency)
+            return entry["response"]
+        if self.strict:
+            raise CassetteMiss(f"no recorded embedding for: {text[:120]!r}")
+        return self.fallback.embed_query(text)
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+
+def chat_model(model, streaming, factory):
+    """The agent/gateway chat model for the current mode; ``factory(callbacks)`` builds the real one."""
+    if MODE == "replay":
+        return ReplayChatModel(model_name=model, streaming=streaming)
+    if MODE == "fake":
+        return FakeChatModel(model_name=model, streaming=streaming)
+    if MODE == "record":
+        return factory([CassetteRecorder(model)])
+    return factory(None)
+
+
+def embedding_model(model="text-embedding-ada-002"):
+    """Embedding model for the glossary index in the current mode."""
+    if MODE == "replay":
+        return ReplayEmbeddings(model)
+    if MODE == "fake":
+        return llm_cache.HashingEmbeddings(dim=FAKE_EMBEDDING_DIM)
+    from langchain_openai import OpenAIEmbeddings
+    real = OpenAIEmbeddings(model=model)
+    return RecordingEmbeddings(real, model) if MODE == "record" else real
+
+
+if __name__ == "__main__":
+    import sys
+
+    import tempfile
+
+    # Answer questions through the full agent in the current mode, one fresh session each
+    from tools import generate_chart, tracing
+    from langchain_agent import run_agent
+
+    with open(sys.argv[1] if len(sys.argv) > 1 else "data/intent_eval_questions.json") as f:
+        questions = [q if isinstance(q, str) else q["question"] for q in json.load(f)]
+
+    # Charts go to a temporary file, never the app's chart.png
+    with tempfile.TemporaryDirectory() as tmp, generate_chart.chart_output(os.path.join(tmp, "chart.png")):
+        for i, question in enumerate(questions):
+            started = time.perf_counter()
+            try:
+                run_agent(question, session_id=f"replay-{i}")
+                outcome = "ok"
+            except Exception as e:
+                outcome = f"{type(e).__name__}: {e}"
+            print(f"{(time.perf_counter() - started) * 1000:8.1f} ms  {outcome[:60]:<20}  {question}")
+
+    print(json.dumps({"mode": MODE, "cassette": cassette.stats()}, indent=2))
+    for row in tracing.latency_summary():
+        print(f"{row['name']:<28} n={row['count']:<5} p50={row['p50_ms']:>8} p95={row['p95_ms']:>8}")
@@ -0,0 +1,353 @@
+"""Execution backends for the query handlers and charts.
+
+The handlers in tools/query_dataframe.py and the charts in
+tools/generate_chart.py only need a handful of operations: filter, scalar
+aggregates, group-by aggregation, value counts, crosstabs and time
+bucketing. A backend implements those over the loaded customer table and
+always returns pandas objects, so tables, the result store and plotting stay
+the same whichever engine ran the query.
+
+- ``pandas`` (default): runs directly on ``query_dataframe.df``.
+- ``polars``: converts the loaded frame to an Arrow-backed Polars frame once
+  per dataset version and runs each operation as a lazy query, which Polars
+  optimizes (projection/predicate pushdown) and executes on all cores. This
+  pays off on large datasets; it needs ``pip install polars pyarrow``.
+
+QUERY_BACKEND selects one. Filters use the same ``(column, op, value)``
+conditions as tools/export.py. Free-form pandas expressions typed into
+Query DataFrame still run on the pandas frame.
+
+Check that both backends return the same results (and compare their speed):
+
+    python -m tools.query_backend                   # bundled dataset
+    python -m tools.query_backend --size 1m         # synthetic dataset, see tools/synthetic_data.py
+"""
+import argparse
+import functools
+import operator
+import os
+import re
+import tempfile
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+BACKEND = os.getenv("QUERY_BACKEND", "pandas").lower()
+AGGREGATIONS = ("count", "size", "sum", "mean", "median", "min", "max")
+OPERATORS = {"==": operator.eq, "!=": operator.ne, ">": operator.gt, ">=": operator.ge,
+             "<": operator.lt, "<=": operator.le}
+POLARS_PERIODS = {"D": "1d", "M": "1mo", "Q": "1q", "Y": "1y"}  # pandas period -> Polars truncate interval
+
+
+def _listify(columns):
+    return [columns] if isinstance(columns, str) else list(columns)
+
+
+class PandasBackend:
+    name = "pandas"
+
+    def __init__(self, frame):
+        self.frame = frame
+
+    def _where(self, conditions):
+        if not conditions:
+            return self.frame
+        mask = np.ones(len(self.frame), dtype=bool)
+        for column, op, value in conditions:
+            values = self.frame[column]
+            mask &= (values.isin(value) if op == "in" else OPERATORS[op](values, value)).to_numpy()
+        return self.frame[mask]
+
+    def count(self, conditions=()):
+        """Rows matching the conditions."""
+        return len(self._where(conditions))
+
+    def scalar(self, column, func, conditions=()):
+        """One aggregate (``func`` from AGGREGATIONS) of a column."""
+        values = self._where(conditions)[column]
+        return len(values) if func == "size" else getattr(values, func)()
+
+    def column(self, column, conditions=()):
+        return self._where(conditions)[column]
+
+    def select(self, columns, conditions=()):
+        return self._where(conditions)[_listify(columns)]
+
+    def unique(self, column):
+        """Distinct values in order of first appearance."""
+        return self.frame[column].unique().tolist()
+
+    def group_agg(self, by, aggs, conditions=()):
+        """``aggs`` is ``{output column: (input column, func)}``; returns a frame indexed by ``by``, sorted."""
+        return self._where(conditions).groupby(_listify(by)).agg(**aggs)
+
+    def value_counts(self, column):
+        return self.frame[column].value_counts()
+
+    def crosstab(self, index, columns, normalize=False):
+        return pd.crosstab(self.frame[index], self.frame[columns], normalize=normalize)
+
+    def time_agg(self, date_column, aggs, by=(), freq="M", name="month_year"):
+        """Group by calendar period of ``date_column`` (a PeriodIndex level called ``name``), then ``by``."""
+        keys = [self.frame[date_column].dt.to_period(freq).rename(name)] + [self.frame[c] for c in _listify(by)]
+        return self.frame.groupby(keys).agg(**aggs)
+
+
+class PolarsBackend:
+    name = "polars"
+
+    def __init__(self, frame):
+        try:
+            import polars as pl
+        except ImportError:
+            raise RuntimeError("QUERY_BACKEND=polars needs polars: pip install polars pyarrow")
+        self.pl = pl
+        self.frame = frame
+        self.data = pl.from_pandas(frame)
+
+    def _expr(self, column, func):
+        if func == "size":
+            return self.pl.len()
+        if func not in AGGREGATIONS:
+            raise ValueError(f"unsupported aggregation: {func}")
+        return getattr(self.pl.col(column), func)()
+
+    def _lazy(self, conditions=()):
+        query = self.data.lazy()
+        for column, op, value in conditions:
+            expr = self.pl.col(column)
+            query = query.filter(expr.is_in(value) if op == "in" else OPERATORS[op](expr, value))
+        return query
+
+    def _aggregate(self, query, keys, aggs):
+        # Nulls are dropped from the keys, as pandas does
+        result = (query.drop_nulls(keys).group_by(keys)
+                  .agg([self._expr(column, func).alias(out) for out, (column, func) in aggs.items()])
+                  .sort(keys).collect())
+        return result.to_pandas().set_index(keys)
+
+    def count(self, conditions=()):
+        return self._lazy(conditions).select(self.pl.len()).collect().item()
+
+    def scalar(self, column, func, conditions=()):
+        value = self._lazy(conditions).select(self._expr(column, func)).collect().item()
+        return pd.Timestamp(value) if hasattr(value, "isoformat") else value
+
+    def column(self, column, conditions=()):
+        return self._lazy(conditions).select(column).collect().to_series().to_pandas()
+
+    def select(self, columns, conditions=()):
+        return self._lazy(conditions).select(_listify(columns)).collect().to_pandas()
+
+    def unique(self, column):
+        return self.data.lazy().select(self.pl.col(column).unique(maintain_order=True)).collect().to_series().to_list()
+
+    def group_agg(self, by, aggs, conditions=()):
+        return self._aggregate(self._lazy(conditions), _listify(by), aggs)
+
+    def value_counts(self, column):
+        # Ties keep first-appearance order, like pandas
+        counts = (self.data.lazy().drop_nulls(column).group_by(column, maintain_order=True)
+                  .agg(self.pl.len().alias("count")).sort("count", descending=True, maintain_order=True).collect())
+        return counts.to_pandas().set_index(column)["count"]
+
+    def crosstab(self, index, columns, normalize=False):
+        counts = self.group_agg([index, columns], {"count": (index, "size")}).reset_index()
+        table = counts.pivot(index=index, columns=columns, values="count").fillna(0).astype(np.int64)
+        table = table.sort_index().sort_index(axis=1)
+        if normalize is False:
+            return table
+        if normalize in (True, "all"):
+            return table / table.to_numpy().sum()
+        if normalize in ("columns", 1):
+            return table / table.sum()
+        if normalize in ("index", 0):
+            return table.div(table.sum(axis=1), axis=0)
+        raise ValueError(f"unsupported normalize: {normalize!r}")
+
+    def time_agg(self, date_column, aggs, by=(), freq="M", name="month_year"):
+        pl = self.pl
+        period = pl.col(date_column).dt.truncate(POLARS_PERIODS[freq]).alias(name)
+        result = self._aggregate(self.data.lazy().with_columns(period), [name] + _listify(by), aggs)
+        if isinstance(result.index, pd.MultiIndex):
+            result.index = result.index.set_levels(result.index.levels[0].to_period(freq), level=0)
+        else:
+            result.index = result.index.to_period(freq)
+        return result
+
+
+BACKENDS = {"pandas": PandasBackend, "polars": PolarsBackend}
+_backends = {}  # name -> backend over the most recent frame
+_backends_lock = threading.Lock()
+
+
+def get_backend(frame, name=None):
+    """The configured backend over ``frame``; rebuilt when query_dataframe.reload_data replaces it."""
+    name = (name or BACKEND).lower()
+    if name not in BACKENDS:
+        raise ValueError(f"unknown QUERY_BACKEND {name!r}; choose from {', '.join(BACKENDS)}")
+    backend = _backends.get(name)
+    if backend is None or backend.frame is not frame:
+        with _backends_lock:
+            backend = _backends.get(name)
+            if backend is None or backend.frame is not frame:
+                backend = _backends[name] = BACKENDS[name](frame)
+    return backend
+
+
+class LazyFrame:
+    """A module's ``df`` global, loaded by ``load()`` on first use (or from warm-up) rather than at import.
+
+    query_dataframe and generate_chart bind its methods as their own
+    ``ensure_data``, ``needs_data``, ``reload_data``, ``backend`` and module
+    ``__getattr__`` (so ``module.df`` from elsewhere loads on access).
+    """
+
+    def __init__(self, namespace, load):
+        self.namespace = namespace  # the module's globals(), where handlers read ``df``
+        self.load = load
+        self._lock = threading.Lock()
+
+    def ensure_data(self):
+        with self._lock:
+            if "df" not in self.namespace:
+                self.namespace["df"] = self.load()
+        return self.namespace["df"]
+
+    def needs_data(self, func):
+        """Make sure the module-level ``df`` exists before ``func`` reads it."""
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if "df" not in self.namespace:
+                self.ensure_data()
+            return func(*args, **kwargs)
+        return wrapper
+
+    def reload_data(self):
+        """Replace ``df`` after the dataset changed on disk."""
+        self.namespace["df"] = self.load()
+
+    def backend(self):
+        """The configured backend (QUERY_BACKEND) over the loaded data."""
+        return get_backend(self.ensure_data())
+
+    def module_getattr(self, name):
+        if name == "df":
+            return self.ensure_data()
+        raise AttributeError(f"module {self.namespace['__name__']!r} has no attribute {name!r}")
+
+
+# Parity check ------------------------------------------------------------------
+
+# Every operation with the arguments the handlers and charts use
+CASES = {
+    "count": ("count", [("account_status", "==", "Active")]),
+    "count_in": ("count", [("account_tier", "in", ["Plus", "Premium"]), ("monthly_spend", ">", 500)]),
+    "scalar_mean": ("scalar", "churned", "mean"),
+    "scalar_median": ("scalar", "monthly_spend", "median"),
+    "scalar_sum": ("scalar", "monthly_revenue", "sum"),
+    "scalar_min_date": ("scalar", "account_created_at", "min"),
+    "column_filtered": ("column", "monthly_spend", [("churned", "==", True)]),
+    "unique": ("unique", "account_tier"),
+    "group_agg": ("group_agg", "account_tier", {"total_customers": ("churned", "count"),
+                                                "churned_customers": ("churned", "sum"),
+                                                "churn_rate": ("churned", "mean")}),
+    "group_agg_median": ("group_agg", "customer_segment", {"customers": ("monthly_revenue", "count"),
+                                                           "median_revenue": ("monthly_revenue", "median")}),
+    "group_agg_nulls": ("group_agg", "product_feature_used", {"churned": ("churned", "mean")}),
+    "group_agg_two_keys": ("group_agg", ["account_tier", "customer_segment"],
+                           {"monthly_spend": ("monthly_spend", "mean"), "churned": ("churned", "mean")}),
+    "value_counts": ("value_counts", "product_feature_used"),
+    "crosstab": ("crosstab", "product_feature_used", "account_tier"),
+    "crosstab_normalized": ("crosstab", "product_feature_used", "account_tier", "columns"),
+    "time_agg": ("time_agg", "account_created_at", {"signups": ("customer_id", "size")}),
+    "time_agg_by": ("time_agg", "account_created_at", {"monthly_revenue": ("monthly_revenue", "sum")},
+                    "account_tier"),
+}
+
+
+def _same(left, right, rtol=1e-9):
+    if isinstance(left, pd.DataFrame):
+        pd.testing.assert_frame_equal(left, right, check_dtype=False, check_index_type=False,
+                                      check_column_type=False, check_names=True, rtol=rtol)
+    elif isinstance(left, pd.Series):
+        pd.testing.assert_series_equal(left.reset_index(drop=True) if left.index.name is None else left,
+                                       right.reset_index(drop=True) if right.index.name is None else right,
+                                       check_dtype=False, check_index_type=False, rtol=rtol)
+    elif isinstance(left, float) or isinstance(right, float):
+        assert np.isclose(left, right, rtol=rtol), f"{left} != {right}"
+    else:
+        assert left == right, f"{left!r} != {right!r}"
+
+
+def parity(frame, names=("pandas", "polars"), repeat=3):
+    """Run every case on each backend; returns rows of ``{case, <backend>_ms, ..., error}``."""
+    backends = [BACKENDS[name](frame) for name in names]
+    rows = []
+    for case, (method, *args) in CASES.items():
+        row, results = {"case": case}, []
+        for backend in backends:
+            timings = []
+            for _ in range(repeat):
+                started = time.perf_counter()
+                result = getattr(backend, method)(*args)
+                timings.append((time.perf_counter() - started) * 1000)
+            row[f"{backend.name}_ms"] = round(min(timings), 2)
+            results.append(result)
+        try:
+            for other in results[1:]:
+                _same(results[0], other)
+            row["error"] = None
+        except AssertionError as e:
+            row["error"] = str(e).strip().splitlines()[0]
+        rows.append(row)
+    return rows
+
+
+def handler_parity(names=("pandas", "polars")):
+    """Answer every benchmark question and draw every chart on each backend; returns mismatching handlers."""
+    global BACKEND
+    from tools import benchmark, generate_chart, query_dataframe
+
+    answers, saved = {}, BACKEND
+    try:
+        for name in names:
+            BACKEND = name
+            for handler, question in benchmark.HANDLER_QUERIES.items():
+                answer = getattr(query_dataframe, handler)(question, question.lower())
+                answers.setdefault(handler, []).append(re.sub(r"\[ref: r\d+\]", "", answer))
+            with tempfile.TemporaryDirectory() as tmp, generate_chart.chart_output(os.path.join(tmp, "chart.png")):
+                for chart, description in benchmark.CHART_QUERIES.items():
+                    getattr(generate_chart, chart)(description)
+    finally:
+        BACKEND = saved
+    return [handler for handler, texts in answers.items() if len(set(texts)) > 1]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check that the query backends return the same results.")
+    parser.add_argument("--size", help="synthetic dataset size (see tools/synthetic_data.py); default: bundled data")
+    parser.add_argument("--backends", default="pandas,polars")
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    from tools import query_dataframe, synthetic_data
+
+    names = [n.strip() for n in args.backends.split(",") if n.strip()]
+    if args.size:
+        query_dataframe.DATA_PATH = synthetic_data.dataset_path(args.size)
+    frame = query_dataframe.ensure_data()
+    rows = parity(frame, names, args.repeat)
+    print(f"{len(frame):,} rows")
+    print(f"{'case':<22}" + "".join(f"{name + ' ms':>14}" for name in names) + "  result")
+    for row in rows:
+        print(f"{row['case']:<22}" + "".join(f"{row[name + '_ms']:>14.2f}" for name in names)
+              + "  " + (row["error"] or "same"))
+    mismatched = handler_parity(names)
+    for handler in mismatched:
+        print(f"{handler}: answers differ between backends")
+    failed = [row for row in rows if row["error"]] + mismatched
+    print("FAIL" if failed else "OK: all backends agree")
+    raise SystemExit(1 if failed else 0)
@@ -2,17 +2,44 @@ import pandas as pd
 import numpy as np
 from datetime import datetime, timedelta
 import json
+import re
+from tools import result_store, async_runtime, tracing, query_backend, intent_classifier
 
-df = pd.read_csv("data/fintech_product_data.csv", parse_dates=["account_created_at", "feature_used_at"])
+DATA_PATH = "data/fintech_product_data.csv"
 
+def load_data():
+    from tools import llm_cache
+    frame = pd.read_csv(DATA_PATH, parse_dates=["account_created_at", "feature_used_at"])
+    # Version of the file this frame came from, for caches keyed on the data (DATA_PATH can change later)
+    frame.attrs["data_version"] = llm_cache.data_version(DATA_PATH)
+    return frame
+
+# ``df`` is parsed on first use; ``query_dataframe.df`` from other modules loads it too
+_data = query_backend.LazyFrame(globals(), load_data)
+ensure_data, needs_data, reload_data, backend = _data.ensure_data, _data.needs_data, _data.reload_data, _data.backend
+__getattr__ = _data.module_getattr
+
+@tracing.traced("query_dataframe")
+@needs_data
 def query_dataframe(query):
     """
     Intelligently query the fintech dataset with enhanced natural language understanding.
     """
     query_lower = query.lower()
+    tracing.annotate(rows_scanned=len(df))
 
     # Enhanced pattern matching for common business questions
     patterns = {
+        'what if': handle_scenario,
+        'what happens': handle_scenario,
+        'scenario': handle_scenario,
+        'simulate': handle_scenario,
+        'about to churn': handle_churn_risk,
+        'likely to churn': handle_churn_risk,
+        'churn risk': handle_churn_risk,
+        # "at risk" only about customers; "revenue at risk" falls through to the revenue handler
+        **({'at risk': handle_churn_risk, 'at-risk': handle_churn_risk}
+           if intent_classifier.AT_RISK_CUSTOMERS.search(query_lower) else {}),
         'churn': handle_churn_analysis,
         'revenue': handle_revenue_analysis,
         'spending': handle_spending_analysis,
@@ -27,6 +54,7 @@ def query_dataframe(query):
     # Find the best matching pattern
     for pattern, handler in patterns.items():
         if pattern in query_lower:
+            tracing.annotate(handler=handler.__name__)
             try:
                 return handler(query, query_lower)
             except Exception as e:
@@ -37,7 +65,7 @@ def query_dataframe(query):
         if query.startswith('df.'):
             result = eval(query)
             if hasattr(result, 'to_markdown'):
-                return result.head(15).to_markdown()
+                return _table("Query Result", result.head(15))
             else:
                 return str(result)
         else:
@@ -46,138 +74,183 @@ def query_dataframe(query):
     except Exception as e:
         return get_helpful_error_message(e, query)
 
+async def aquery_dataframe(query):
+    """Async variant of query_dataframe; the pandas work runs on the shared CPU pool."""
+    return await async_runtime.run_blocking(query_dataframe, query)
+
+def _table(title, result):
+    """Render a result table and keep the frame so charts can reuse it by reference."""
+    ref = result_store.put(title, result)
+    return f"{title} [ref: {ref}]:\n{result.to_markdown()}"
+
+@needs_data
 def handle_churn_analysis(query, query_lower):
     """Handle churn-related queries."""
+    data = backend()
+    churn_columns = {'total_customers': ('churned', 'count'), 'churned_customers': ('churned', 'sum'),
+                     'churn_rate': ('churned', 'mean')}
     if 'tier' in query_lower or 'account_tier' in query_lower:
-        result = df.groupby('account_tier')['churned'].agg(['count', 'sum', 'mean']).round(3)
-        result.columns = ['total_customers', 'churned_customers', 'churn_rate']
-        summary = f"Overall churn rate: {df['churned'].mean():.1%}\n\n"
-        return summary + f"Churn Rate by Account Tier:\n{result.to_markdown()}"
+        result = data.group_agg('account_tier', churn_columns).round(3)
+        summary = f"Overall churn rate: {data.scalar('churned', 'mean'):.1%}\n\n"
+        return summary + _table("Churn Rate by Account Tier", result)
 
     elif 'segment' in query_lower:
-        result = df.groupby('customer_segment')['churned'].agg(['count', 'sum', 'mean']).round(3)
-        result.columns = ['total_customers', 'churned_customers', 'churn_rate']
-        return f"Churn Rate by Customer Segment:\n{result.to_markdown()}"
+        result = data.group_agg('customer_segment', churn_columns).round(3)
+        return _table("Churn Rate by Customer Segment", result)
 
     elif 'feature' in query_lower:
-        feature_churn = df.groupby('product_feature_used')['churned'].agg(['count', 'sum', 'mean']).round(3)
-        feature_churn.columns = ['total_customers', 'churned_customers', 'churn_rate']
-        return f"Churn Rate by Feature Usage:\n{feature_churn.to_markdown()}"
+        feature_churn = data.group_agg('product_feature_used', churn_columns).round(3)
+        return _table("Churn Rate by Feature Usage", feature_churn)
 
     else:
         # General churn analysis
-        overall_churn = df['churned'].mean()
-        by_tier = df.groupby('account_tier')['churned'].mean().round(3)
-        by_segment = df.groupby('customer_segment')['churned'].mean().round(3)
+        overall_churn = data.scalar('churned', 'mean')
+        by_tier = data.group_agg('account_tier', {'churned': ('churned', 'mean')})['churned'].round(3)
+        by_segment = data.group_agg('customer_segment', {'churned': ('churned', 'mean')})['churned'].round(3)
 
         result = f"Overall Churn Rate: {overall_churn:.1%}\n\n"
-        result += f"By Tier:\n{by_tier.to_markdown()}\n\n"
-        result += f"By Segment:\n{by_segment.to_markdown()}"
+        result += _table("By Tier", by_tier) + "\n\n"
+        result += _table("By Segment", by_segment)
         return result
 
+@needs_data
+def handle_scenario(query, query_lower):
+    """Handle what-if questions with a Monte Carlo scenario simulation."""
+    from tools import scenario_simulator
+
+    params = scenario_simulator.parse_scenario(query)
+    if not any(params.values()):
+        return ("Scenario not recognized. Describe the change, e.g. 'what if 10% of Free users upgrade to Plus', "
+                "'what if churn drops 2 points for Students' or 'what if spend increases 5%'.")
+    result = scenario_simulator.summarize(scenario_simulator.simulate(**params))
+    return (f"Scenario: {scenario_simulator.describe(params)}\n"
+            f"Monthly outcomes over {scenario_simulator.SIMULATIONS:,} simulations (change = scenario - baseline):\n\n"
+            + _table("Scenario Simulation", result))
+
+@needs_data
+def handle_churn_risk(query, query_lower):
+    """Handle "who is about to churn" queries from the precomputed risk index."""
+    from tools import churn_model
+
+    tier = next((t for t in ['Free', 'Plus', 'Premium'] if t.lower() in query_lower), None)
+    segment = next((s for s in ['Student', 'Professional', 'Retired'] if s.lower() in query_lower), None)
+    limit = re.search(r'\b(?:top|first)\s+(\d+)\b', query_lower)
+    result = churn_model.at_risk(int(limit.group(1)) if limit else 20, tier=tier, segment=segment)
+    scope = " ".join(filter(None, [tier, segment])) or "all"
+    title = f"Active Customers Most Likely to Churn ({scope})"
+    if 'tier' in query_lower and tier is None:
+        return _table("Churn Risk by Account Tier", churn_model.risk_summary()) + "\n\n" + _table(title, result)
+    return _table(title, result)
+
+@needs_data
 def handle_revenue_analysis(query, query_lower):
     """Handle revenue-related queries."""
+    revenue_columns = {'customers': ('monthly_revenue', 'count'), 'total_revenue': ('monthly_revenue', 'sum'),
+                       'avg_revenue': ('monthly_revenue', 'mean'), 'median_revenue': ('monthly_revenue', 'median')}
     if 'tier' in query_lower:
-        result = df.groupby('account_tier')['monthly_revenue'].agg(['count', 'sum', 'mean', 'median']).round(2)
-        result.columns = ['customers', 'total_revenue', 'avg_revenue', 'median_revenue']
-        return f"Revenue Analysis by Tier:\n{result.to_markdown()}"
+        result = backend().group_agg('account_tier', revenue_columns).round(2)
+        return _table("Revenue Analysis by Tier", result)
 
     elif 'segment' in query_lower:
-        result = df.groupby('customer_segment')['monthly_revenue'].agg(['count', 'sum', 'mean', 'median']).round(2)
-        result.columns = ['customers', 'total_revenue', 'avg_revenue', 'median_revenue']
-        return f"Revenue Analysis by Segment:\n{result.to_markdown()}"
+        result = backend().group_agg('customer_segment', revenue_columns).round(2)
+        return _table("Revenue Analysis by Segment", result)
 
     else:
-        total_revenue = df['monthly_revenue'].sum()
-        avg_revenue = df['monthly_revenue'].mean()
-        revenue_by_tier = df.groupby('account_tier')['monthly_revenue'].sum().round(2)
+        data = backend()
+        total_revenue = data.scalar('monthly_revenue', 'sum')
+        avg_revenue = data.scalar('monthly_revenue', 'mean')
+        revenue_by_tier = data.group_agg('account_tier', {'monthly_revenue': ('monthly_revenue', 'sum')})
+        revenue_by_tier = revenue_by_tier['monthly_revenue'].round(2)
 
         result = f"Total Revenue: ${total_revenue:,.2f}\n"
         result += f"Average Revenue per Customer: ${avg_revenue:.2f}\n\n"
-        result += f"Revenue by Tier:\n{revenue_by_tier.to_markdown()}"
+        result += _table("Revenue by Tier", revenue_by_tier)
         return result
 
+@needs_data
 def handle_spending_analysis(query, query_lower):
     """Handle spending pattern queries."""
+    spend_columns = {'customers': ('monthly_spend', 'count'), 'total_spend': ('monthly_spend', 'sum'),
+                     'avg_spend': ('monthly_spend', 'mean'), 'median_spend': ('monthly_spend', 'median')}
     if 'tier' in query_lower:
-        result = df.groupby('account_tier')['monthly_spend'].agg(['count', 'sum', 'mean', 'median']).round(2)
-        result.columns = ['customers', 'total_spend', 'avg_spend', 'median_spend']
-        return f"Spending Analysis by Tier:\n{result.to_markdown()}"
+        result = backend().group_agg('account_tier', spend_columns).round(2)
+        return _table("Spending Analysis by Tier", result)
 
     elif 'segment' in query_lower:
-        result = df.groupby('customer_segment')['monthly_spend'].agg(['count', 'sum', 'mean', 'median']).round(2)
-        result.columns = ['customers', 'total_spend', 'avg_spend', 'median_spend']
-        return f"Spending Analysis by Segment:\n{result.to_markdown()}"
+        result = backend().group_agg('customer_segment', spend_columns).round(2)
+        return _table("Spending Analysis by Segment", result)
 
     else:
-        avg_spend = df['monthly_spend'].mean()
-        median_spend = df['monthly_spend'].median()
-        spend_by_tier = df.groupby('account_tier')['monthly_spend'].mean().round(2)
+        data = backend()
+        avg_spend = data.scalar('monthly_spend', 'mean')
+        median_spend = data.scalar('monthly_spend', 'median')
+        spend_by_tier = data.group_agg('account_tier', {'monthly_spend': ('monthly_spend', 'mean')})
+        spend_by_tier = spend_by_tier['monthly_spend'].round(2)
 
         result = f"Average Monthly Spend: ${avg_spend:.2f}\n"
         result += f"Median Monthly Spend: ${median_spend:.2f}\n\n"
-        result += f"Average Spend by Tier:\n{spend_by_tier.to_markdown()}"
+        result += _table("Average Spend by Tier", spend_by_tier)
         return result
 
+@needs_data
 def handle_feature_analysis(query, query_lower):
     """Handle feature usage queries."""
-    feature_usage = df['product_feature_used'].value_counts()
-    feature_revenue = df.groupby('product_feature_used')['monthly_revenue'].mean().round(2)
+    data = backend()
+    feature_usage = data.value_counts('product_feature_used')
+    feature_revenue = data.group_agg('product_feature_used', {'monthly_revenue': ('monthly_revenue', 'mean')})
+    feature_revenue = feature_revenue['monthly_revenue'].round(2)
 
-    result = f"Feature Usage Count:\n{feature_usage.to_markdown()}\n\n"
-    result += f"Average Revenue by Feature:\n{feature_revenue.to_markdown()}"
+    result = _table("Feature Usage Count", feature_usage) + "\n\n"
+    result += _table("Average Revenue by Feature", feature_revenue)
     return result
 
+@needs_data
 def handle_customer_analysis(query, query_lower):
     """Handle customer behavior queries."""
+    data = backend()
     if 'active' in query_lower:
-        active_customers = df[df['account_status'] == 'Active'].shape[0]
-        total_customers = df.shape[0]
+        active_customers = data.count([('account_status', '==', 'Active')])
+        total_customers = data.count()
         active_rate = active_customers / total_customers
         return f"Active Customers: {active_customers:,} out of {total_customers:,} ({active_rate:.1%})"
 
     else:
-        status_counts = df['account_status'].value_counts()
-        tier_counts = df['account_tier'].value_counts()
+        status_counts = data.value_counts('account_status')
+        tier_counts = data.value_counts('account_tier')
 
-        result = f"Customer Status Distribution:\n{status_counts.to_markdown()}\n\n"
-        result += f"Tier Distribution:\n{tier_counts.to_markdown()}"
+        result = _table("Customer Status Distribution", status_counts) + "\n\n"
+        result += _table("Tier Distribution", tier_counts)
         return result
 
+SUMMARY_COLUMNS = {
+    'customers': ('customer_id', 'count'),
+    'avg_spend': ('monthly_spend', 'mean'),
+    'avg_revenue': ('monthly_revenue', 'mean'),
+    'churn_rate': ('churned', 'mean'),
+    'avg_transactions': ('transactions_count', 'mean')
+}
+
+@needs_data
 def handle_tier_analysis(query, query_lower):
     """Handle tier-specific analysis."""
-    tier_summary = df.groupby('account_tier').agg({
-        'customer_id': 'count',
-        'monthly_spend': 'mean',
-        'monthly_revenue': 'mean',
-        'churned': 'mean',
-        'transactions_count': 'mean'
-    }).round(2)
-
-    tier_summary.columns = ['customers', 'avg_spend', 'avg_revenue', 'churn_rate', 'avg_transactions']
-    return f"Comprehensive Tier Analysis:\n{tier_summary.to_markdown()}"
+    tier_summary = backend().group_agg('account_tier', SUMMARY_COLUMNS).round(2)
+    return _table("Comprehensive Tier Analysis", tier_summary)
 
+@needs_data
 def handle_segment_analysis(query, query_lower):
     """Handle customer segment analysis."""
-    segment_summary = df.groupby('customer_segment').agg({
-        'customer_id': 'count',
-        'monthly_spend': 'mean',
-        'monthly_revenue': 'mean',
-        'churned': 'mean',
-        'transactions_count': 'mean'
-    }).round(2)
-
-    segment_summary.columns = ['customers', 'avg_spend', 'avg_revenue', 'churn_rate', 'avg_transactions']
-    return f"Customer Segment Analysis:\n{segment_summary.to_markdown()}"
+    segment_summary = backend().group_agg('customer_segment', SUMMARY_COLUMNS).round(2)
+    return _table("Customer Segment Analysis", segment_summary)
 
+@needs_data
 def handle_trend_analysis(query, query_lower):
     """Handle trend and time-based queries."""
-    # Create month-year from account_created_at for trend analysis
-    df['month_year'] = df['account_created_at'].dt.to_period('M')
-    monthly_signups = df.groupby('month_year').size()
+    # Bucket account_created_at by month for trend analysis
+    monthly_signups = backend().time_agg('account_created_at', {'signups': ('customer_id', 'size')})['signups']
 
-    return f"Monthly Customer Signups Trend:\n{monthly_signups.tail(12).to_markdown()}"
+    return _table("Monthly Customer Signups Trend", monthly_signups.tail(12))
 
+@needs_data
 def handle_comparison_analysis(query, query_lower):
     """Handle comparison queries."""
     if 'tier' in query_lower:
@@ -186,13 +259,13 @@ def handle_comparison_analysis(query, query_lower):
         return handle_segment_analysis(query, query_lower)
     else:
         # Compare key metrics across different dimensions
-        comparison = df.groupby(['account_tier', 'customer_segment']).agg({
-            'monthly_spend': 'mean',
-            'monthly_revenue': 'mean',
-            'churned': 'mean'
+        comparison = backend().group_agg(['account_tier', 'customer_segment'], {
+            'monthly_spend': ('monthly_spend', 'mean'),
+            'monthly_revenue': ('monthly_revenue', 'mean'),
+            'churned': ('churned', 'mean')
         }).round(2)
 
-        return f"Tier vs Segment Comparison:\n{comparison.to_markdown()}"
+        return _table("Tier vs Segment Comparison", comparison)
 
 def get_helpful_error_message(error, query):
     """Provide helpful error messages and suggestions."""
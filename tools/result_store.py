@@ -0,0 +1,74 @@
+"""Per-session store of the aggregated frames produced by Query DataFrame.
+
+Every table `query_dataframe` renders is recorded here under a short
+reference (``r1``, ``r2``, ...) so Generate Visualization can plot the exact
+same numbers instead of re-aggregating the dataset on its own.
+"""
+import itertools
+import threading
+from collections import OrderedDict
+from contextvars import ContextVar
+
+MAX_SESSIONS = 256
+MAX_RESULTS_PER_SESSION = 20
+
+_current_session = ContextVar("result_store_session", default="default")
+_sessions = OrderedDict()
+_lock = threading.Lock()
+_ref_counter = itertools.count(1)
+
+
+def set_session(session_id):
+    """Bind the current thread/task to a conversation. Returns a reset token."""
+    return _current_session.set(str(session_id))
+
+
+def get_session():
+    return _current_session.get()
+
+
+def _bucket(session_id, create=False):
+    """Return the result map for a session, evicting the least recently used sessions."""
+    session_id = session_id or get_session()
+    bucket = _sessions.get(session_id)
+    if bucket is None and create:
+        bucket = _sessions[session_id] = OrderedDict()
+        while len(_sessions) > MAX_SESSIONS:
+            _sessions.popitem(last=False)
+    if bucket is not None:
+        _sessions.move_to_end(session_id)
+    return bucket
+
+
+def put(label, frame, session_id=None):
+    """Store a result frame and return its reference."""
+    ref = f"r{next(_ref_counter)}"
+    with _lock:
+        bucket = _bucket(session_id, create=True)
+        bucket[ref] = (label, frame)
+        while len(bucket) > MAX_RESULTS_PER_SESSION:
+            bucket.popitem(last=False)
+    return ref
+
+
+def get(ref=None, session_id=None):
+    """Look up ``(label, frame)`` by reference, or the latest result when ref is None."""
+    with _lock:
+        bucket = _bucket(session_id)
+        if not bucket:
+            return None
+        if ref is None:
+            return next(reversed(bucket.values()))
+        return bucket.get(ref)
+
+
+def list_results(session_id=None):
+    """Return ``[(ref, label), ...]`` for a session, oldest first."""
+    with _lock:
+        bucket = _bucket(session_id)
+        return [(ref, label) for ref, (label, _) in bucket.items()] if bucket else []
+
+
+def clear(session_id=None):
+    with _lock:
+        _sessions.pop(session_id or get_session(), None)
@@ -0,0 +1,210 @@
+"""What-if scenarios for tier migrations, churn changes and spend changes.
+
+The customer table is reduced once to a tier x segment state: active
+customers, mean spend (and its standard error), revenue take rate
+(revenue / spend) and churned/total counts. A scenario is a set of
+parameters over that state:
+
+- ``migrations``: ``{(from_tier, to_tier): share}`` of active customers who
+  move tier. Movers keep their spend and earn the new tier's take rate and
+  churn rate.
+- ``churn_deltas``: ``{(tier or None, segment or None): delta}`` added to the
+  churn probability (``-0.02`` is "churn drops 2 points").
+- ``spend_change``: relative change in spend (``0.1`` is +10%). Revenue
+  follows with the spend elasticity of revenue estimated from the data.
+
+Each run draws SCENARIO_SIMULATIONS Monte Carlo samples at once as NumPy
+arrays of shape (simulations, tier, tier, segment): uncertain churn rates
+(Beta posteriors), uncertain mean spend and multinomial migration
+outcomes. Each draw yields expected retained customers and revenue, and
+baseline and scenario share the same draws, so their difference reflects
+the scenario (a scenario that changes nothing shows exactly no change).
+Results are outcome distributions, not point guesses.
+"""
+import os
+import re
+import threading
+
+import numpy as np
+import pandas as pd
+
+from tools import query_dataframe, tracing
+
+SIMULATIONS = int(os.getenv("SCENARIO_SIMULATIONS", "5000"))
+SEED = 0
+TIERS = ["Free", "Plus", "Premium"]
+SEGMENTS = ["Student", "Professional", "Retired"]
+
+
+class Baseline:
+    """Tier x segment aggregates (arrays indexed [tier, segment]) for one loaded dataset."""
+
+    def __init__(self, frame):
+        self.frame = frame
+        tiers = pd.Categorical(frame["account_tier"], categories=TIERS)
+        segments = pd.Categorical(frame["customer_segment"], categories=SEGMENTS)
+        grouped = frame.groupby([tiers, segments], observed=False)
+        shape = (len(TIERS), len(SEGMENTS))
+
+        def cells(series, fill=0.0):
+            return series.reindex(pd.MultiIndex.from_product([TIERS, SEGMENTS])).fillna(fill).to_numpy().reshape(shape)
+
+        self.total = cells(grouped.size())
+        self.churned = cells(grouped["churned"].sum())
+        is_active = ~frame["churned"].to_numpy(dtype=bool)
+        active_grouped = frame[is_active].groupby([tiers[is_active], segments[is_active]], observed=False)
+        self.active = cells(active_grouped.size()).astype(np.int64)
+        self.spend = cells(active_grouped["monthly_spend"].mean())
+        self.spend_se = cells(active_grouped["monthly_spend"].std() / np.sqrt(active_grouped.size().clip(lower=1)))
+        spend_sum = cells(grouped["monthly_spend"].sum())
+        revenue_sum = cells(grouped["monthly_revenue"].sum())
+        self.take_rate = np.divide(revenue_sum, spend_sum, out=np.zeros(shape), where=spend_sum > 0)
+        self.elasticity = self._elasticity(frame)
+
+    @staticmethod
+    def _elasticity(frame):
+        # Slope of log revenue on log spend across customers with both positive
+        spend, revenue = frame["monthly_spend"].to_numpy(float), frame["monthly_revenue"].to_numpy(float)
+        positive = (spend > 0) & (revenue > 0)
+        if positive.sum() < 30:
+            return 1.0
+        return float(np.polyfit(np.log(spend[positive]), np.log(revenue[positive]), 1)[0])
+
+
+_baseline = None
+_baseline_lock = threading.Lock()
+
+
+def get_baseline():
+    """Aggregates for the loaded dataset, rebuilt only when query_dataframe reloads it."""
+    global _baseline
+    frame = query_dataframe.df
+    if _baseline is None or _baseline.frame is not frame:
+        with _baseline_lock:
+            if _baseline is None or _baseline.frame is not frame:
+                _baseline = Baseline(frame)
+    return _baseline
+
+
+def _migration_matrix(migrations):
+    matrix = np.zeros((len(TIERS), len(TIERS)))
+    for (source, target), share in migrations.items():
+        matrix[TIERS.index(source), TIERS.index(target)] += share
+    if (matrix.sum(axis=1) > 1).any():
+        raise ValueError("migration shares out of a tier add up to more than 100%")
+    return matrix
+
+
+def _cells(tier, segment):
+    """Index into [tier, segment] arrays for a scope; None means every tier/segment."""
+    return TIERS.index(tier) if tier else slice(None), SEGMENTS.index(segment) if segment else slice(None)
+
+
+def _churn_delta(churn_deltas):
+    delta = np.zeros((len(TIERS), len(SEGMENTS)))
+    for (tier, segment), change in churn_deltas.items():
+        delta[_cells(tier, segment)] += change
+    return delta
+
+
+@tracing.traced("scenario_simulation")
+def simulate(migrations=None, churn_deltas=None, spend_change=0.0, simulations=SIMULATIONS, seed=SEED):
+    """Monte Carlo outcomes for baseline and scenario; returns ``{metric: (baseline, scenario)}`` arrays."""
+    base = get_baseline()
+    rng = np.random.default_rng(seed)
+    n_tiers = len(TIERS)
+    shape = (simulations, n_tiers, len(SEGMENTS))
+
+    # Parameter uncertainty, shared by baseline and scenario
+    churn_rate = rng.beta(base.churned + 1, base.total - base.churned + 1, size=shape)
+    spend = np.maximum(rng.normal(base.spend, base.spend_se, size=shape), 0.0)
+
+    # flows[s, i, j, g]: customers of segment g moving from tier i to tier j in simulation s
+    matrix = _migration_matrix(migrations or {})
+    flows = np.zeros((simulations, n_tiers, n_tiers, len(SEGMENTS)), dtype=np.int64)
+    for i in range(n_tiers):
+        pvals = np.append(matrix[i], 1 - matrix[i].sum())
+        moved = rng.multinomial(base.active[i], pvals, size=(simulations, len(SEGMENTS)))
+        flows[:, i] = moved[..., :n_tiers].transpose(0, 2, 1)
+        flows[:, i, i] += moved[..., n_tiers]
+
+    # Movers take the destination tier's churn rate and take rate but keep their own spend
+    scenario_churn = np.clip(churn_rate + _churn_delta(churn_deltas or {}), 0.0, 1.0)
+    retained = flows * (1 - scenario_churn[:, None, :, :])
+    revenue_multiplier = (1 + spend_change) ** base.elasticity
+    revenue = (retained * spend[:, :, None, :] * base.take_rate[None, None, :, :]).sum(axis=(1, 2, 3))
+    revenue = revenue * revenue_multiplier
+
+    baseline_retained = base.active * (1 - churn_rate)
+    baseline_revenue = (baseline_retained * spend * base.take_rate).sum(axis=(1, 2))
+
+    active = base.active.sum()
+    return {
+        "Monthly revenue": (baseline_revenue, revenue),
+        "Retained customers": (baseline_retained.sum(axis=(1, 2)), retained.sum(axis=(1, 2, 3))),
+        "Churned customers": (active - baseline_retained.sum(axis=(1, 2)), active - retained.sum(axis=(1, 2, 3))),
+    }
+
+
+def summarize(outcomes):
+    """Distribution table: baseline and scenario means, change percentiles, chance of an increase."""
+    rows = {}
+    for metric, (baseline, scenario) in outcomes.items():
+        change = scenario - baseline
+        change[np.abs(change) < 1e-9 * np.abs(baseline).max()] = 0.0  # float noise when nothing moved
+        rows[metric] = {"baseline_mean": baseline.mean(), "scenario_mean": scenario.mean(),
+                        "change_mean": change.mean(), "change_p5": np.percentile(change, 5),
+                        "change_p50": np.percentile(change, 50), "change_p95": np.percentile(change, 95),
+                        "prob_increase": (change > 0).mean()}
+    return pd.DataFrame.from_dict(rows, orient="index").round(3)
+
+
+# Natural-language scenarios ---------------------------------------------------
+
+_TIER = r"(free|plus|premium)"
+_NUMBER = r"(\d+(?:\.\d+)?)"
+_UP = ("rises", "rise", "increases", "increase", "grows", "grow", "goes up", "go up", "up")
+
+
+def parse_scenario(text):
+    """Extract scenario parameters from a question; returns kwargs for ``simulate``."""
+    lower = text.lower()
+    migrations, churn_deltas, spend_change = {}, {}, 0.0
+
+    for share, source, target in re.findall(
+            rf"{_NUMBER}\s*%\s*of\s+{_TIER}\s*(?:tier\s+)?(?:users|customers|accounts)?\s*"
+            rf"(?:upgrade|upgrades|downgrade|downgrades|move|moves|migrate|migrates|switch|switches|convert|converts)"
+            rf"\s+(?:to|into)\s+{_TIER}", lower):
+        key = (source.title(), target.title())
+        migrations[key] = migrations.get(key, 0.0) + float(share) / 100
+
+    for direction, amount, unit, scope in re.findall(
+            rf"churn(?:\s+rate)?\s+(drops|drop|falls|fall|decreases|decrease|goes down|go down|down|{'|'.join(_UP)})"
+            rf"\s+(?:by\s+)?{_NUMBER}\s*(points?|pp|percentage points?|%)?((?:\s+(?:for|among|in)\s+\w+(?:\s+\w+)?)?)", lower):
+        sign = 1 if direction in _UP else -1
+        tier = next((t for t in TIERS if t.lower() in scope), None)
+        segment = next((s for s in SEGMENTS if s.lower() in scope), None)
+        change = float(amount) / 100
+        if unit == "%":
+            # "churn drops 10%" is relative to the scope's current churn rate
+            base, cells = get_baseline(), _cells(tier, segment)
+            change *= float(base.churned[cells].sum() / max(base.total[cells].sum(), 1))
+        churn_deltas[(tier, segment)] = churn_deltas.get((tier, segment), 0.0) + sign * change
+
+    match = re.search(rf"spend(?:ing)?\s+(drops|drop|falls|fall|decreases|decrease|goes down|go down|down|"
+                      rf"{'|'.join(_UP)})\s+(?:by\s+)?{_NUMBER}\s*%", lower)
+    if match:
+        spend_change = (1 if match.group(1) in _UP else -1) * float(match.group(2)) / 100
+
+    return {"migrations": migrations, "churn_deltas": churn_deltas, "spend_change": spend_change}
+
+
+def describe(params):
+    parts = [f"{share:.0%} of active {source} customers move to {target}"
+             for (source, target), share in params["migrations"].items()]
+    for (tier, segment), delta in params["churn_deltas"].items():
+        scope = " ".join(filter(None, [tier, segment])) or "all"
+        parts.append(f"churn {'+' if delta >= 0 else '-'}{abs(delta) * 100:.1f} pts for {scope} customers")
+    if params["spend_change"]:
+        parts.append(f"spend {params['spend_change']:+.0%}")
+    return "; ".join(parts)
@@ -0,0 +1,134 @@
+"""Per-session conversation memory with size caps, idle eviction and optional spill to disk.
+
+Each conversation (keyed by the same session ID as the result store) gets its
+own LangChain memory object, created by a factory. Stored messages are
+trimmed to a message and token cap after every turn, sessions idle longer
+than ``idle_seconds`` or beyond ``max_sessions`` are evicted least recently
+used first, and when a spill directory is configured evicted histories are
+written there and restored transparently on the next request. A session is
+pinned while one of its requests runs (``use``), so the messages that
+request appends never land on an evicted copy.
+"""
+import json
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from langchain.schema import messages_from_dict, messages_to_dict
+
+from tools import context_budget
+
+MAX_SESSIONS = int(os.getenv("SESSION_MAX_IN_MEMORY", "500"))
+IDLE_SECONDS = float(os.getenv("SESSION_IDLE_SECONDS", "1800"))
+MAX_MESSAGES = int(os.getenv("SESSION_MAX_MESSAGES", "20"))
+MAX_TOKENS = int(os.getenv("SESSION_MAX_TOKENS", "8000"))
+SPILL_DIR = os.getenv("SESSION_SPILL_DIR", "")
+
+
+class SessionMemoryStore:
+    def __init__(self, factory, max_sessions=MAX_SESSIONS, idle_seconds=IDLE_SECONDS,
+                 max_messages=MAX_MESSAGES, max_tokens=MAX_TOKENS, spill_dir=SPILL_DIR):
+        self.factory = factory
+        self.max_sessions = max_sessions
+        self.idle_seconds = idle_seconds
+        self.max_messages = max_messages
+        self.max_tokens = max_tokens
+        self.spill_dir = spill_dir
+        self._sessions = OrderedDict()  # session_id -> (memory, last_used)
+        self._active = {}  # session_id -> requests in flight
+        self._lock = threading.Lock()
+        self.metrics = {"created": 0, "restored": 0, "evicted": 0, "spilled": 0}
+
+    def _spill_path(self, session_id):
+        safe = re.sub(r"[^\w.-]", "_", str(session_id))
+        return os.path.join(self.spill_dir, f"{safe}.json")
+
+    def get(self, session_id, pin=False):
+        """Return the memory for a session, restoring it from disk or creating it as needed."""
+        now = time.time()
+        with self._lock:
+            if pin:
+                self._active[session_id] = self._active.get(session_id, 0) + 1
+            entry = self._sessions.pop(session_id, None)
+            memory = entry[0] if entry else None
+            if memory is None:
+                memory = self.factory()
+                if self._restore(session_id, memory):
+                    self.metrics["restored"] += 1
+                else:
+                    self.metrics["created"] += 1
+            self._sessions[session_id] = (memory, now)
+            evicted = self._collect_evictions(now)
+        for old_id, old_memory in evicted:
+            self._spill(old_id, old_memory)
+        return memory
+
+    @contextmanager
+    def use(self, session_id):
+        """Memory for one request; the session is not evicted or spilled until the request ends."""
+        memory = self.get(session_id, pin=True)
+        try:
+            yield memory
+        finally:
+            with self._lock:
+                remaining = self._active.pop(session_id, 1) - 1
+                if remaining:
+                    self._active[session_id] = remaining
+                if session_id in self._sessions:
+                    self._sessions[session_id] = (memory, time.time())
+                    self._sessions.move_to_end(session_id)
+            self.trim(session_id)
+
+    def _collect_evictions(self, now):
+        evicted = []
+        # Least recently used first; sessions with a request in flight are skipped
+        for session_id, (memory, last_used) in list(self._sessions.items()):
+            if len(self._sessions) <= self.max_sessions and now - last_used <= self.idle_seconds:
+                break
+            if self._active.get(session_id):
+                continue
+            del self._sessions[session_id]
+            evicted.append((session_id, memory))
+            self.metrics["evicted"] += 1
+        return evicted
+
+    def trim(self, session_id):
+        """Cap a session's stored history by message count and total tokens (oldest dropped first)."""
+        with self._lock:
+            entry = self._sessions.get(session_id)
+        if entry is None:
+            return
+        messages = entry[0].chat_memory.messages
+        if len(messages) > self.max_messages:
+            del messages[:len(messages) - self.max_messages]
+        while len(messages) > 2 and sum(context_budget.count_tokens(m.content) for m in messages) > self.max_tokens:
+            del messages[:2]
+
+    def drop(self, session_id):
+        """Forget a session entirely, including any spilled copy."""
+        with self._lock:
+            self._sessions.pop(session_id, None)
+        if self.spill_dir and os.path.exists(self._spill_path(session_id)):
+            os.remove(self._spill_path(session_id))
+
+    def _spill(self, session_id, memory):
+        if not self.spill_dir or not memory.chat_memory.messages:
+            return
+        os.makedirs(self.spill_dir, exist_ok=True)
+        with open(self._spill_path(session_id), "w") as f:
+            json.dump(messages_to_dict(memory.chat_memory.messages), f)
+        self.metrics["spilled"] += 1
+
+    def _restore(self, session_id, memory):
+        if not self.spill_dir or not os.path.exists(self._spill_path(session_id)):
+            return False
+        with open(self._spill_path(session_id)) as f:
+            memory.chat_memory.messages = messages_from_dict(json.load(f))
+        return True
+
+    def stats(self):
+        with self._lock:
+            return {**self.metrics, "in_memory": len(self._sessions), "active": len(self._active)}
@@ -1,11 +1,16 @@
-from langchain_openai import ChatOpenAI
 from langchain.prompts import PromptTemplate
 from dotenv import load_dotenv
 import json
+import os
+from tools import llm_cache, llm_gateway, intent_classifier, tracing
 
 load_dotenv()
 
-llm = ChatOpenAI(model="gpt-4o", temperature=0.1)
+# Local plans at or above this confidence skip the LLM call entirely
+MIN_LOCAL_CONFIDENCE = float(os.getenv("SMART_ANALYZER_MIN_CONFIDENCE", intent_classifier.DEFAULT_MIN_CONFIDENCE))
+
+# Shared pooled gateway: coalescing, rate limiting and retries (see tools/llm_gateway.py)
+llm = llm_gateway.gateway
 
 ANALYSIS_TEMPLATE = """
 You are a fintech data analysis expert. Analyze the user's question and provide a structured analysis plan.
@@ -32,62 +37,56 @@ Examples:
 - "Which features are popular?" → frequency analysis with bar charts or pie charts
 """
 
+@tracing.traced("smart_analyzer")
 def analyze_question(question):
     """Intelligently analyze user questions to determine the best analytical approach."""
+    ready = plan_without_llm(question)
+    if ready is not None:
+        return ready
+
+    try:
+        response = llm.predict(format_analysis_prompt(question))
+        return parse_analysis(question, response)
+    except Exception as e:
+        return create_fallback_analysis(question)
 
-    prompt = PromptTemplate.from_template(ANALYSIS_TEMPLATE)
-    formatted_prompt = prompt.format(question=question)
+@tracing.traced("smart_analyzer")
+async def aanalyze_question(question):
+    """Async variant of analyze_question; the LLM call does not block a thread."""
+    ready = plan_without_llm(question)
+    if ready is not None:
+        return ready
 
     try:
-        response = llm.predict(formatted_prompt)
-        # Try to extract JSON from response
-        start = response.find('{')
-        end = response.rfind('}') + 1
-        if start != -1 and end != 0:
-            json_str = response[start:end]
-            analysis = json.loads(json_str)
-            return json.dumps(analysis, indent=2)
-        else:
-            # Fallback if JSON extraction fails
-            return create_fallback_analysis(question)
+        response = await llm.apredict(format_analysis_prompt(question))
+        return parse_analysis(question, response)
     except Exception as e:
         return create_fallback_analysis(question)
 
-def create_fallback_analysis(question):
-    """Create a basic analysis when LLM parsing fails."""
-    question_lower = question.lower()
+def plan_without_llm(question):
+    """Return a confident local plan or a cached LLM plan, or None if the LLM is needed."""
+    # Fast path: the local classifier handles most questions in well under a millisecond
+    plan = intent_classifier.classify(question)
+    tracing.annotate(local_confidence=plan["confidence"])
+    if plan["confidence"] >= MIN_LOCAL_CONFIDENCE:
+        tracing.annotate(plan_source="local")
+        return json.dumps(plan, indent=2)
+    return llm_cache.cache.get("smart_analyzer", question, llm_cache.model_name(llm))
 
-    # Determine basic intent
-    if any(word in question_lower for word in ['churn', 'retention', 'leave', 'quit']):
-        intent = "churn_analysis"
-        metrics = ["churn_rate", "retention_rate", "customer_lifetime"]
-        viz_type = "bar"
-    elif any(word in question_lower for word in ['revenue', 'money', 'profit', 'income']):
-        intent = "revenue_analysis"
-        metrics = ["monthly_revenue", "revenue_per_customer", "total_revenue"]
-        viz_type = "line"
-    elif any(word in question_lower for word in ['compare', 'vs', 'versus', 'difference']):
-        intent = "comparison"
-        metrics = ["comparative_metrics"]
-        viz_type = "bar"
-    elif any(word in question_lower for word in ['trend', 'over time', 'monthly', 'growth']):
-        intent = "trend_analysis"
-        metrics = ["time_series_metrics"]
-        viz_type = "line"
-    else:
-        intent = "exploratory"
-        metrics = ["descriptive_statistics"]
-        viz_type = "bar"
+def format_analysis_prompt(question):
+    return PromptTemplate.from_template(ANALYSIS_TEMPLATE).format(question=question)
 
-    analysis = {
-        "intent": intent,
-        "data_focus": "customer_behavior",
-        "metrics": metrics,
-        "visualization_type": viz_type,
-        "analysis_depth": "detailed",
-        "assumptions": "Using available dataset columns for analysis",
-        "suggested_queries": [f"Analyze data related to: {question}"],
-        "business_context": "Understanding customer patterns for business optimization"
-    }
+def parse_analysis(question, response):
+    """Extract the JSON plan from an LLM response, caching it on success."""
+    start = response.find('{')
+    end = response.rfind('}') + 1
+    if start != -1 and end != 0:
+        analysis = json.dumps(json.loads(response[start:end]), indent=2)
+        llm_cache.cache.put("smart_analyzer", question, llm_cache.model_name(llm), analysis)
+        return analysis
+    # Fallback if JSON extraction fails
+    return create_fallback_analysis(question)
 
-    return json.dumps(analysis, indent=2)
\ No newline at end of file
+def create_fallback_analysis(question):
+    """Create a basic analysis when LLM parsing fails."""
+    return json.dumps(intent_classifier.classify(question), indent=2)
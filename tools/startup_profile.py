@@ -0,0 +1,136 @@
+"""Startup import profile and import-time budget for the Streamlit app.
+
+Everything app.py imports at module level runs before the first page
+renders, so those imports are kept light: heavy dependencies (pandas,
+matplotlib, LangChain, the OpenAI SDK, FAISS) and the dataset load happen on
+first use or in the warm-up thread. This module measures that and guards it:
+
+    python -m tools.startup_profile                 # report for app startup and the agent stack
+    python -m tools.startup_profile --check         # exit 1 if the app's imports break the budget
+
+Each measurement runs in a fresh interpreter with ``-X importtime``. The
+report lists each module-level import statement's wall time and peak
+resident memory growth, plus the slowest nested modules. ``--check`` fails
+when the app's own imports take longer than STARTUP_IMPORT_BUDGET_MS, or
+when they load any of HEAVY_MODULES. Streamlit itself is imported first and
+not counted, because the server has it loaded before the script runs.
+"""
+import argparse
+import ast
+import json
+import os
+import re
+import subprocess
+import sys
+
+BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "500"))
+HEAVY_MODULES = ["pandas", "matplotlib", "seaborn", "langchain", "langchain_core", "langchain_openai",
+                 "langchain_community", "openai", "faiss"]
+PRELOADED = ["streamlit"]
+AGENT_IMPORTS = ["import langchain_agent"]
+
+_PROBE = r"""
+import importlib, json, resource, sys, time
+for name in {preload!r}:
+    importlib.import_module(name)
+sys.stderr.write({marker!r} + "\n")
+sys.stderr.flush()
+rows = []
+for statement in {statements!r}:
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    started = time.perf_counter()
+    exec(statement, {{}})
+    rows.append({{"import": statement, "ms": round((time.perf_counter() - started) * 1000, 1),
+                  "rss_mb": round((resource.getrusage(resource.RUSAGE_SELF).ru_maxrss - rss) / 1024, 1)}})
+heavy = sorted({{m.split(".")[0] for m in sys.modules}} & set({heavy!r}))
+print(json.dumps({{"imports": rows, "heavy_loaded": heavy}}))
+"""
+
+_MARKER = "-- startup_profile: preloaded --"
+_IMPORTTIME = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def startup_imports(path="app.py"):
+    """The module-level import statements of a script, in order, minus PRELOADED packages."""
+    with open(path) as f:
+        source = f.read()
+    statements = []
+    for node in ast.parse(source).body:
+        if isinstance(node, ast.Import):
+            names = [alias.name for alias in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module:
+            names = [node.module]
+        else:
+            continue
+        if not all(name.split(".")[0] in PRELOADED for name in names):
+            statements.append(ast.get_source_segment(source, node))
+    return statements
+
+
+def profile(statements, preload=PRELOADED, cwd="."):
+    """Run import ``statements`` in a fresh interpreter; returns per-statement rows, nested timings and heavy modules."""
+    code = _PROBE.format(preload=list(preload), statements=list(statements), heavy=HEAVY_MODULES,
+                         marker=_MARKER)
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join(filter(None, [os.path.abspath(cwd),
+                                                                      os.environ.get("PYTHONPATH")])),
+           "WARMUP_DISABLED": "1"}
+    done = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=cwd, env=env,
+                          capture_output=True, text=True, check=True)
+    result = json.loads(done.stdout.strip().splitlines()[-1])
+
+    # -X importtime also reports the preloaded packages; keep only what was imported after them
+    measured = done.stderr.split(_MARKER, 1)[-1]
+    result["nested"] = [{"module": name, "self_ms": int(self_us) / 1000, "cumulative_ms": int(cumulative_us) / 1000,
+                         "depth": (len(indent) - 1) // 2}
+                        for self_us, cumulative_us, indent, name in _IMPORTTIME.findall(measured)]
+    result["total_ms"] = round(sum(row["ms"] for row in result["imports"]), 1)
+    return result
+
+
+def check(app="app.py", budget_ms=BUDGET_MS):
+    """``(ok, problems, profile)`` for the app's startup imports against the budget."""
+    result = profile(startup_imports(app), cwd=os.path.dirname(os.path.abspath(app)))
+    problems = []
+    if result["total_ms"] > budget_ms:
+        problems.append(f"startup imports took {result['total_ms']:.0f} ms (budget {budget_ms:.0f} ms)")
+    if result["heavy_loaded"]:
+        problems.append("startup imports load " + ", ".join(result["heavy_loaded"]) +
+                        "; import them lazily or from the warm-up thread")
+    return not problems, problems, result
+
+
+def print_report(title, result, top=15):
+    print(f"\n{title}: {result['total_ms']:.0f} ms")
+    print(f"  {'import':<72} {'ms':>8} {'RSS MB':>8}")
+    for row in result["imports"]:
+        print(f"  {row['import'][:72]:<72} {row['ms']:>8} {row['rss_mb']:>8}")
+    if result["heavy_loaded"]:
+        print("  heavy modules loaded: " + ", ".join(result["heavy_loaded"]))
+    print("  slowest nested imports (self time):")
+    for row in sorted(result["nested"], key=lambda r: -r["self_ms"])[:top]:
+        print(f"    {row['module']:<48} self {row['self_ms']:>8.1f} ms   cumulative {row['cumulative_ms']:>8.1f} ms")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Profile startup imports and enforce the import-time budget.")
+    parser.add_argument("--app", default="app.py")
+    parser.add_argument("--check", action="store_true", help="exit 1 when the app's imports exceed the budget")
+    parser.add_argument("--budget-ms", type=float, default=BUDGET_MS)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--json", action="store_true")
+    args = parser.parse_args()
+
+    ok, problems, startup = check(args.app, args.budget_ms)
+    if args.check:
+        print(json.dumps({"ok": ok, "problems": problems, "total_ms": startup["total_ms"]}) if args.json
+              else "\n".join(problems) or f"OK: startup imports took {startup['total_ms']:.0f} ms")
+        raise SystemExit(0 if ok else 1)
+
+    agent = profile(AGENT_IMPORTS, cwd=os.path.dirname(os.path.abspath(args.app)))
+    if args.json:
+        print(json.dumps({"startup": startup, "agent": agent, "budget_ms": args.budget_ms}, indent=2))
+    else:
+        print_report(f"App startup imports (budget {args.budget_ms:.0f} ms)", startup, args.top)
+        print_report("Agent stack (loaded by warm-up or the first question)", agent, args.top)
+        for problem in problems:
+            print("FAIL: " + problem)
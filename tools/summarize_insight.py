@@ -1,11 +1,12 @@
 
-from langchain_openai import ChatOpenAI
 from langchain.prompts import PromptTemplate
 from dotenv import load_dotenv
+from tools import llm_cache, llm_gateway, tracing
 
 load_dotenv()
 
-llm = ChatOpenAI(model="gpt-4o", temperature=0.1)
+# Shared pooled gateway: coalescing, rate limiting and retries (see tools/llm_gateway.py)
+llm = llm_gateway.gateway
 
 INSIGHT_TEMPLATE = """
 You are a senior fintech business analyst and data scientist. Analyze the following data and provide comprehensive business insights.
@@ -67,25 +68,53 @@ Provide:
 Focus on sustainable growth and risk mitigation.
 """
 
+@tracing.traced("summarize_insights")
 def generate_insights(data_analysis):
     """Generate comprehensive business insights from data analysis."""
-    analysis_lower = data_analysis.lower()
-
-    # Choose appropriate template based on analysis type
-    if 'comparison' in analysis_lower or 'vs' in analysis_lower or 'compare' in analysis_lower:
-        template = COMPARATIVE_TEMPLATE
-    elif 'trend' in analysis_lower or 'over time' in analysis_lower or 'monthly' in analysis_lower:
-        template = TREND_TEMPLATE
-    else:
-        template = INSIGHT_TEMPLATE
+    template, namespace = select_template(data_analysis)
+    model = llm_cache.model_name(llm)
+    # Insights depend on the exact numbers, so only the identical table may reuse one
+    cached = llm_cache.cache.get(namespace, data_analysis, model, exact=True)
+    if cached is not None:
+        return cached
 
     prompt = PromptTemplate.from_template(template)
     try:
         response = llm.predict(prompt.format(data_analysis=data_analysis))
+        llm_cache.cache.put(namespace, data_analysis, model, response, exact=True)
+        return response
+    except Exception as e:
+        return generate_fallback_insight(data_analysis)
+
+@tracing.traced("summarize_insights")
+async def agenerate_insights(data_analysis):
+    """Async variant of generate_insights; the LLM call does not block a thread."""
+    template, namespace = select_template(data_analysis)
+    model = llm_cache.model_name(llm)
+    # Insights depend on the exact numbers, so only the identical table may reuse one
+    cached = llm_cache.cache.get(namespace, data_analysis, model, exact=True)
+    if cached is not None:
+        return cached
+
+    prompt = PromptTemplate.from_template(template)
+    try:
+        response = await llm.apredict(prompt.format(data_analysis=data_analysis))
+        llm_cache.cache.put(namespace, data_analysis, model, response, exact=True)
         return response
     except Exception as e:
         return generate_fallback_insight(data_analysis)
 
+def select_template(data_analysis):
+    """Choose the prompt template (and its cache namespace) for the analysis type."""
+    analysis_lower = data_analysis.lower()
+
+    if 'comparison' in analysis_lower or 'vs' in analysis_lower or 'compare' in analysis_lower:
+        return COMPARATIVE_TEMPLATE, "summarize_insight:comparative"
+    elif 'trend' in analysis_lower or 'over time' in analysis_lower or 'monthly' in analysis_lower:
+        return TREND_TEMPLATE, "summarize_insight:trend"
+    else:
+        return INSIGHT_TEMPLATE, "summarize_insight:insight"
+
 def generate_fallback_insight(data_analysis):
     """Generate basic insights when LLM fails."""
     insights = []
@@ -0,0 +1,129 @@
+"""Synthetic fintech customer data at any scale, matching data/fintech_product_data.csv.
+
+Reproduces the source file's schema and the relationships measured in it:
+
+- 50% of customers completed KYC; a card is only activated after KYC (~67% of those).
+- Spend is zero without an activated card, otherwise uniform up to $3,000,
+  and transactions scale with spend (~2 per $100).
+- Revenue is 1-5% of spend, plus a flat $10 for Premium accounts.
+- Tiers are 60/30/10 Free/Plus/Premium; segments, card types and features are
+  uniform, and 30% of customers have no recorded feature.
+- Churned customers are exactly the Closed accounts (~15%). Churn runs
+  slightly higher without spend and on Premium, as in the source.
+- Accounts open over two years; features are first used between account
+  creation and the end of that window.
+
+Rows are produced in chunks, so the CSV for 50M rows is written in constant
+memory: ``python -m tools.synthetic_data 10m --out data/synthetic_10m.csv``.
+"""
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+SIZES = {"100k": 100_000, "1m": 1_000_000, "10m": 10_000_000, "50m": 50_000_000}
+CHUNK_ROWS = 1_000_000
+
+START_DATE = np.datetime64("2023-09-22")
+END_DATE = np.datetime64("2025-09-20")
+
+TIERS = np.array(["Free", "Plus", "Premium"])
+TIER_WEIGHTS = [0.597, 0.302, 0.101]
+SEGMENTS = np.array(["Professional", "Retired", "Student"])
+CARD_TYPES = np.array(["Credit", "Debit", "Virtual"])
+FEATURES = np.array(["DirectDeposit", "RoundUps", "SavingsVault", "CryptoRewards", "BillPay"])
+NO_FEATURE_RATE = 0.303
+KYC_RATE = 0.5
+CARD_ACTIVATION_RATE = 0.669  # among KYC-completed customers
+MAX_SPEND = 3000.0
+PREMIUM_FEE = 10.0
+SUSPENDED_RATE = 0.151
+CHURN_RATE = 0.147  # Closed accounts
+
+
+def parse_size(size):
+    """'1m' -> 1_000_000; plain integers pass through."""
+    return SIZES[size.lower()] if str(size).lower() in SIZES else int(size)
+
+
+def generate_chunk(n_rows, rng, first_id=1):
+    """One DataFrame chunk of ``n_rows`` customers with IDs starting at ``first_id``."""
+    kyc = rng.random(n_rows) < KYC_RATE
+    card_activated = kyc & (rng.random(n_rows) < CARD_ACTIVATION_RATE)
+    tier = TIERS[rng.choice(3, n_rows, p=TIER_WEIGHTS)]
+    premium = tier == "Premium"
+
+    spend = np.where(card_activated, np.round(rng.uniform(0, MAX_SPEND, n_rows), 2), 0.0)
+    transactions = rng.poisson(spend * rng.uniform(0.01, 0.03, n_rows))
+    revenue = np.round(spend * rng.uniform(0.01, 0.05, n_rows) + np.where(premium, PREMIUM_FEE, 0.0), 2)
+
+    churn_probability = np.where(card_activated, 0.140, 0.152) + np.where(premium, 0.015, 0.0)
+    churned = rng.random(n_rows) < churn_probability
+    status = np.where(churned, "Closed", np.where(rng.random(n_rows) < SUSPENDED_RATE / (1 - CHURN_RATE),
+                                                  "Suspended", "Active"))
+
+    window_days = int((END_DATE - START_DATE) / np.timedelta64(1, "D"))
+    created_offset = rng.integers(0, window_days + 1, n_rows)
+    created = START_DATE + created_offset.astype("timedelta64[D]")
+    used = created + (rng.random(n_rows) * (window_days - created_offset + 1)).astype("timedelta64[D]")
+
+    feature = FEATURES[rng.integers(0, len(FEATURES), n_rows)].astype(object)
+    feature[rng.random(n_rows) < NO_FEATURE_RATE] = np.nan
+
+    return pd.DataFrame({
+        "customer_id": np.arange(first_id, first_id + n_rows),
+        "account_created_at": created,
+        "account_status": status,
+        "kyc_completed": kyc,
+        "card_activated": card_activated,
+        "card_type": CARD_TYPES[rng.integers(0, len(CARD_TYPES), n_rows)],
+        "monthly_spend": spend,
+        "transactions_count": transactions,
+        "product_feature_used": feature,
+        "feature_used_at": used,
+        "account_tier": tier,
+        "decline_rate": np.round(rng.uniform(0.01, 0.15, n_rows), 2),
+        "customer_segment": SEGMENTS[rng.integers(0, len(SEGMENTS), n_rows)],
+        "monthly_revenue": revenue,
+        "churned": churned,
+    })
+
+
+def generate(n_rows, seed=0, chunk_rows=CHUNK_ROWS):
+    """Yield DataFrame chunks totalling ``n_rows`` rows; the same seed gives the same data."""
+    rng = np.random.default_rng(seed)
+    for first in range(0, n_rows, chunk_rows):
+        yield generate_chunk(min(chunk_rows, n_rows - first), rng, first_id=first + 1)
+
+
+def write_csv(path, n_rows, seed=0, chunk_rows=CHUNK_ROWS):
+    """Stream ``n_rows`` synthetic rows to a CSV with the source file's columns and date format."""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    with open(path, "w", newline="") as f:
+        for i, chunk in enumerate(generate(n_rows, seed, chunk_rows)):
+            chunk.to_csv(f, index=False, header=i == 0, date_format="%Y-%m-%d")
+    return path
+
+
+def dataset_path(size, seed=0, directory=".cache/synthetic"):
+    """Path of a cached synthetic dataset, generating it on first use."""
+    n_rows = parse_size(size)
+    path = os.path.join(directory, f"fintech_{n_rows}_s{seed}.csv")
+    if not os.path.exists(path):
+        write_csv(path + ".tmp", n_rows, seed)
+        os.replace(path + ".tmp", path)
+    return path
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("size", help="row count or one of: " + ", ".join(SIZES))
+    parser.add_argument("--out", help="output CSV (default: .cache/synthetic/fintech_<rows>_s<seed>.csv)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    if args.out:
+        print(write_csv(args.out, parse_size(args.size), args.seed))
+    else:
+        print(dataset_path(args.size, args.seed))
@@ -0,0 +1,192 @@
+"""Lightweight nested spans for every agent turn, written as JSONL.
+
+A span records wall time, CPU time, the process peak RSS (and how much it
+grew during the span) plus free-form attributes such as rows scanned,
+token counts and cache hits. CPU time comes two ways: ``thread_cpu_ms`` is
+the thread that opened the span only (work handed to the executors is not
+in it), ``process_cpu_ms`` is every thread, concurrent requests included. Spans nest through a context variable, so
+anything called inside a span (including work handed to the async
+executors) becomes its child. Each finished span is appended as one JSON
+line to TRACE_PATH.
+
+Use ``span(name, **attrs)`` as a context manager, ``traced(name)`` as a
+decorator, ``annotate``/``incr`` to attach data to the current span, and
+``latency_summary`` for per-stage percentiles.
+"""
+import functools
+import inspect
+import json
+import os
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+import numpy as np
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+TRACE_PATH = os.getenv("TRACE_PATH", ".cache/traces.jsonl")
+TRACE_MAX_BYTES = int(os.getenv("TRACE_MAX_BYTES", str(50 * 1024 * 1024)))
+ENABLED = os.getenv("TRACING_ENABLED", "1").lower() not in ("0", "false", "no")
+
+_current = ContextVar("tracing_current_span", default=None)
+_write_lock = threading.Lock()
+
+
+def _max_rss_kb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss if resource else 0
+
+
+class Span:
+    __slots__ = ("name", "trace_id", "span_id", "parent", "attrs", "start", "_wall", "_cpu", "_process_cpu", "_rss", "error")
+
+    def __init__(self, name, parent=None, **attrs):
+        self.name = name
+        self.parent = parent
+        self.trace_id = parent.trace_id if parent else uuid.uuid4().hex[:16]
+        self.span_id = uuid.uuid4().hex[:16]
+        self.attrs = attrs
+        self.start = time.time()
+        self._wall = time.perf_counter()
+        self._cpu = time.thread_time()
+        self._process_cpu = time.process_time()
+        self._rss = _max_rss_kb()
+        self.error = None
+
+    def set(self, **attrs):
+        self.attrs.update(attrs)
+
+    def incr(self, key, amount=1):
+        self.attrs[key] = self.attrs.get(key, 0) + amount
+
+    def finish(self):
+        rss = _max_rss_kb()
+        record = {
+            "trace_id": self.trace_id,
+            "span_id": self.span_id,
+            "parent_id": self.parent.span_id if self.parent else None,
+            "name": self.name,
+            "start": self.start,
+            "wall_ms": round((time.perf_counter() - self._wall) * 1000, 3),
+            "thread_cpu_ms": round((time.thread_time() - self._cpu) * 1000, 3),
+            "process_cpu_ms": round((time.process_time() - self._process_cpu) * 1000, 3),
+            "max_rss_kb": rss,
+            "rss_growth_kb": rss - self._rss,
+            "attrs": self.attrs,
+        }
+        if self.error:
+            record["error"] = self.error
+        _write(record)
+        return record
+
+
+def _write(record):
+    if not ENABLED:
+        return
+    line = json.dumps(record, default=str)
+    with _write_lock:
+        os.makedirs(os.path.dirname(TRACE_PATH) or ".", exist_ok=True)
+        if os.path.exists(TRACE_PATH) and os.path.getsize(TRACE_PATH) > TRACE_MAX_BYTES:
+            os.replace(TRACE_PATH, TRACE_PATH + ".1")
+        with open(TRACE_PATH, "a") as f:
+            f.write(line + "\n")
+
+
+def current_span():
+    return _current.get()
+
+
+def start_span(name, parent=None, **attrs):
+    """Open a span and make it current; pair with :func:`end_span` (for callback-driven spans)."""
+    span = Span(name, parent or _current.get(), **attrs)
+    _current.set(span)
+    return span
+
+
+def end_span(span, error=None):
+    """Finish a span opened with :func:`start_span` and restore its parent as current."""
+    if error is not None:
+        span.error = str(error)
+    _current.set(span.parent)
+    return span.finish()
+
+
+@contextmanager
+def span(name, **attrs):
+    s = Span(name, _current.get(), **attrs)
+    token = _current.set(s)
+    try:
+        yield s
+    except BaseException as e:
+        s.error = f"{type(e).__name__}: {e}"
+        raise
+    finally:
+        _current.reset(token)
+        s.finish()
+
+
+def traced(name=None):
+    """Decorator form of :func:`span` for sync and async functions."""
+    def decorate(func):
+        span_name = name or func.__qualname__
+        if inspect.iscoroutinefunction(func):
+            @functools.wraps(func)
+            async def async_wrapper(*args, **kwargs):
+                with span(span_name):
+                    return await func(*args, **kwargs)
+            return async_wrapper
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with span(span_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def annotate(**attrs):
+    """Attach attributes to the current span, if any."""
+    s = _current.get()
+    if s is not None:
+        s.set(**attrs)
+
+
+def incr(key, amount=1):
+    """Increment a counter attribute on the current span, if any."""
+    s = _current.get()
+    if s is not None:
+        s.incr(key, amount)
+
+
+def read_spans(path=TRACE_PATH, limit=5000):
+    """Return the last ``limit`` span records from a trace file."""
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        lines = f.readlines()[-limit:]
+    return [json.loads(line) for line in lines if line.strip()]
+
+
+def latency_summary(spans=None, limit=5000):
+    """Per-span-name latency percentiles: ``[{name, count, p50_ms, p95_ms, p99_ms, max_ms}, ...]``."""
+    spans = spans if spans is not None else read_spans(limit=limit)
+    by_name = {}
+    for record in spans:
+        by_name.setdefault(record["name"], []).append(record["wall_ms"])
+    summary = []
+    for name, values in by_name.items():
+        values = np.asarray(values)
+        summary.append({
+            "name": name,
+            "count": len(values),
+            "p50_ms": round(float(np.percentile(values, 50)), 1),
+            "p95_ms": round(float(np.percentile(values, 95)), 1),
+            "p99_ms": round(float(np.percentile(values, 99)), 1),
+            "max_ms": round(float(values.max()), 1),
+        })
+    return sorted(summary, key=lambda row: -row["p95_ms"])
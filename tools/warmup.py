@@ -0,0 +1,141 @@
+"""Background warm-up of popular analyses.
+
+After startup, and again whenever the dataset file changes, a low-priority
+daemon thread precomputes the glossary index, the churn-risk scores, the
+anomaly statistics, the canonical answers and their dashboards, and the
+Smart Analyzer plans for a list of popular questions, so the first users
+after a deploy or data refresh hit warm caches.
+
+The thread lowers its own OS scheduling priority where supported and pauses
+between tasks while live requests are running, so it never competes with
+interactive traffic.
+"""
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Only light modules are imported here: app.py imports this module at startup, and the
+# heavy tool modules are loaded by the warm-up thread itself (see warm()).
+from tools import async_runtime, canonical_questions, result_store
+
+logger = logging.getLogger(__name__)
+
+POPULAR_QUESTIONS_FILE = os.getenv("WARMUP_QUESTIONS_FILE", "")
+POLL_SECONDS = float(os.getenv("WARMUP_POLL_SECONDS", "60"))
+IDLE_WAIT_SECONDS = 0.5
+THREAD_NICENESS = 10
+
+_live_requests = 0
+_live_lock = threading.Lock()
+_started = False
+_start_lock = threading.Lock()
+_status = {"state": "idle", "data_version": None, "last_run": None, "tasks": {}}
+
+
+@contextmanager
+def live_request():
+    """Mark an interactive request as in flight; warm-up yields while any are running."""
+    global _live_requests
+    with _live_lock:
+        _live_requests += 1
+    try:
+        yield
+    finally:
+        with _live_lock:
+            _live_requests -= 1
+
+
+def _wait_until_idle():
+    while _live_requests > 0:
+        time.sleep(IDLE_WAIT_SECONDS)
+
+
+def popular_questions():
+    """Questions to precompute: WARMUP_QUESTIONS_FILE (JSON list) or the app's example buttons."""
+    if POPULAR_QUESTIONS_FILE and os.path.exists(POPULAR_QUESTIONS_FILE):
+        with open(POPULAR_QUESTIONS_FILE) as f:
+            return list(dict.fromkeys(json.load(f)))
+    return list(dict.fromkeys(canonical_questions.SIDEBAR_EXAMPLES + canonical_questions.EXAMPLE_QUESTIONS))
+
+
+def _warm_question(question):
+    # Dashboards render on the shared plotting thread and queries run on the CPU pool, like live
+    # requests (tools/async_runtime.py), so warm-up never touches pyplot alongside a user's chart
+    from tools import query_dataframe, smart_analyzer, summarize_insight
+    name, _ = canonical_questions.match(question)
+    if name is not None:
+        table, _ = async_runtime.run(async_runtime.run_blocking(
+            canonical_questions.run_analysis, name, publish=False, pool="plot"))
+        if canonical_questions.SUMMARIZE:
+            summarize_insight.generate_insights(table)
+        return
+    smart_analyzer.analyze_question(question)
+    async_runtime.run(query_dataframe.aquery_dataframe(question))
+
+
+def _load_agent():
+    # Imports LangChain, the OpenAI client, FAISS and matplotlib ahead of the first question
+    import langchain_agent
+
+
+def warm(questions=None):
+    """Run every warm-up task once; returns ``{task: seconds or error string}``."""
+    from tools import anomaly_detection, churn_model, glossary_lookup, query_dataframe
+    tasks = [("dataset", query_dataframe.backend), ("agent", _load_agent),
+             ("glossary_index", glossary_lookup.get_index), ("churn_scores", churn_model.get_index),
+             ("anomaly_stats", anomaly_detection.get_monitor)]
+    tasks += [(f"question: {q}", lambda q=q: _warm_question(q)) for q in (questions or popular_questions())]
+
+    results = {}
+    for name, task in tasks:
+        _wait_until_idle()
+        start = time.perf_counter()
+        try:
+            task()
+            results[name] = round(time.perf_counter() - start, 3)
+        except Exception as e:
+            logger.warning("warm-up task %r failed: %s", name, e)
+            results[name] = f"error: {e}"
+    return results
+
+
+def _run():
+    try:
+        os.setpriority(os.PRIO_PROCESS, threading.get_native_id(), THREAD_NICENESS)
+    except (AttributeError, OSError):
+        pass  # per-thread priority is Linux-only; idle gating still applies
+
+    # Results computed here belong to no user session
+    result_store.set_session("warmup")
+
+    from tools import generate_chart, llm_cache, query_dataframe
+    version = None
+    while True:
+        current = llm_cache.data_version()
+        if current != version:
+            if version is not None:
+                query_dataframe.reload_data()
+                generate_chart.reload_data()
+            _status.update(state="running", data_version=current)
+            _status["tasks"] = warm()
+            _status.update(state="idle", last_run=time.time())
+            result_store.clear()
+            version = current
+        time.sleep(POLL_SECONDS)
+
+
+def start():
+    """Start the warm-up thread once per process."""
+    global _started
+    with _start_lock:
+        if _started or os.getenv("WARMUP_DISABLED", "").lower() in ("1", "true", "yes"):
+            return
+        threading.Thread(target=_run, name="copilot-warmup", daemon=True).start()
+        _started = True
+
+
+def status():
+    return dict(_status)